@@ -0,0 +1,95 @@
+"""
+Benchmarks for the hot paths, run one with
+
+    python -m benchmarks.<name>
+
+They use whatever database the settings point at, so some of them expect
+data to have been imported first. The ones that generate their own data do
+it in a scratch test database instead (see scratch_database)
+"""
+
+import contextlib
+import os
+import statistics
+import time
+
+
+def setup():
+    """Configures Django, must be called before importing any models"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rundezvous_rundux.settings')
+
+    import django
+    django.setup()
+
+
+@contextlib.contextmanager
+def scratch_database():
+    """Runs the block against a fresh test database, destroyed afterwards"""
+    from django.db import connection
+
+    old_name = connection.creation.create_test_db(verbosity=0)
+
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def measure(func, args_list, count_queries=False):
+    """
+    Calls func once per args in args_list, returns timing stats in ms
+    With count_queries, also the mean and max number of queries per call
+    (recording them costs a little time, so the timings are a bit higher)
+    """
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    timings = []
+    queries = []
+
+    for args in args_list:
+        if count_queries:
+            context = CaptureQueriesContext(connection)
+        else:
+            context = contextlib.nullcontext()
+
+        with context:
+            started = time.perf_counter()
+            func(*args)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        if count_queries:
+            queries.append(len(context))
+
+    timings.sort()
+
+    stats = {
+        'calls': len(timings),
+        'mean': statistics.mean(timings),
+        'p50': percentile(timings, 0.50),
+        'p95': percentile(timings, 0.95),
+        'p99': percentile(timings, 0.99),
+    }
+
+    if count_queries:
+        stats['queries'] = statistics.mean(queries)
+        stats['max_queries'] = max(queries)
+
+    return stats
+
+
+def report(name, stats, file=None):
+    print(
+        f"{name:<40} "
+        f"mean {stats['mean']:9.3f}ms  "
+        f"p50 {stats['p50']:9.3f}ms  "
+        f"p95 {stats['p95']:9.3f}ms  "
+        f"p99 {stats['p99']:9.3f}ms" +
+        (f"  {stats['queries']:6.1f} queries" if 'queries' in stats else ''),
+        file=file,
+    )
@@ -0,0 +1,98 @@
+"""
+Excluding the users a regular has already met, for a user with 10k Reviews
+Compares the NOT IN subquery of SiteUser.unmet_users with the in-memory
+MetUsersCache the matchers use, plus the confirm_unmet query they still make
+for the candidates it lets through
+"""
+
+import benchmarks
+
+benchmarks.setup()
+
+from django.contrib.gis.geos import Point  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from rundezvous import matching  # noqa: E402
+from rundezvous import models  # noqa: E402
+
+MET = 10000
+CANDIDATES = 20  # Same as const.PARTNER_CANDIDATES
+CALLS = 200
+BATCH_SIZE = 5000
+
+
+def create_users(prefix, count):
+    now = timezone.now()
+
+    for start in range(0, count, BATCH_SIZE):
+        models.SiteUser.objects.bulk_create(
+            models.SiteUser(
+                username=f'{prefix}{i}',
+                email=f'{prefix}{i}@example.com',
+                location=Point(-117.17, 46.73),
+                location_updated_at=now,
+                status=models.SiteUser.Status.LOOKING,
+            )
+            for i in range(start, min(start + BATCH_SIZE, count))
+        )
+
+    return list(
+        models.SiteUser.objects
+        .filter(username__startswith=prefix)
+        .values_list('id', flat=True)
+    )
+
+
+def subquery_exclusion(regular, candidate_ids):
+    list(
+        regular.unmet_users
+        .filter(id__in=candidate_ids)
+        .values_list('id', flat=True)
+    )
+
+
+def cached_exclusion(regular, candidate_ids):
+    """What find_rundezvous_partner does: the cache, then confirm_unmet"""
+    matching.confirm_unmet([
+        (regular.id, user_id) for user_id in candidate_ids
+        if not matching.met_users.has_met(regular.id, user_id)
+    ])
+
+
+def main():
+    with benchmarks.scratch_database():
+        regular = models.SiteUser.objects.create(
+            username='regular',
+            email='regular@example.com',
+        )
+
+        met_ids = create_users('met', MET)
+        candidate_ids = create_users('new', CANDIDATES) + met_ids[:CANDIDATES]
+
+        for start in range(0, MET, BATCH_SIZE):
+            models.Review.objects.bulk_create(
+                models.Review(reviewer=regular, reviewed_id=user_id)
+                for user_id in met_ids[start:start + BATCH_SIZE]
+            )
+
+        args = [(regular, candidate_ids)] * CALLS
+
+        print(f"{MET} met users, {len(candidate_ids)} candidates per call")
+        benchmarks.report(
+            'unmet_users (NOT IN subquery)',
+            benchmarks.measure(subquery_exclusion, args),
+        )
+
+        matching.met_users.clear()
+        benchmarks.report(
+            'MetUsersCache + confirm (cold)',
+            benchmarks.measure(cached_exclusion, args[:1]),
+        )
+        benchmarks.report(
+            'MetUsersCache + confirm (warm)',
+            benchmarks.measure(cached_exclusion, args),
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+"""
+The request-path hot spots against a synthetic population, at several sizes
+
+    python -m benchmarks.population --sizes 1000 10000 --output before.json
+
+A seeded RNG lays out a Country split into States, with cities of Zipf-ish
+sizes, Landmarks around each city and users scattered around them, so two
+runs with the same seed see the same data. The results are JSON (timings in
+ms, plus queries per call) to compare runs before and after a change
+"""
+
+import argparse
+import json
+import random
+import sys
+
+import benchmarks
+
+benchmarks.setup()
+
+from django.contrib.gis.geos import Point, Polygon, MultiPolygon  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from places import geocoding  # noqa: E402
+from places import landmarks  # noqa: E402
+from places import models as place_models  # noqa: E402
+
+from rundezvous import compatibility  # noqa: E402
+from rundezvous import locations  # noqa: E402
+from rundezvous import matching  # noqa: E402
+from rundezvous import models  # noqa: E402
+from rundezvous import views  # noqa: E402
+
+SEED = 1337
+SIZES = [1000, 10000]
+CALLS = 200
+BATCH_SIZE = 5000
+
+# Roughly the contiguous United States, split into a grid of States
+COUNTRY_BBOX = (-124.0, 25.0, -67.0, 49.0)
+STATE_GRID = (6, 4)
+
+CITIES = 40
+CITY_RADIUS_DEGREES = 0.08  # Standard deviation of users around a city
+LANDMARKS_PER_CITY = 30
+MESSAGES_PER_ROOM = 20
+
+
+def create_regions(rng):
+    """A Country and its grid of States, with Landmarks around the cities"""
+    min_x, min_y, max_x, max_y = COUNTRY_BBOX
+    columns, rows = STATE_GRID
+    width, height = (max_x - min_x) / columns, (max_y - min_y) / rows
+
+    country = place_models.Country.objects.create(
+        name='Synthetic Federation',
+        region=MultiPolygon(Polygon.from_bbox(COUNTRY_BBOX)),
+    )
+
+    for column in range(columns):
+        for row in range(rows):
+            x, y = min_x + column * width, min_y + row * height
+
+            place_models.State.objects.create(
+                name=f'State {column}-{row}',
+                region=MultiPolygon(Polygon.from_bbox((x, y, x + width, y + height))),
+                country=country,
+            )
+
+    # Zipf: the nth biggest city gets 1/n of the biggest one's people
+    cities = [
+        (rng.uniform(min_x, max_x), rng.uniform(min_y, max_y), 1 / rank)
+        for rank in range(1, CITIES + 1)
+    ]
+
+    geocoding.reverse_geocoder.clear()  # bulk_create skips the signals
+
+    place_models.Landmark.objects.bulk_create(
+        place_models.Landmark(
+            name=f'Landmark {i}',
+            location=Point(lon, lat),
+            state_id=geocoding.reverse_geocoder.lookup(lon, lat)[1],
+        )
+        for i, (lon, lat) in enumerate(
+            around(rng, city, CITY_RADIUS_DEGREES / 2)
+            for city in cities for _ in range(LANDMARKS_PER_CITY)
+        )
+    )
+
+    return cities
+
+
+def around(rng, city, radius):
+    """A point normally distributed around city, kept inside the Country"""
+    lon, lat, _ = city
+    min_x, min_y, max_x, max_y = COUNTRY_BBOX
+
+    return (
+        min(max(rng.gauss(lon, radius), min_x), max_x),
+        min(max(rng.gauss(lat, radius), min_y), max_y),
+    )
+
+
+def create_users(rng, cities, count):
+    """count LOOKING users, each in a city picked by population"""
+    now = timezone.now()
+    weights = [population for _, _, population in cities]
+    genders = list(compatibility.GENDER_BITS)
+
+    models.SiteUser.objects.all().delete()
+
+    for start in range(0, count, BATCH_SIZE):
+        users = []
+
+        for i in range(start, min(start + BATCH_SIZE, count)):
+            lon, lat = around(rng, rng.choices(cities, weights)[0], CITY_RADIUS_DEGREES)
+            gender = rng.choice(genders)
+
+            users.append(models.SiteUser(
+                username=f'user{i}',
+                email=f'user{i}@example.com',
+                gender=gender,
+                match_profile=compatibility.profile_mask(gender),
+                match_preferences=compatibility.preferences_mask(),
+                location=Point(lon, lat),
+                location_updated_at=now,
+                state_id=geocoding.reverse_geocoder.lookup(lon, lat)[1],
+                status=models.SiteUser.Status.LOOKING,
+            ))
+
+        models.SiteUser.objects.bulk_create(users)
+
+    return list(models.SiteUser.objects.order_by('id'))
+
+
+def create_rundezvouses(rng, users, count):
+    """Pairs up users of the same State, each pair with a chat going"""
+    by_state = {}
+    for user in users:
+        by_state.setdefault(user.state_id, []).append(user)
+
+    pairs = [
+        pair for state_users in by_state.values()
+        for pair in zip(state_users[::2], state_users[1::2])
+    ]
+
+    rundezvouses = []
+    for pair in rng.sample(pairs, min(count, len(pairs))):
+        rundezvous = models.Rundezvous.create_for_users(pair)
+
+        models.ChatMessage.objects.bulk_create(
+            models.ChatMessage(room=rundezvous, text=f'Message {i}', sent_by=pair[i % 2])
+            for i in range(MESSAGES_PER_ROOM)
+        )
+
+        rundezvouses.append((rundezvous, pair))
+
+    return rundezvouses
+
+
+def reset_caches():
+    """Every size starts cold, as after a deploy"""
+    geocoding.reverse_geocoder.clear()
+    landmarks.landmark_index.clear()
+    matching.looking_users.clear()
+    matching.met_users.clear()
+
+
+def update_location(user, lon, lat):
+    user.update_location(Point(lon, lat, srid=4326))
+
+
+def find_rundezvous_partner(user):
+    """Nobody meetable nearby is common in the small cities, it's a miss"""
+    try:
+        user.find_rundezvous_partner()
+    except models.SiteUser.DoesNotExist:
+        return False
+    return True
+
+
+def get_for_point(point):
+    try:
+        place_models.State.objects.get_for_point(point)
+    except place_models.State.DoesNotExist:
+        return False
+    return True
+
+
+def new_messages(request):
+    views.new_messages(request, 0)
+
+
+def run(rng, cities, size, calls):
+    users = create_users(rng, cities, size)
+    reset_caches()
+
+    sample = rng.sample(users, min(calls, len(users)))
+    results = {}
+
+    def measure(name, func, args_list, hits=False):
+        """With hits, func returns whether it found something, those are counted"""
+        found = []
+
+        def call(*args):
+            found.append(func(*args))
+
+        stats = benchmarks.measure(call, args_list, count_queries=True)
+        if hits:
+            stats['hits'] = found.count(True)
+            stats['misses'] = found.count(False)
+
+        benchmarks.report(f'{size:>7} {name}', stats, file=sys.stderr)
+        results[name] = stats
+
+    measure('update_location', update_location, [
+        (user, user.longitude + rng.gauss(0, 0.001), user.latitude + rng.gauss(0, 0.001))
+        for user in sample
+    ])
+    locations.location_buffer.flush()
+
+    measure('find_rundezvous_partner', find_rundezvous_partner, [
+        (user,) for user in sample
+    ], hits=True)
+
+    min_x, min_y, max_x, max_y = COUNTRY_BBOX
+    measure('get_for_point', get_for_point, [
+        (Point(rng.uniform(min_x, max_x), rng.uniform(min_y, max_y), srid=4326),)
+        for _ in range(calls)
+    ], hits=True)
+
+    rundezvouses = create_rundezvouses(rng, users, calls)
+
+    measure('start_meetup', models.Rundezvous.start_meetup, [
+        (rundezvous,) for rundezvous, _ in rundezvouses
+    ])
+
+    measure('check_rundezvous_arrived', models.SiteUser.check_rundezvous_arrived, [
+        (user, rundezvous) for rundezvous, pair in rundezvouses
+        if rundezvous.landmark_id is not None
+        for user in pair
+    ])
+
+    factory = RequestFactory()
+    requests = []
+    for _, pair in rundezvouses:
+        request = factory.get('/', {'format': 'json'})
+        request.user = models.SiteUser.objects \
+            .select_related('active_rundezvous') \
+            .get(id=pair[0].id)
+        requests.append((request,))
+
+    measure('new_messages', new_messages, requests)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--calls', type=int, default=CALLS)
+    parser.add_argument('--output', type=argparse.FileType('w'), default=sys.stdout)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = {'seed': args.seed, 'calls': args.calls, 'sizes': {}}
+
+    with benchmarks.scratch_database():
+        cities = create_regions(rng)
+
+        for size in args.sizes:
+            results['sizes'][size] = run(rng, cities, size, args.calls)
+
+    json.dump(results, args.output, indent=2)
+    args.output.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Point to State lookups against the imported Natural Earth regions
+Run `python manage.py import_countries` first
+"""
+
+import random
+
+import benchmarks
+
+benchmarks.setup()
+
+from django.contrib.gis.geos import Point  # noqa: E402
+
+from places import geocoding  # noqa: E402
+from places import models  # noqa: E402
+
+SEED = 1337
+POINTS = 500
+
+
+def random_points(country, count):
+    """Points spread over the Country's bounding box, some land outside"""
+    rng = random.Random(SEED)
+
+    min_x, min_y, max_x, max_y = country.bbox
+
+    return [
+        (Point(rng.uniform(min_x, max_x), rng.uniform(min_y, max_y), srid=4326),)
+        for _ in range(count)
+    ]
+
+
+def full_resolution_lookup(point):
+    try:
+        models.State.objects.get(region__intersects=point)
+    except models.State.DoesNotExist:
+        pass
+
+
+def simplified_lookup(point):
+    try:
+        models.State.objects.get_for_point(point)
+    except models.State.DoesNotExist:
+        pass
+
+
+def main():
+    country = models.Country.objects.get(name='United States of America')
+    points = random_points(country, POINTS)
+
+    print(f"{POINTS} random points over {country}, "
+          f"{country.states.count()} states")
+
+    benchmarks.report(
+        'region__intersects (full resolution)',
+        benchmarks.measure(full_resolution_lookup, points),
+    )
+    benchmarks.report(
+        'get_for_point (bbox + simplified)',
+        benchmarks.measure(simplified_lookup, points),
+    )
+
+    # No cache, so every lookup has to test the regions
+    geocoder = geocoding.ReverseGeocoder(cache_size=0)
+    geocoder.lookup(0.0, 0.0)  # Loads the regions
+
+    benchmarks.report(
+        'ReverseGeocoder (in process, uncached)',
+        benchmarks.measure(geocoder.get_state_id, points),
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Ranking the partners of a LOOKING user, and pairing up everybody at once
+Compares the ORM path (Distance annotation and order_by, one query per user)
+with the NumPy CandidateSet at 1k, 10k and 100k users in one State
+"""
+
+import random
+
+import benchmarks
+
+benchmarks.setup()
+
+from django.contrib.gis.geos import Point  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from places import const as place_const  # noqa: E402
+
+from rundezvous import const  # noqa: E402
+from rundezvous import matching  # noqa: E402
+from rundezvous import models  # noqa: E402
+from rundezvous import scoring  # noqa: E402
+
+SEED = 1337
+SIZES = (1000, 10000, 100000)
+SEARCHES = 100
+TOP_K = const.PARTNER_CANDIDATES
+BATCH_SIZE = 10000
+
+# Roughly the Palouse, a few thousand km² so users have neighbours
+BOUNDS = (-117.6, 46.4, -116.8, 47.0)
+
+
+def grow_users(rng, start, stop):
+    min_x, min_y, max_x, max_y = BOUNDS
+    now = timezone.now()
+
+    for batch_start in range(start, stop, BATCH_SIZE):
+        models.SiteUser.objects.bulk_create(
+            models.SiteUser(
+                username=f'user{i}',
+                email=f'user{i}@example.com',
+                location=Point(
+                    rng.uniform(min_x, max_x),
+                    rng.uniform(min_y, max_y),
+                    srid=place_const.DEFAULT_SRID,
+                ),
+                location_updated_at=now,
+                status=models.SiteUser.Status.LOOKING,
+            )
+            for i in range(batch_start, min(batch_start + BATCH_SIZE, stop))
+        )
+
+
+def orm_search(user, scorer):
+    list(user.get_meetable_users_within(const.MEETUP_DISTANCE_THRESHOLD)[:TOP_K])
+
+
+def vectorized_search(user, scorer):
+    scorer.nearest(
+        user.longitude,
+        user.latitude,
+        TOP_K,
+        const.MEETUP_DISTANCE_THRESHOLD.m,
+        exclude={user.id},
+        profile=user.match_profile,
+        preferences=user.match_preferences,
+    )
+
+
+def load_users():
+    return list(
+        models.SiteUser.objects
+        .filter(status=models.SiteUser.Status.LOOKING)
+        .values_list(*matching.INDEXED_FIELDS)
+    )
+
+
+def main():
+    rng = random.Random(SEED)
+
+    with benchmarks.scratch_database():
+        size = 0
+
+        for target in SIZES:
+            grow_users(rng, size, target)
+            size = target
+
+            users = load_users()
+            searchers = rng.sample(
+                list(models.SiteUser.objects.all()[:SEARCHES * 10]),
+                SEARCHES,
+            )
+            scorer = scoring.CandidateSet.from_users(users)
+
+            print(f"{size} looking users")
+            benchmarks.report(
+                'load + CandidateSet.from_users',
+                benchmarks.measure(
+                    lambda: scoring.CandidateSet.from_users(load_users()),
+                    [()],
+                ),
+            )
+            benchmarks.report(
+                'get_meetable_users_within (ORM)',
+                benchmarks.measure(orm_search, [(u, scorer) for u in searchers]),
+            )
+            benchmarks.report(
+                'CandidateSet.nearest (NumPy)',
+                benchmarks.measure(vectorized_search, [(u, scorer) for u in searchers]),
+            )
+            benchmarks.report(
+                'pair_users, whole State (NumPy)',
+                benchmarks.measure(
+                    matching.pair_users,
+                    [(users, set(), const.MEETUP_DISTANCE_THRESHOLD.m)],
+                ),
+            )
+
+
+if __name__ == '__main__':
+    main()
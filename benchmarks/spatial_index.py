@@ -0,0 +1,97 @@
+"""
+Users within meetup distance of a point as the SiteUser table grows
+With the spatial index prefilter the time should stay flat, the plain
+distance lookup has to scan the whole table
+"""
+
+import random
+
+import benchmarks
+
+benchmarks.setup()
+
+from django.contrib.gis.geos import Point  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from places import const as place_const  # noqa: E402
+
+from rundezvous import const  # noqa: E402
+from rundezvous import models  # noqa: E402
+
+SEED = 1337
+SIZES = (10000, 100000, 1000000)
+QUERIES = 200
+SCAN_QUERIES = 10  # The full scans get slow, fewer of them is enough
+BATCH_SIZE = 10000
+
+# Roughly Washington State, dense enough that searches find somebody
+BOUNDS = (-124.0, 45.6, -117.0, 49.0)
+
+
+def random_point(rng):
+    min_x, min_y, max_x, max_y = BOUNDS
+
+    return Point(
+        rng.uniform(min_x, max_x),
+        rng.uniform(min_y, max_y),
+        srid=place_const.DEFAULT_SRID,
+    )
+
+
+def grow_users(rng, start, stop):
+    now = timezone.now()
+
+    for batch_start in range(start, stop, BATCH_SIZE):
+        models.SiteUser.objects.bulk_create(
+            models.SiteUser(
+                username=f'user{i}',
+                email=f'user{i}@example.com',
+                location=random_point(rng),
+                location_updated_at=now,
+                status=models.SiteUser.Status.LOOKING,
+            )
+            for i in range(batch_start, min(batch_start + BATCH_SIZE, stop))
+        )
+
+
+def indexed_lookup(point):
+    list(
+        models.SiteUser.objects
+        .filter_by_within(point, const.MEETUP_DISTANCE_THRESHOLD)
+        .values_list('id', flat=True)
+    )
+
+
+def scan_lookup(point):
+    list(
+        models.SiteUser.objects
+        .filter(location__distance_lte=(point, const.MEETUP_DISTANCE_THRESHOLD))
+        .values_list('id', flat=True)
+    )
+
+
+def main():
+    rng = random.Random(SEED)
+
+    with benchmarks.scratch_database():
+        size = 0
+
+        for target in SIZES:
+            grow_users(rng, size, target)
+            size = target
+
+            points = [(random_point(rng),) for _ in range(QUERIES)]
+
+            print(f"{size} users")
+            benchmarks.report(
+                'filter_by_within (spatial index)',
+                benchmarks.measure(indexed_lookup, points),
+            )
+            benchmarks.report(
+                'location__distance_lte (full scan)',
+                benchmarks.measure(scan_lookup, points[:SCAN_QUERIES]),
+            )
+
+
+if __name__ == '__main__':
+    main()
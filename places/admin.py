@@ -3,12 +3,23 @@ from django.contrib.gis import admin
 from places import models
 
 
+class RegionAdmin(admin.GeoModelAdmin):
+    """Derived regions are recalculated on save, so they can't be edited"""
+    exclude = ('coarse_region', 'simplified_region')
+    readonly_fields = (
+        'min_longitude',
+        'min_latitude',
+        'max_longitude',
+        'max_latitude',
+    )
+
+
 @admin.register(models.Country)
-class CountryAdmin(admin.GeoModelAdmin):
+class CountryAdmin(RegionAdmin):
     class StateInline(admin.TabularInline):
         model = models.State
 
-        exclude = ('region',)
+        exclude = ('region',) + models.State.derived_fields
 
         extra = 0
 
@@ -16,7 +27,7 @@ class CountryAdmin(admin.GeoModelAdmin):
 
 
 @admin.register(models.State)
-class StateAdmin(admin.GeoModelAdmin):
+class StateAdmin(RegionAdmin):
     model = models.State
 
 
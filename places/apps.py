@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class PlacesConfig(AppConfig):
     name = 'places'
+
+    def ready(self):
+        from places import signals  # noqa: F401 (connects receivers)
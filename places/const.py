@@ -6,3 +6,23 @@ DEFAULT_PROJECTION_SRID = 3857
 SUPPORTED_COUNTRIES = {
     'United States of America',
 }
+
+# Mean radius of the Earth, used for quick great-circle distances in memory
+EARTH_RADIUS_M = 6371008.8
+
+# Reverse geocoding caches results per cell of this many degrees on a side
+GEOCODER_CELL_DEGREES = 0.01
+GEOCODER_CACHE_SIZE = 100000
+
+# Tolerances (in degrees) of the simplified copies kept of every region
+# A point further than this from a simplified border is on the same side of
+# the full resolution border, so only points near borders need the full one
+COARSE_REGION_TOLERANCE = 0.05
+SIMPLIFIED_REGION_TOLERANCE = 0.005
+
+# How many of the closest Landmarks are considered for a meetup
+LANDMARK_CANDIDATES = 5
+# Radius of the first spatial index search for the closest Landmarks, grown
+# fourfold until enough are found or it passes the maximum
+LANDMARK_SEARCH_METERS = 2000
+LANDMARK_SEARCH_MAX_METERS = 512000
@@ -0,0 +1,35 @@
+"""
+Lightweight spherical math for hot paths that can't afford a GEOS/PROJ call
+Everything here works on plain floats in degrees (srid=4326)
+"""
+
+import math
+
+from places import const
+
+
+def haversine(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
+    """Great-circle distance between two points in meters"""
+    lon1, lat1, lon2, lat2 = map(math.radians, (lon1, lat1, lon2, lat2))
+
+    a = math.sin((lat2 - lat1) / 2) ** 2 + \
+        math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+
+    return 2 * const.EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def bbox_around(lon: float, lat: float, meters: float):
+    """
+    Returns (min_lon, min_lat, max_lon, max_lat) of a box that contains every
+    point within meters of (lon, lat)
+    """
+    dlat = math.degrees(meters / const.EARTH_RADIUS_M)
+
+    # Degrees of longitude shrink towards the poles, so widen the box there
+    cos_lat = math.cos(math.radians(min(abs(lat) + dlat, 90.0)))
+    if cos_lat < 1e-6:
+        dlon = 180.0
+    else:
+        dlon = min(dlat / cos_lat, 180.0)
+
+    return lon - dlon, lat - dlat, lon + dlon, lat + dlat
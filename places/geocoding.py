@@ -0,0 +1,308 @@
+"""
+In-process reverse geocoding of points into Countries and States
+Regions are loaded once, so a lookup never has to run a spatial query
+"""
+
+import math
+import threading
+
+from collections import OrderedDict
+
+from django.contrib.gis.geos import Point, Polygon
+
+from places import const
+
+BORDER_ZONE_PADDING = 1.01
+
+
+class BoxTree:
+    """
+    Static R-tree of bounding boxes, packed with Sort-Tile-Recursive
+    Items are (bbox, value) where bbox is (min_x, min_y, max_x, max_y)
+    """
+    def __init__(self, items, node_size=8):
+        self.node_size = node_size
+
+        # A node is (bbox, children, is_leaf), leaves hold the items
+        level = [(bbox, value, True) for bbox, value in items]
+        while len(level) > 1:
+            level = self._pack(level)
+
+        self.root = level[0] if level else None
+
+    def _pack(self, nodes):
+        """Groups nodes into parents, neighbours together"""
+        def center(node, axis):
+            bbox = node[0]
+            return bbox[axis] + bbox[axis + 2]
+
+        parent_count = math.ceil(len(nodes) / self.node_size)
+        slab_size = self.node_size * math.ceil(math.sqrt(parent_count))
+
+        nodes = sorted(nodes, key=lambda node: center(node, 0))
+
+        parents = []
+        for i in range(0, len(nodes), slab_size):
+            slab = sorted(nodes[i:i + slab_size], key=lambda node: center(node, 1))
+
+            for j in range(0, len(slab), self.node_size):
+                children = slab[j:j + self.node_size]
+                parents.append((self._union(children), children, False))
+
+        return parents
+
+    @staticmethod
+    def _union(nodes):
+        return (
+            min(node[0][0] for node in nodes),
+            min(node[0][1] for node in nodes),
+            max(node[0][2] for node in nodes),
+            max(node[0][3] for node in nodes),
+        )
+
+    def search(self, bbox):
+        """Yields the values of every item whose bbox intersects bbox"""
+        if self.root is None:
+            return
+
+        min_x, min_y, max_x, max_y = bbox
+
+        stack = [self.root]
+        while stack:
+            (node_min_x, node_min_y, node_max_x, node_max_y), children, is_leaf = \
+                stack.pop()
+
+            if node_min_x > max_x or node_max_x < min_x or \
+                    node_min_y > max_y or node_max_y < min_y:
+                continue
+
+            if is_leaf:
+                yield children
+            else:
+                stack.extend(children)
+
+    def query(self, x, y):
+        """Yields the values of every item whose bbox contains (x, y)"""
+        return self.search((x, y, x, y))
+
+
+def border_zone(simplified, tolerance):
+    """
+    Prepared area within tolerance of simplified's border, None if there's
+    no tolerance (simplified is the real thing)
+    Anything outside it is on the same side of the full resolution border as
+    of the simplified one, and prepared it's an indexed test, unlike distance
+    """
+    if not tolerance:
+        return None
+
+    # Padded, since the buffer's arcs are approximated by inscribed segments
+    return simplified.boundary.buffer(tolerance * BORDER_ZONE_PADDING).prepared
+
+
+class BorderZones:
+    """
+    Prepared copies and border zones of saved regions' simplified copies,
+    so Region.covers_point doesn't rebuild them for every fetched instance
+    Must be cleared when regions change, like the ReverseGeocoder
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._zones = {}  # (model label, id, tolerance) -> (prepared, border)
+
+    def get(self, region, simplified, tolerance):
+        """Returns (prepared simplified, its border_zone)"""
+        key = (region._meta.label, region.pk, tolerance)
+
+        zones = self._zones.get(key)
+        if zones is None:
+            zones = simplified.prepared, border_zone(simplified, tolerance)
+
+            if region.pk is not None:  # Unsaved regions may still change
+                with self._lock:
+                    self._zones[key] = zones
+
+        return zones
+
+    def clear(self):
+        with self._lock:
+            self._zones.clear()
+
+
+class GeocodedRegion:
+    """
+    A Country or State held at its simplified resolution, the full region is
+    only fetched the first time a point lands too close to its border
+    """
+    def __init__(self, model, region_id, simplified, tolerance):
+        self.model = model
+        self.id = region_id
+
+        self._full = None
+        if simplified is None:  # Nothing derived yet, so use the real thing
+            simplified = self._load_full()
+            tolerance = 0.0
+            self._full = simplified.prepared
+
+        self.tolerance = tolerance
+        self.prepared = simplified.prepared
+        self.border = border_zone(simplified, tolerance)
+
+        # Padded since the full region may stick out past the simplified one
+        min_x, min_y, max_x, max_y = simplified.extent
+        self.bbox = (
+            min_x - tolerance,
+            min_y - tolerance,
+            max_x + tolerance,
+            max_y + tolerance,
+        )
+
+    def _load_full(self):
+        return self.model.objects \
+            .values_list('region', flat=True) \
+            .get(id=self.id)
+
+    @property
+    def full(self):
+        if self._full is None:
+            self._full = self._load_full().prepared
+        return self._full
+
+    def near_border(self, geometry) -> bool:
+        return self.border is not None and self.border.intersects(geometry)
+
+    def intersects(self, point) -> bool:
+        if self.near_border(point):
+            return self.full.intersects(point)
+        return self.prepared.intersects(point)
+
+    def contains(self, polygon) -> bool:
+        """Conservative, may be False for polygons right against the border"""
+        return not self.near_border(polygon) and self.prepared.contains(polygon)
+
+
+class ReverseGeocoder:
+    """
+    Finds the Country, then the State, containing a point
+    Candidates come from an R-tree of bounding boxes and are confirmed with
+    GEOS prepared geometries, results are cached per quantized cell
+    """
+    def __init__(self,
+                 cell_degrees=const.GEOCODER_CELL_DEGREES,
+                 cache_size=const.GEOCODER_CACHE_SIZE):
+        self.cell_degrees = cell_degrees
+        self.cache_size = cache_size
+
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # cell -> (country_id, state_id)
+        # (BoxTree of countries, {country_id: BoxTree of states})
+        self._regions = None
+
+    def clear(self):
+        """Forgets all regions, they'll be reloaded on the next lookup"""
+        with self._lock:
+            self._cache.clear()
+            self._regions = None
+
+    def _load(self):
+        from places.models import Country, State
+
+        tolerance = const.SIMPLIFIED_REGION_TOLERANCE
+
+        countries = BoxTree(
+            (region.bbox, region) for region in (
+                GeocodedRegion(Country, country_id, simplified, tolerance)
+                for country_id, simplified in
+                Country.objects.values_list('id', 'simplified_region')
+            )
+        )
+
+        states_by_country = {}
+        for state_id, country_id, simplified in \
+                State.objects.values_list('id', 'country_id', 'simplified_region'):
+            region = GeocodedRegion(State, state_id, simplified, tolerance)
+            states_by_country.setdefault(country_id, []).append(
+                (region.bbox, region)
+            )
+
+        states = {
+            country_id: BoxTree(items)
+            for country_id, items in states_by_country.items()
+        }
+
+        with self._lock:
+            self._regions = countries, states
+
+        return countries, states
+
+    def _find(self, tree, point):
+        """Returns the first GeocodedRegion intersecting point"""
+        for region in tree.query(point.x, point.y):
+            if region.intersects(point):
+                return region
+
+        return None
+
+    def _cell(self, lon, lat):
+        return (
+            math.floor(lon / self.cell_degrees),
+            math.floor(lat / self.cell_degrees),
+        )
+
+    def _cell_bbox(self, cell):
+        x, y = cell
+        return (
+            x * self.cell_degrees,
+            y * self.cell_degrees,
+            (x + 1) * self.cell_degrees,
+            (y + 1) * self.cell_degrees,
+        )
+
+    def lookup(self, lon: float, lat: float):
+        """Returns (country_id, state_id), either may be None"""
+        cell = self._cell(lon, lat)
+
+        with self._lock:
+            try:
+                self._cache.move_to_end(cell)
+                return self._cache[cell]
+            except KeyError:
+                pass
+
+        countries, states = self._regions or self._load()
+
+        point = Point(lon, lat, srid=const.DEFAULT_SRID)
+
+        country = self._find(countries, point)
+        state = None
+        if country is not None and country.id in states:
+            state = self._find(states[country.id], point)
+
+        country_id = country.id if country is not None else None
+        state_id = state.id if state is not None else None
+
+        # Only cache when the answer holds for every point in the cell
+        cell_bbox = self._cell_bbox(cell)
+        if state is not None:
+            cacheable = state.contains(Polygon.from_bbox(cell_bbox))
+        else:
+            cacheable = next(countries.search(cell_bbox), None) is None
+
+        if cacheable:
+            with self._lock:
+                self._cache[cell] = (country_id, state_id)
+
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return country_id, state_id
+
+    def get_state_id(self, point: Point):
+        return self.lookup(point.x, point.y)[1]
+
+    def get_country_id(self, point: Point):
+        return self.lookup(point.x, point.y)[0]
+
+
+reverse_geocoder = ReverseGeocoder()
+border_zones = BorderZones()
@@ -0,0 +1,140 @@
+"""
+In-memory nearest-neighbour index of Landmarks, one KD-tree per State
+Trees are built the first time a State is searched and thrown away whenever
+one of its Landmarks changes
+"""
+
+import heapq
+import math
+import threading
+
+from places import const
+
+
+class KDTree:
+    """2-d tree of (x, y, value), nodes are (x, y, value, axis, left, right)"""
+    def __init__(self, points):
+        self.root = self._build(list(points), axis=0)
+
+    def _build(self, points, axis):
+        if not points:
+            return None
+
+        points.sort(key=lambda point: point[axis])
+        median = len(points) // 2
+        x, y, value = points[median]
+
+        return (
+            x, y, value, axis,
+            self._build(points[:median], 1 - axis),
+            self._build(points[median + 1:], 1 - axis),
+        )
+
+    def nearest(self, x, y, k=1):
+        """Returns [(distance, value)] of the k closest points, closest first"""
+        best = []  # Max-heap of (-distance², tiebreak, value)
+
+        def visit(node):
+            if node is None:
+                return
+
+            node_x, node_y, value, axis, left, right = node
+
+            distance = (node_x - x) ** 2 + (node_y - y) ** 2
+            if len(best) < k:
+                heapq.heappush(best, (-distance, id(node), value))
+            elif distance < -best[0][0]:
+                heapq.heapreplace(best, (-distance, id(node), value))
+
+            delta = (x, y)[axis] - (node_x, node_y)[axis]
+            near, far = (left, right) if delta < 0 else (right, left)
+
+            visit(near)
+            if len(best) < k or delta ** 2 < -best[0][0]:
+                visit(far)
+
+        visit(self.root)
+
+        return [
+            (math.sqrt(-distance), value)
+            for distance, _, value in sorted(best, reverse=True)
+        ]
+
+
+class StateLandmarks:
+    """
+    A State's Landmarks projected onto a local equirectangular plane in meters,
+    accurate enough at State scale to rank them by distance
+    """
+    def __init__(self, landmarks):
+        landmarks = list(landmarks)  # [(landmark_id, location)]
+
+        if landmarks:
+            latitude = sum(location.y for _, location in landmarks) / len(landmarks)
+        else:
+            latitude = 0.0
+        self.cos_latitude = math.cos(math.radians(latitude))
+
+        self.tree = KDTree(
+            (*self.project(location.x, location.y), landmark_id)
+            for landmark_id, location in landmarks
+        )
+
+    def project(self, lon, lat):
+        return (
+            const.EARTH_RADIUS_M * math.radians(lon) * self.cos_latitude,
+            const.EARTH_RADIUS_M * math.radians(lat),
+        )
+
+    def nearest(self, point, k=1):
+        return self.tree.nearest(*self.project(point.x, point.y), k=k)
+
+
+class LandmarkIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states = {}  # state_id -> StateLandmarks
+        self._landmark_states = {}  # landmark_id -> state_id, for moves
+
+    def _build(self, state_id):
+        from places.models import Landmark
+
+        landmarks = list(
+            Landmark.objects
+            .filter(state_id=state_id)
+            .values_list('id', 'location')
+        )
+        state_landmarks = StateLandmarks(landmarks)
+
+        with self._lock:
+            self._states[state_id] = state_landmarks
+            for landmark_id, _ in landmarks:
+                self._landmark_states[landmark_id] = state_id
+
+        return state_landmarks
+
+    def nearest(self, state_id, point, k=1):
+        """Returns [(distance, landmark_id)] of the k closest in the State"""
+        state_landmarks = self._states.get(state_id) or self._build(state_id)
+
+        return state_landmarks.nearest(point, k=k)
+
+    def invalidate(self, state_id):
+        with self._lock:
+            self._states.pop(state_id, None)
+
+    def invalidate_landmark(self, landmark_id, state_id):
+        """Drops the trees of the State the Landmark is in, and was in"""
+        with self._lock:
+            old_state_id = self._landmark_states.pop(landmark_id, state_id)
+
+            self._states.pop(old_state_id, None)
+            self._states.pop(state_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._states.clear()
+            self._landmark_states.clear()
+
+
+landmark_index = LandmarkIndex()
@@ -1,42 +1,75 @@
 """
 https://docs.djangoproject.com/en/2.2/ref/contrib/gis/tutorial/#importing-spatial-countries
-"""
 
-from collections import defaultdict
+Features are streamed out of the shapefiles, turned into model instances
+(optionally by a pool of worker processes, simplifying regions is most of the
+work) and written with bulk_create in batches, all in one transaction
+"""
 
+import contextlib
+import functools
+import itertools
+import multiprocessing
 import os
 
-from django.core.management.base import BaseCommand
+import django
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
 
-from django.contrib.gis.geos import fromstr, Polygon, MultiPolygon
+from django.contrib.gis.geos import GEOSGeometry, Polygon, MultiPolygon
 from django.contrib.gis.gdal import DataSource
 
 import places
 from places import models
 from places import const
+from places import geocoding
 
-countries_ds = DataSource(
-    os.path.abspath(
-        os.path.join(
-            os.path.dirname(places.__file__),
-            'data',
-            'ne_10m_admin_0_countries',
-            'ne_10m_admin_0_countries.shp',
-        )
-    )
-)
+DATA_DIR = os.path.join(os.path.dirname(places.__file__), 'data')
 
-states_ds = DataSource(
-    os.path.abspath(
-        os.path.join(
-            os.path.dirname(places.__file__),
-            'data',
-            'ne_10m_admin_1_states_provinces',
-            'ne_10m_admin_1_states_provinces.shp',
-        )
-    )
+COUNTRIES_PATH = os.path.join(
+    DATA_DIR,
+    'ne_10m_admin_0_countries',
+    'ne_10m_admin_0_countries.shp',
+)
+STATES_PATH = os.path.join(
+    DATA_DIR,
+    'ne_10m_admin_1_states_provinces',
+    'ne_10m_admin_1_states_provinces.shp',
 )
 
+# Features each worker process may be handed ahead of the writer
+WORKER_WINDOW = 16
+
+
+def read_features(path, key_field, keys):
+    """
+    Yields (key, name, wkb) of every feature whose key_field is in keys
+    The shapefile is only opened once this is iterated
+    """
+    data_source = DataSource(path)
+
+    for feature in data_source[0]:  # Shapefiles only have one layer
+        key = feature.get(key_field)
+
+        if key in keys:
+            yield key, feature.get('name'), bytes(feature.geom.wkb)
+
+
+def build_instance(model_name, feature):
+    """Turns a feature into an unsaved instance, runs in the worker processes"""
+    key, name, wkb = feature
+
+    region = GEOSGeometry(memoryview(wkb), srid=const.DEFAULT_SRID)
+    if isinstance(region, Polygon):
+        region = MultiPolygon(region, srid=const.DEFAULT_SRID)
+
+    instance = apps.get_model('places', model_name)(name=name, region=region)
+    instance.update_derived_regions()  # bulk_create won't call save
+
+    return key, instance
+
 
 class Command(BaseCommand):
     help = 'Imports the Shapefiles into Countries and States'
@@ -47,44 +80,105 @@ class Command(BaseCommand):
             action='store_true',
             help='Delete all existing States and Countries to make room',
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=0,
+            help='Processes to build regions in (default: none, in process)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Rows per INSERT',
+        )
 
-    def handle(self, *args, **options):
-        if 'delete' in options:
-            models.Country.objects.all().delete()
-            models.State.objects.all().delete()
+    @contextlib.contextmanager
+    def mapper(self, workers):
+        """Yields a map function, parallel when there are workers"""
+        if not workers:
+            yield map
+            return
 
-        countries = {
-            feature.get('name'): feature
-            for feature in countries_ds[0]  # Shapefiles only have one layer
-            if feature.get('name') in const.SUPPORTED_COUNTRIES
-        }
+        connections.close_all()  # Don't share them with the forked workers
 
-        states = defaultdict(list)
+        def bounded_imap(func, items):
+            """pool.imap reads all of items ahead, so feed it a window at a time"""
+            items = iter(items)
 
-        for feature in states_ds[0]:
-            country = feature.get('admin')
-            if country in countries:
-                states[country].append(feature)
+            while True:
+                window = list(itertools.islice(items, workers * WORKER_WINDOW))
+                if not window:
+                    return
 
-        for country_name, country_feature in countries.items():
-            country_geo = fromstr(country_feature.geom.wkt)
+                yield from pool.imap(func, window, chunksize=4)
 
-            if isinstance(country_geo, Polygon):
-                country_geo = MultiPolygon(country_geo)
+        with multiprocessing.Pool(workers, initializer=django.setup) as pool:
+            yield bounded_imap
 
-            country = models.Country.objects.create(
-                name=country_name,
-                region=country_geo,
-            )
+    def write(self, model, instances, batch_size):
+        """bulk_creates instances in batches, reporting progress"""
+        name = model._meta.verbose_name_plural
+        batch = []
+        written = 0
 
-            for state_feature in states[country_name]:
-                state_geo = fromstr(state_feature.geom.wkt)
+        for instance in instances:
+            batch.append(instance)
 
-                if isinstance(state_geo, Polygon):
-                    state_geo = MultiPolygon(state_geo)
+            if len(batch) == batch_size:
+                model.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
 
-                state = models.State.objects.create(
-                    country=country,
-                    name=state_feature.get('name'),
-                    region=state_geo,
+                self.stdout.write(f"{written} {name}...")
+
+        model.objects.bulk_create(batch)
+        written += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Imported {written} {name}"))
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        with self.mapper(options['workers']) as map_, transaction.atomic():
+            if options['delete']:
+                models.State.objects.all().delete()
+                models.Country.objects.all().delete()
+            elif models.Country.objects.exists() or models.State.objects.exists():
+                # Importing twice would duplicate every region
+                raise CommandError(
+                    "Countries or States already exist, use --delete to "
+                    "replace them"
                 )
+
+            countries = map_(
+                functools.partial(build_instance, 'Country'),
+                read_features(COUNTRIES_PATH, 'name', const.SUPPORTED_COUNTRIES),
+            )
+            self.write(
+                models.Country,
+                (country for _, country in countries),
+                batch_size,
+            )
+
+            # bulk_create doesn't set primary keys on every backend
+            country_ids = dict(
+                models.Country.objects
+                .filter(name__in=const.SUPPORTED_COUNTRIES)
+                .values_list('name', 'id')
+            )
+
+            def with_country(states):
+                for country_name, state in states:
+                    state.country_id = country_ids[country_name]
+                    yield state
+
+            states = map_(
+                functools.partial(build_instance, 'State'),
+                read_features(STATES_PATH, 'admin', country_ids),
+            )
+            self.write(models.State, with_country(states), batch_size)
+
+        # Signals don't fire for bulk_create
+        geocoding.reverse_geocoder.clear()
+        geocoding.border_zones.clear()
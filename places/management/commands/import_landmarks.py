@@ -0,0 +1,239 @@
+"""
+Imports Landmarks from CSV, GeoJSON text sequences (one Feature per line),
+or anything else GDAL can read, e.g. shapefiles and GeoJSON
+
+Rows are streamed through generators and written with bulk_create, a batch
+per transaction, so memory use doesn't grow with the file. States come from
+the in-process reverse geocoder instead of a spatial query per row
+"""
+
+import csv
+import itertools
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from django.contrib.gis.geos import Point
+from django.contrib.gis.gdal import DataSource, GDALException
+
+from places import models
+from places import const
+from places import geocoding
+from places import landmarks
+
+CSV_EXTENSIONS = {'.csv'}
+GEOJSONSEQ_EXTENSIONS = {'.geojsonl', '.geojsons', '.geojsonseq', '.ndjson'}
+
+# Coordinates are compared at this many decimal places when deduplicating
+DEDUP_DIGITS = 7
+
+
+def read_csv(path, name_field, lon_field, lat_field):
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            yield row.get(name_field), row.get(lon_field), row.get(lat_field)
+
+
+def read_geojsonseq(path, name_field):
+    with open(path) as f:
+        for line in f:
+            line = line.strip().lstrip('\x1e')  # RFC 8142 record separators
+            if not line:
+                continue
+
+            try:
+                feature = json.loads(line)
+                lon, lat = feature['geometry']['coordinates'][:2]
+                name = feature['properties'].get(name_field)
+            except (ValueError, KeyError, TypeError):
+                yield None, None, None  # Counted as invalid
+                continue
+
+            yield name, lon, lat
+
+
+def read_ogr(path, name_field):
+    try:
+        data_source = DataSource(path)
+    except GDALException as e:
+        raise CommandError(str(e))
+
+    for layer in data_source:
+        for feature in layer:
+            try:
+                geom = feature.geom
+                if geom.srid is not None and geom.srid != const.DEFAULT_SRID:
+                    geom.transform(const.DEFAULT_SRID)
+
+                point = geom if geom.geom_type == 'Point' else geom.centroid
+            except GDALException:  # No geometry, or one that can't be used
+                yield feature.get(name_field), None, None  # Counted as invalid
+                continue
+
+            yield feature.get(name_field), point.x, point.y
+
+
+def clean(rows):
+    """Yields Landmarks, or None in place of rows that can't be one"""
+    max_length = models.Landmark._meta.get_field('name').max_length
+
+    for name, lon, lat in rows:
+        try:
+            lon, lat = float(lon), float(lat)
+        except (TypeError, ValueError):
+            yield None
+            continue
+
+        name = (name or '').strip()[:max_length]
+        if not name or not (-180 <= lon <= 180 and -90 <= lat <= 90):
+            yield None
+            continue
+
+        yield models.Landmark(
+            name=name,
+            location=Point(lon, lat, srid=const.DEFAULT_SRID),
+            state_id=geocoding.reverse_geocoder.lookup(lon, lat)[1],
+        )
+
+
+def dedup_key(name, location):
+    return (
+        name,
+        round(location.x, DEDUP_DIGITS),
+        round(location.y, DEDUP_DIGITS),
+    )
+
+
+def deduplicate(batch):
+    """
+    Drops Landmarks already in the database, or earlier in the batch
+    Earlier batches are committed by now, so they're caught by the query
+    """
+    min_x = min(landmark.location.x for landmark in batch)
+    min_y = min(landmark.location.y for landmark in batch)
+    max_x = max(landmark.location.x for landmark in batch)
+    max_y = max(landmark.location.y for landmark in batch)
+
+    seen = {
+        dedup_key(name, location) for name, location in
+        models.Landmark.objects
+        .filter_by_bbox('location', (min_x, min_y, max_x, max_y))
+        .filter(name__in={landmark.name for landmark in batch})
+        .values_list('name', 'location')
+    }
+
+    unique = []
+    for landmark in batch:
+        key = dedup_key(landmark.name, landmark.location)
+
+        if key not in seen:
+            seen.add(key)
+            unique.append(landmark)
+
+    return unique
+
+
+class Command(BaseCommand):
+    help = 'Imports Landmarks from a CSV, GeoJSON or shapefile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--name-field',
+            default='name',
+            help='Column or property holding the name (default: name)',
+        )
+        parser.add_argument(
+            '--lon-field',
+            default='longitude',
+            help='CSV column holding the longitude (default: longitude)',
+        )
+        parser.add_argument(
+            '--lat-field',
+            default='latitude',
+            help='CSV column holding the latitude (default: latitude)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows per INSERT and transaction',
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Skip the rows committed by an earlier, interrupted import',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Where progress is recorded (default: PATH.checkpoint)',
+        )
+
+    def read(self, path, options):
+        extension = os.path.splitext(path)[1].lower()
+
+        if extension in CSV_EXTENSIONS:
+            return read_csv(
+                path,
+                options['name_field'],
+                options['lon_field'],
+                options['lat_field'],
+            )
+        if extension in GEOJSONSEQ_EXTENSIONS:
+            return read_geojsonseq(path, options['name_field'])
+        return read_ogr(path, options['name_field'])
+
+    def handle(self, *args, **options):
+        path = options['path']
+        checkpoint = options['checkpoint'] or f"{path}.checkpoint"
+        batch_size = options['batch_size']
+
+        if not os.path.exists(path):
+            raise CommandError(f"{path} does not exist")
+
+        done = 0  # Input rows committed so far
+        if options['resume'] and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                done = int(f.read())
+            self.stdout.write(f"Resuming after row {done}")
+
+        rows = itertools.islice(self.read(path, options), done, None)
+        rows = clean(rows)
+
+        imported = invalid = duplicates = 0
+        try:
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
+
+                valid = [landmark for landmark in batch if landmark is not None]
+                invalid += len(batch) - len(valid)
+
+                # The checkpoint is written after the commit, a batch that
+                # gets replayed is dropped by deduplicate
+                with transaction.atomic():
+                    unique = deduplicate(valid) if valid else []
+                    models.Landmark.objects.bulk_create(unique)
+
+                imported += len(unique)
+                duplicates += len(valid) - len(unique)
+                done += len(batch)
+
+                with open(checkpoint, 'w') as f:
+                    f.write(str(done))
+
+                self.stdout.write(f"{done} rows, {imported} Landmarks...")
+        finally:
+            # Signals don't fire for bulk_create
+            landmarks.landmark_index.clear()
+
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {imported} Landmarks "
+            f"({duplicates} duplicates and {invalid} invalid rows skipped)"
+        ))
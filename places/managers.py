@@ -1,22 +1,141 @@
 from django.contrib.gis.db import models
+from django.db import connections
+from django.db.models.expressions import RawSQL
 
+from django.contrib.gis.geos import Polygon
+from django.contrib.gis.measure import D
 from django.contrib.gis.db.models.functions import Distance
 
+from places import const
+from places import geo
+from places import landmarks
 
-class LandmarkSet(models.QuerySet):
-    def order_by_closest_to(self, point):
+
+class SpatialIndexQuerySet(models.QuerySet):
+    """
+    SpatiaLite keeps an R*Tree for every geometry column with spatial_index
+    (the default), but never consults it by itself: distance and intersects
+    lookups scan the whole table unless they're narrowed down through its
+    SpatialIndex virtual table first
+    """
+    @property
+    def uses_spatialite(self):
+        return getattr(connections[self.db].ops, 'spatialite', False)
+
+    def filter_by_bbox(self, field_name, bbox):
+        """Rows whose field's bounding box overlaps bbox, using the index"""
+        field = self.model._meta.get_field(field_name)
+
+        if self.uses_spatialite:
+            return self.filter(pk__in=RawSQL(
+                'SELECT ROWID FROM SpatialIndex '
+                'WHERE f_table_name = %s AND f_geometry_column = %s '
+                'AND search_frame = BuildMbr(%s, %s, %s, %s, %s)',
+                (self.model._meta.db_table, field.column, *bbox, field.srid),
+            ))
+
+        # PostGIS and MySQL use their own index for this operator
+        frame = Polygon.from_bbox(bbox)
+        frame.srid = field.srid
+        return self.filter(**{f'{field_name}__bboverlaps': frame})
+
+    def filter_by_within(self, field_name, point, meters):
+        """Same as field__distance_lte=(point, meters), prefiltered by bbox"""
         return self \
+            .filter_by_bbox(field_name, geo.bbox_around(point.x, point.y, meters)) \
+            .filter(**{f'{field_name}__distance_lte': (point, D(m=meters))})
+
+
+class LandmarkSet(SpatialIndexQuerySet):
+    def order_by_closest_to(self, point, within=None):
+        """within (meters) lets the spatial index skip everything further"""
+        landmarks = self
+
+        if within is not None:
+            landmarks = landmarks.filter_by_within('location', point, within)
+
+        return landmarks \
             .annotate(distance=Distance('location', point)) \
             .order_by('distance')
 
+    def closest_to(self, point, k):
+        """
+        The k closest Landmarks, searching a growing radius so only the
+        neighbourhood of point is ever sorted
+        """
+        meters = const.LANDMARK_SEARCH_METERS
+
+        while meters <= const.LANDMARK_SEARCH_MAX_METERS:
+            closest = list(self.order_by_closest_to(point, within=meters)[:k])
+
+            if len(closest) == k:
+                return closest
+            meters *= 4
+
+        return list(self.order_by_closest_to(point)[:k])  # Sparse, sort all
+
 
 class LandmarkManager(models.Manager.from_queryset(LandmarkSet)):
-    pass
+    def closest_candidates(self, state, point, k=const.LANDMARK_CANDIDATES):
+        """
+        Returns up to k Landmarks in state (selected along), closest to point first
+        Answered by the in-memory index, order_by_closest_to is the fallback
+        """
+        state_id = state.id if state is not None else None
+
+        ids = [
+            landmark_id for _, landmark_id in
+            landmarks.landmark_index.nearest(state_id, point, k=k)
+        ]
+        found = self.select_related('state').in_bulk(ids)
+
+        candidates = [found[landmark_id] for landmark_id in ids if landmark_id in found]
+        if len(candidates) < len(ids):  # Index is stale, let the DB decide
+            landmarks.landmark_index.invalidate(state_id)
+            candidates = self \
+                .select_related('state') \
+                .filter(state=state) \
+                .closest_to(point, k)
+
+        return candidates
 
 
-class GeoQuerySet(models.QuerySet):
+class GeoQuerySet(SpatialIndexQuerySet):
+    def filter_by_bbox_containing(self, point):
+        if self.uses_spatialite:  # The R*Tree beats four B-tree ranges
+            return self.filter_by_bbox('region', (point.x, point.y) * 2)
+
+        return self.filter(
+            min_longitude__lte=point.x,
+            max_longitude__gte=point.x,
+            min_latitude__lte=point.y,
+            max_latitude__gte=point.y,
+        )
+
     def get_for_point(self, point):
-        return self.get(region__intersects=point)
+        """
+        Same as get(region__intersects=point), but candidates are narrowed
+        down by bounding box and tested against simplified regions, the full
+        region is only loaded for points close to a border
+        """
+        candidates = self.filter_by_bbox_containing(point).defer('region')
+
+        matches = [
+            candidate for candidate in candidates
+            if candidate.covers_point(point)
+        ]
+
+        if not matches:
+            raise self.model.DoesNotExist(
+                f"No {self.model._meta.object_name} contains {point}"
+            )
+        if len(matches) > 1:
+            raise self.model.MultipleObjectsReturned(
+                f"{len(matches)} {self.model._meta.verbose_name_plural} "
+                f"contain {point}"
+            )
+
+        return matches[0]
 
 
 class CountryManager(models.Manager.from_queryset(GeoQuerySet)):
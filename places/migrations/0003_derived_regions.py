@@ -0,0 +1,108 @@
+# Generated by Django 2.2 on 2026-10-18 10:20
+
+import django.contrib.gis.db.models.fields
+from django.contrib.gis.geos import MultiPolygon, Polygon
+from django.db import migrations, models
+
+from places import const
+
+
+def simplify(region, tolerance):
+    simplified = region.simplify(tolerance, preserve_topology=True)
+
+    if isinstance(simplified, Polygon):
+        simplified = MultiPolygon(simplified, srid=region.srid)
+
+    return simplified
+
+
+def derive_regions(apps, schema_editor):
+    for model_name in ('Country', 'State'):
+        model = apps.get_model('places', model_name)
+
+        for instance in model.objects.all():
+            instance.min_longitude, instance.min_latitude, \
+                instance.max_longitude, instance.max_latitude = \
+                instance.region.extent
+
+            instance.coarse_region = simplify(
+                instance.region,
+                const.COARSE_REGION_TOLERANCE,
+            )
+            instance.simplified_region = simplify(
+                instance.region,
+                const.SIMPLIFIED_REGION_TOLERANCE,
+            )
+
+            instance.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('places', '0002_auto_20190616_1913'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='country',
+            name='coarse_region',
+            field=django.contrib.gis.db.models.fields.MultiPolygonField(blank=True, null=True, srid=4326),
+        ),
+        migrations.AddField(
+            model_name='country',
+            name='max_latitude',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='country',
+            name='max_longitude',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='country',
+            name='min_latitude',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='country',
+            name='min_longitude',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='country',
+            name='simplified_region',
+            field=django.contrib.gis.db.models.fields.MultiPolygonField(blank=True, null=True, srid=4326),
+        ),
+        migrations.AddField(
+            model_name='state',
+            name='coarse_region',
+            field=django.contrib.gis.db.models.fields.MultiPolygonField(blank=True, null=True, srid=4326),
+        ),
+        migrations.AddField(
+            model_name='state',
+            name='max_latitude',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='state',
+            name='max_longitude',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='state',
+            name='min_latitude',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='state',
+            name='min_longitude',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='state',
+            name='simplified_region',
+            field=django.contrib.gis.db.models.fields.MultiPolygonField(blank=True, null=True, srid=4326),
+        ),
+        migrations.RunPython(derive_regions, migrations.RunPython.noop),
+    ]
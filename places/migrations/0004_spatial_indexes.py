@@ -0,0 +1,43 @@
+# Generated by Django 2.2 on 2026-10-18 11:02
+
+from django.db import migrations
+
+SPATIAL_COLUMNS = (
+    ('places_country', 'region'),
+    ('places_state', 'region'),
+    ('places_landmark', 'location'),
+)
+
+
+def create_spatial_indexes(apps, schema_editor):
+    """
+    The queries now go through these R*Trees, make sure databases that were
+    created without them (or had them dropped) get them
+    """
+    connection = schema_editor.connection
+
+    if not getattr(connection.ops, 'spatialite', False):
+        return  # Every other backend creates its own with the column
+
+    with connection.cursor() as cursor:
+        for table, column in SPATIAL_COLUMNS:
+            cursor.execute(
+                'SELECT spatial_index_enabled FROM geometry_columns '
+                'WHERE f_table_name = %s AND f_geometry_column = %s',
+                [table, column],
+            )
+            row = cursor.fetchone()
+
+            if row is not None and not row[0]:
+                cursor.execute('SELECT CreateSpatialIndex(%s, %s)', [table, column])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('places', '0003_derived_regions'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_spatial_indexes, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,113 @@
 from django.contrib.gis.db import models
+from django.contrib.gis.geos import MultiPolygon, Polygon
 
 from places import managers
 from places import const
+from places import geocoding
 
 
-class Country(models.Model):
+class Region(models.Model):
+    """
+    An area stored at full resolution, plus a bounding box and simplified
+    copies that points can be tested against much more cheaply
+    """
+    class Meta:
+        abstract = True
+
+    region = models.MultiPolygonField(srid=const.DEFAULT_SRID)
+
+    # Derived from region on save, see update_derived_regions
+    coarse_region = models.MultiPolygonField(
+        srid=const.DEFAULT_SRID,
+        null=True,
+        blank=True,
+    )
+    simplified_region = models.MultiPolygonField(
+        srid=const.DEFAULT_SRID,
+        null=True,
+        blank=True,
+    )
+
+    min_longitude = models.FloatField(null=True, blank=True, db_index=True)
+    min_latitude = models.FloatField(null=True, blank=True, db_index=True)
+    max_longitude = models.FloatField(null=True, blank=True, db_index=True)
+    max_latitude = models.FloatField(null=True, blank=True, db_index=True)
+
+    derived_fields = (
+        'coarse_region',
+        'simplified_region',
+        'min_longitude',
+        'min_latitude',
+        'max_longitude',
+        'max_latitude',
+    )
+
+    @property
+    def bbox(self):
+        return (
+            self.min_longitude,
+            self.min_latitude,
+            self.max_longitude,
+            self.max_latitude,
+        )
+
+    @staticmethod
+    def simplify(region, tolerance) -> MultiPolygon:
+        simplified = region.simplify(tolerance, preserve_topology=True)
+
+        if isinstance(simplified, Polygon):
+            simplified = MultiPolygon(simplified, srid=region.srid)
+
+        return simplified
+
+    def update_derived_regions(self):
+        """Must be called after region changes if save() is bypassed"""
+        self.min_longitude, self.min_latitude, \
+            self.max_longitude, self.max_latitude = self.region.extent
+
+        self.coarse_region = self.simplify(
+            self.region,
+            const.COARSE_REGION_TOLERANCE,
+        )
+        self.simplified_region = self.simplify(
+            self.region,
+            const.SIMPLIFIED_REGION_TOLERANCE,
+        )
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+
+        if update_fields is None or 'region' in update_fields:
+            self.update_derived_regions()
+
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, *self.derived_fields}
+
+        super().save(*args, **kwargs)
+
+    def simplified_regions(self):
+        """Yields (simplified, tolerance), coarsest first"""
+        if self.coarse_region is not None:
+            yield self.coarse_region, const.COARSE_REGION_TOLERANCE
+        if self.simplified_region is not None:
+            yield self.simplified_region, const.SIMPLIFIED_REGION_TOLERANCE
+
+    def covers_point(self, point) -> bool:
+        """
+        Same as region.intersects(point), but a simplified copy decides unless
+        point is within its tolerance of the border
+        region is only loaded (if deferred) when it's needed
+        """
+        for simplified, tolerance in self.simplified_regions():
+            prepared, border = geocoding.border_zones.get(self, simplified, tolerance)
+
+            if not border.intersects(point):
+                return prepared.intersects(point)
+
+        return self.region.intersects(point)
+
+
+class Country(Region):
     class Meta:
         verbose_name_plural = 'countries'
 
@@ -12,8 +115,6 @@ class Country(models.Model):
 
     name = models.CharField(max_length=50, unique=True)
 
-    region = models.MultiPolygonField(srid=const.DEFAULT_SRID)
-
     # The SRID used to calculate distance between locations in this region
     projection_srid = models.IntegerField(default=const.DEFAULT_PROJECTION_SRID)
 
@@ -21,7 +122,7 @@ class Country(models.Model):
         return self.name
 
 
-class State(models.Model):
+class State(Region):
     class Meta:
         unique_together = ('country', 'name')
 
@@ -35,8 +136,6 @@ class State(models.Model):
 
     name = models.CharField(max_length=50)
 
-    region = models.MultiPolygonField(srid=const.DEFAULT_SRID)
-
     # The SRID used to calculate distance between locations in this region
     # Falls back on the one used by Country if not defined
     _projection_srid = models.IntegerField(
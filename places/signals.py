@@ -0,0 +1,21 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from places import models
+from places import geocoding
+from places import landmarks
+
+
+@receiver(post_save, sender=models.Country)
+@receiver(post_save, sender=models.State)
+@receiver(post_delete, sender=models.Country)
+@receiver(post_delete, sender=models.State)
+def reload_regions(sender, instance, **kwargs):
+    geocoding.reverse_geocoder.clear()
+    geocoding.border_zones.clear()
+
+
+@receiver(post_save, sender=models.Landmark)
+@receiver(post_delete, sender=models.Landmark)
+def reindex_landmark(sender, instance, **kwargs):
+    landmarks.landmark_index.invalidate_landmark(instance.id, instance.state_id)
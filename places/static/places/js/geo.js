@@ -19,3 +19,37 @@ function update_location(url) {
     }
     setTimeout(() => update_location(url), timeout);
 }
+
+function upload_trajectory(url) {
+    // Samples every position fix but only uploads them in batches
+    const timeout = 15000;  // 15 seconds
+    let samples = [];
+
+    if (!navigator.geolocation) {
+        console.log("GPS not available");
+        return;
+    }
+
+    navigator.geolocation.watchPosition(function(position) {
+        samples.push([
+            position.timestamp / 1000,
+            position.coords.latitude,
+            position.coords.longitude
+        ]);
+    });
+
+    function upload() {
+        if (samples.length > 0) {
+            const batch = samples;
+            samples = [];
+
+            $.post({
+                url: url,
+                contentType: 'application/json',
+                data: JSON.stringify({samples: batch})
+            });
+        }
+        setTimeout(upload, timeout);
+    }
+    setTimeout(upload, 1000);  // Report the first fix quickly
+}
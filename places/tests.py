@@ -1,9 +1,16 @@
+import os
+import tempfile
+
+from io import StringIO
+
 from django.test import TestCase
-from django.core.management import call_command
+from django.core.management import call_command, CommandError
 
 from django.contrib.gis.geos import Point, Polygon, MultiPolygon
 
 from places import models
+from places import geocoding
+from places import landmarks
 
 
 class TestCountryModel(TestCase):
@@ -91,6 +98,225 @@ class TestStateModel(TestCase):
 
         self.assertEqual(self.state.projection_srid, 404)
 
+    def test_derived_regions_are_saved(self):
+        state = models.State.objects.get(id=self.state.id)
+
+        self.assertEqual(state.bbox, (10.0, 10.0, 40.0, 40.0))
+        self.assertIsNotNone(state.coarse_region)
+        self.assertIsNotNone(state.simplified_region)
+
+    def test_point_near_border(self):
+        inside = Point(39.9999, 25.0)
+        outside = Point(40.0001, 25.0)
+
+        self.assertEqual(models.State.objects.get_for_point(inside), self.state)
+        with self.assertRaises(models.State.DoesNotExist):
+            models.State.objects.get_for_point(outside)
+
+
+class TestReverseGeocoder(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.country = models.Country.objects.create(
+            name='Arbitrary Square Federation',
+            region=MultiPolygon(
+                Polygon.from_bbox((0.0, 0.0, 50.0, 50.0)),
+            ),
+        )
+        cls.state = models.State.objects.create(
+            name='Imperially Captured Arbitrary Square',
+            region=MultiPolygon(
+                Polygon.from_bbox((10.0, 10.0, 40.0, 40.0)),
+            ),
+            country=cls.country,
+        )
+
+    def setUp(self):
+        self.geocoder = geocoding.ReverseGeocoder()
+
+    def test_point_in_state(self):
+        self.assertEqual(
+            self.geocoder.lookup(25.0, 25.0),
+            (self.country.id, self.state.id),
+        )
+
+    def test_point_in_country_outside_states(self):
+        self.assertEqual(self.geocoder.lookup(5.0, 5.0), (self.country.id, None))
+
+    def test_point_in_no_country(self):
+        self.assertEqual(self.geocoder.lookup(-25.0, -25.0), (None, None))
+
+    def test_lookups_are_cached(self):
+        self.geocoder.lookup(25.0, 25.0)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.geocoder.get_state_id(Point(25.001, 25.001)),
+                             self.state.id)
+
+    def test_new_regions_are_picked_up(self):
+        geocoding.reverse_geocoder.lookup(45.0, 45.0)
+
+        state = models.State.objects.create(
+            name='Newly Annexed Arbitrary Square',
+            region=MultiPolygon(
+                Polygon.from_bbox((40.0, 40.0, 50.0, 50.0)),
+            ),
+            country=self.country,
+        )
+
+        self.assertEqual(
+            geocoding.reverse_geocoder.get_state_id(Point(45.0, 45.0)),
+            state.id,
+        )
+
+    def test_box_tree_query(self):
+        tree = geocoding.BoxTree(
+            ((x, y, x + 1.0, y + 1.0), (x, y))
+            for x in range(20) for y in range(20)
+        )
+
+        self.assertCountEqual(tree.query(5.5, 7.5), [(5, 7)])
+        self.assertCountEqual(tree.query(5.0, 7.5), [(4, 7), (5, 7)])
+        self.assertCountEqual(tree.query(-5.0, 7.5), [])
+
+
+class TestLandmarkIndex(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.far = models.Landmark.objects.create(
+            name='Far',
+            location=Point(-117.20, 46.80),
+        )
+        cls.near = models.Landmark.objects.create(
+            name='Near',
+            location=Point(-117.18, 46.73),
+        )
+
+    def setUp(self):
+        landmarks.landmark_index.clear()
+
+    def test_closest_candidates(self):
+        candidates = models.Landmark.objects.closest_candidates(
+            None,
+            Point(-117.17, 46.73),
+        )
+
+        self.assertEqual(candidates, [self.near, self.far])
+
+    def test_new_landmarks_are_indexed(self):
+        models.Landmark.objects.closest_candidates(None, Point(-117.17, 46.73))
+
+        nearest = models.Landmark.objects.create(
+            name='Nearest',
+            location=Point(-117.17, 46.73),
+        )
+
+        candidates = models.Landmark.objects.closest_candidates(
+            None,
+            Point(-117.17, 46.73),
+            k=1,
+        )
+
+        self.assertEqual(candidates, [nearest])
+
+    def test_closest_to_grows_search_radius(self):
+        point = Point(-117.17, 46.73, srid=4326)
+
+        self.assertEqual(
+            models.Landmark.objects.closest_to(point, 2),
+            [self.near, self.far],
+        )
+        self.assertEqual(
+            list(models.Landmark.objects.filter_by_within('location', point, 2000)),
+            [self.near],
+        )
+
+    def test_kd_tree_nearest(self):
+        tree = landmarks.KDTree(
+            (float(x), float(y), (x, y)) for x in range(10) for y in range(10)
+        )
+
+        self.assertEqual(
+            [value for _, value in tree.nearest(3.2, 6.9, k=2)],
+            [(3, 7), (4, 7)],
+        )
+
+
+class TestImportLandmarks(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.state = models.State.objects.create(
+            name='Imperially Captured Arbitrary Square',
+            region=MultiPolygon(
+                Polygon.from_bbox((10.0, 10.0, 40.0, 40.0)),
+            ),
+            country=models.Country.objects.create(
+                name='Arbitrary Square Federation',
+                region=MultiPolygon(
+                    Polygon.from_bbox((0.0, 0.0, 50.0, 50.0)),
+                ),
+            ),
+        )
+
+    def setUp(self):
+        geocoding.reverse_geocoder.clear()
+
+        fd, self.path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w') as f:
+            f.write(
+                'name,longitude,latitude\n'
+                'Fountain,20.0,20.0\n'
+                'Fountain,20.0,20.0\n'
+                'Statue,45.0,45.0\n'
+                'Nowhere,east,north\n'
+            )
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def import_landmarks(self, *args):
+        call_command('import_landmarks', self.path, *args, stdout=StringIO())
+
+    def test_import_landmarks(self):
+        self.import_landmarks('--batch-size', '1')
+
+        self.assertEqual(
+            set(models.Landmark.objects.values_list('name', 'state')),
+            {('Fountain', self.state.id), ('Statue', None)},
+        )
+        self.assertFalse(os.path.exists(f"{self.path}.checkpoint"))
+
+    def test_import_landmarks_twice(self):
+        self.import_landmarks()
+        self.import_landmarks()
+
+        self.assertEqual(models.Landmark.objects.count(), 2)
+
+    def test_import_landmarks_resume(self):
+        with open(f"{self.path}.checkpoint", 'w') as f:
+            f.write('2')  # Both Fountains
+
+        self.import_landmarks('--resume')
+
+        self.assertEqual(
+            list(models.Landmark.objects.values_list('name', flat=True)),
+            ['Statue'],
+        )
+
+
+class TestImportCountriesAgain(TestCase):
+    def test_refuses_without_delete(self):
+        models.Country.objects.create(
+            name='Arbitrary Square Federation',
+            region=MultiPolygon(Polygon.from_bbox((0.0, 0.0, 50.0, 50.0))),
+        )
+
+        with self.assertRaisesRegex(CommandError, '--delete'):
+            call_command('import_countries', stdout=StringIO())
+
+        self.assertEqual(models.Country.objects.count(), 1)
+
+
 # class TestImportCountries(TestCase):
 #     def test_import_countries(self):
 #         self.assertEqual(models.Country.objects.count(), 0)
@@ -87,8 +87,21 @@ class SiteUserAdmin(admin.GeoModelAdmin):
 
 @admin.register(models.Rundezvous)
 class RundezvousAdmin(admin.ModelAdmin):
-    readonly_fields = ('started_at',)
-    fields = ('started_at', 'ended_at', 'landmark', 'expiration_seconds',)
+    readonly_fields = (
+        'started_at',
+        'chat_ends_at',
+        'meet_decision_ends_at',
+        'expires_at',
+    )
+    fields = (
+        'started_at',
+        'ended_at',
+        'landmark',
+        'expiration_seconds',
+        'chat_ends_at',
+        'meet_decision_ends_at',
+        'expires_at',
+    )
 
     class UserInline(admin.TabularInline):
         model = models.SiteUser.rundezvouses.through
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class RundezvousConfig(AppConfig):
     name = 'rundezvous'
+
+    def ready(self):
+        from rundezvous import signals  # noqa: F401 (connects receivers)
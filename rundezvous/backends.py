@@ -0,0 +1,20 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+UserModel = get_user_model()
+
+
+class SiteUserBackend(ModelBackend):
+    """
+    Loads request.user together with its active Rundezvous, so views can read
+    user.active_rundezvous for the rest of the request without a query
+    """
+    def get_user(self, user_id):
+        try:
+            user = UserModel._default_manager \
+                .select_related('active_rundezvous') \
+                .get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+
+        return user if self.user_can_authenticate(user) else None
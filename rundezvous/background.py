@@ -0,0 +1,33 @@
+"""
+The matchmaker and scheduler threads, for single-process deployments that
+don't run `manage.py matchmake` and `manage.py schedule`
+Started by the WSGI and ASGI entry points, not AppConfig.ready, so that
+management commands (those two included) never start them
+"""
+
+import threading
+
+from django.conf import settings
+
+_lock = threading.Lock()
+_started = False
+
+
+def start_threads():
+    """Starts the threads the settings ask for, once per process"""
+    global _started
+
+    with _lock:
+        if _started:
+            return
+        _started = True
+
+    if settings.MATCHMAKING_THREAD:
+        from rundezvous import matching
+
+        matching.start_matchmaking_thread()
+
+    if settings.SCHEDULER_THREAD:
+        from rundezvous import scheduler
+
+        scheduler.start_scheduler_thread()
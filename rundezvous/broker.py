@@ -0,0 +1,355 @@
+"""
+Publish/subscribe of chat messages to open streams
+InProcessBroker is enough when everything runs in one process, SocketBroker
+relays through `manage.py run_broker` so several workers share messages
+"""
+
+import asyncio
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from rundezvous import const
+
+logger = logging.getLogger(__name__)
+
+_CLOSED = object()  # Queued to wake a consumer when its subscription closes
+
+
+class SubscriptionClosed(Exception):
+    """The subscription was closed, possibly because it fell behind"""
+
+
+class Subscription:
+    """Messages published to a channel after subscribing, for a thread"""
+    def __init__(self, broker, channel, maxsize=const.SUBSCRIPTION_BUFFER):
+        self.broker = broker
+        self.channel = channel
+
+        self._queue = queue.Queue(maxsize)
+        self.closed = False
+
+    def deliver(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self.close()  # The consumer can catch up from the DB
+
+    def get(self, timeout=None):
+        """Returns the next message, or None if timeout passes first"""
+        try:
+            message = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+        if message is _CLOSED:
+            raise SubscriptionClosed
+
+        return message
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+
+        self.broker.unsubscribe(self)
+
+        while True:  # Drop the backlog, the consumer catches up from the DB
+            try:
+                self._queue.get_nowait()
+                continue
+            except queue.Empty:
+                pass
+
+            try:
+                self._queue.put_nowait(_CLOSED)
+                break
+            except queue.Full:
+                pass  # A delivery raced in, drain again
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class AsyncSubscription(Subscription):
+    """Same, but consumed by a coroutine running on loop"""
+    def __init__(self, broker, channel, loop, maxsize=const.SUBSCRIPTION_BUFFER):
+        self.broker = broker
+        self.channel = channel
+
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize)
+        self.closed = False
+
+    def deliver(self, message):
+        # Publishers run on other threads, the queue belongs to the loop
+        self._loop.call_soon_threadsafe(self._put, message)
+
+    def _put(self, message):
+        if self.closed:
+            return
+
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.close()
+
+    async def get(self, timeout=None):
+        try:
+            message = await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+        if message is _CLOSED:
+            raise SubscriptionClosed
+
+        return message
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+
+        self.broker.unsubscribe(self)
+
+        def wake():
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait(_CLOSED)
+
+        self._loop.call_soon_threadsafe(wake)
+
+
+class InProcessBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)  # channel -> {Subscription}
+
+    def _add(self, subscription):
+        with self._lock:
+            self._subscriptions[subscription.channel].add(subscription)
+        return subscription
+
+    def subscribe(self, channel) -> Subscription:
+        return self._add(Subscription(self, channel))
+
+    def subscribe_async(self, channel, loop) -> AsyncSubscription:
+        return self._add(AsyncSubscription(self, channel, loop))
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel)
+
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.channel]
+
+    def _deliver(self, channel, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+
+        for subscription in subscriptions:
+            subscription.deliver(message)
+
+    def publish(self, channel, message):
+        """message must be JSON serializable, to work with every broker"""
+        self._deliver(channel, message)
+
+
+class SocketBroker(InProcessBroker):
+    """
+    Relays every publish through the run_broker process over a Unix socket,
+    which sends it back to every connected worker (including this one)
+    """
+    def __init__(self, path=None):
+        super().__init__()
+
+        self.path = path or settings.CHAT_BROKER_SOCKET
+
+        self._connection = None
+        self._send_lock = threading.Lock()
+        self._connected = threading.Event()
+
+        threading.Thread(
+            target=self._receive_forever,
+            name='chat-broker',
+            daemon=True,
+        ).start()
+
+    def _receive_forever(self):
+        while True:
+            try:
+                connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                connection.connect(self.path)
+            except OSError:
+                logger.warning("Chat broker at %s is unreachable", self.path)
+                time.sleep(const.BROKER_RECONNECT_DELAY)
+                continue
+
+            self._connection = connection
+            self._connected.set()
+
+            try:
+                for line in connection.makefile('rb'):
+                    frame = json.loads(line)
+                    self._deliver(frame['channel'], frame['message'])
+            except (OSError, ValueError):
+                logger.exception("Lost the chat broker connection")
+            finally:
+                self._connected.clear()
+                self._connection = None
+                connection.close()
+
+    def publish(self, channel, message):
+        frame = json.dumps({'channel': channel, 'message': message}) + '\n'
+
+        self._connected.wait(const.BROKER_RECONNECT_DELAY)
+
+        try:
+            with self._send_lock:
+                self._connection.sendall(frame.encode())
+        except (OSError, AttributeError):
+            # Better that this process's subscribers get it than nobody
+            logger.warning("Chat broker unavailable, delivering locally")
+            self._deliver(channel, message)
+
+
+class _RelayClient:
+    """
+    A worker connected to the relay, written to by its own thread so frames
+    never interleave and a slow worker doesn't hold up the others
+    """
+    def __init__(self, connection, wfile, maxsize=const.BROKER_CLIENT_BUFFER):
+        self._connection = connection
+        self._wfile = wfile
+
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize)
+        self.closed = False
+
+        threading.Thread(
+            target=self._write_forever,
+            name='chat-broker-client',
+            daemon=True,
+        ).start()
+
+    def send(self, frame):
+        with self._lock:
+            if self.closed:
+                return
+
+            try:
+                self._queue.put_nowait(frame)
+                return
+            except queue.Full:
+                pass
+
+        logger.warning("Chat broker client fell behind, disconnecting it")
+        self.close()
+
+    def close(self):
+        """Stops the writer and hangs up, which ends the client's handler"""
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+
+            while True:  # Make room, _CLOSED must get through
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            self._queue.put_nowait(_CLOSED)
+
+        try:
+            self._connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass  # Already gone
+
+    def _write_forever(self):
+        while True:
+            frame = self._queue.get()
+            if frame is _CLOSED:
+                return
+
+            try:
+                self._wfile.write(frame)
+                self._wfile.flush()
+            except OSError:
+                self.close()
+                return
+
+
+class _RelayHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        client = _RelayClient(self.connection, self.wfile)
+
+        with server.lock:
+            server.clients.add(client)
+
+        try:
+            for frame in self.rfile:
+                with server.lock:
+                    clients = list(server.clients)
+
+                for other in clients:
+                    other.send(frame)
+        except OSError:
+            pass  # Hung up, possibly by client.close
+        finally:
+            with server.lock:
+                server.clients.discard(client)
+
+            client.close()
+
+
+def serve(path):
+    """Runs the relay SocketBroker connects to, until interrupted"""
+    if os.path.exists(path):
+        os.unlink(path)
+
+    server = socketserver.ThreadingUnixStreamServer(path, _RelayHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.clients = set()
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(path)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """The broker configured by settings.CHAT_BROKER, one per process"""
+    global _broker
+
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(settings.CHAT_BROKER)()
+
+    return _broker
+
+
+def room_channel(room_id):
+    return f'room:{room_id}'
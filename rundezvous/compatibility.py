@@ -0,0 +1,58 @@
+"""
+Gender and Preferences packed into two small integers per user, so whether
+two users want to meet is a couple of bitwise ANDs instead of joins
+
+    profile:     the user's gender bit | their activity bit
+    preferences: the genders they want | the same activity bit
+
+Two users are compatible when each one's preferences cover the other's
+profile: they want each other's gender and want the same activity
+"""
+
+# Genders, one bit each
+MALE = 1
+FEMALE = 2
+OTHER = 4
+ALL_GENDERS = MALE | FEMALE | OTHER
+
+# Activities, every user has exactly one
+PLATONIC = 8
+HOOKUPS = 16
+ACTIVITIES = PLATONIC | HOOKUPS
+
+GENDER_BITS = {
+    'M': MALE,
+    'F': FEMALE,
+    'O': OTHER,
+}
+
+# Same as SiteUser's defaults, for users without Preferences
+DEFAULT_PROFILE = FEMALE | PLATONIC
+DEFAULT_PREFERENCES = ALL_GENDERS | PLATONIC
+
+
+def activity(preferences) -> int:
+    return HOOKUPS if preferences is not None and preferences.hookups else PLATONIC
+
+
+def profile_mask(gender, preferences=None) -> int:
+    return GENDER_BITS[gender] | activity(preferences)
+
+
+def preferences_mask(preferences=None) -> int:
+    """Ticking no genders at all means no restriction"""
+    genders = 0
+
+    if preferences is not None:
+        genders = (
+            (MALE if preferences.males else 0) |
+            (FEMALE if preferences.females else 0) |
+            (OTHER if preferences.others else 0)
+        )
+
+    return (genders or ALL_GENDERS) | activity(preferences)
+
+
+def compatible(profile, preferences, other_profile, other_preferences) -> bool:
+    return preferences & other_profile == other_profile and \
+        other_preferences & profile == profile
@@ -14,3 +14,46 @@ MAX_CHAT_MESSAGE_LENGTH = 140
 # How long users can chat before the Rundezvous Decision must be made
 CHAT_TIME_LIMIT = timezone.timedelta(minutes=2)
 MEET_DECISION_TIME_LIMIT = timezone.timedelta(seconds=30)
+
+# Side length of a cell in the in-memory matching grid, ~1.1km of latitude
+MATCHING_CELL_DEGREES = 0.01
+# Seconds before a State in the matching grid is reloaded from the DB, to
+# pick up users that other worker processes changed
+MATCHING_STATE_TTL = 30.0
+# How many of the closest indexed users are confirmed against the DB at once
+PARTNER_CANDIDATES = 20
+# Seconds between batch matchmaking passes
+MATCHMAKING_INTERVAL = 2.0
+# Users whose met users are kept in memory, most recently matched first
+MET_USERS_CACHE_SIZE = 10000
+
+# Most samples accepted in one batched location upload
+MAX_TRAJECTORY_SAMPLES = 600
+# How far ahead of the server a phone's clock is allowed to be
+MAX_CLOCK_SKEW = timezone.timedelta(minutes=1)
+
+# Arrival geofence bounding boxes are padded by this factor, since projected
+# distances (used for the exact check) are slightly off from true ones
+GEOFENCE_MARGIN = 1.01
+# How many running Rundezvouses keep a geofence cached in each process
+GEOFENCE_CACHE_SIZE = 10000
+
+# Longest a long-polling chat request is held open waiting for a message
+MAX_LONG_POLL_WAIT = 30
+
+# Messages a chat stream may fall behind by before it's dropped (the client
+# reconnects and catches up from the database)
+SUBSCRIPTION_BUFFER = 100
+# Seconds between keepalive comments on an idle chat stream
+STREAM_KEEPALIVE = 15
+# Seconds between attempts to reach the chat broker
+BROKER_RECONNECT_DELAY = 1.0
+# Frames the relay may queue for a worker before disconnecting it (it
+# reconnects, its streams catch up from the database)
+BROKER_CLIENT_BUFFER = 1000
+
+# Resolution of the lifecycle scheduler, deadlines fire up to a tick late
+SCHEDULER_TICK = 1.0
+# Slots per timer wheel level, and levels (64 ** 4 ticks is ~194 days)
+SCHEDULER_WHEEL_SLOTS = 64
+SCHEDULER_WHEEL_LEVELS = 4
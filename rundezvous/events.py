@@ -0,0 +1,48 @@
+"""
+Per-room wakeups, so chat requests can wait for a new message instead of
+polling for one
+Rides on the chat broker's room channels, the same ones chat streams
+follow, so with SocketBroker a message stored by any worker wakes waits in
+every worker
+"""
+
+from contextlib import contextmanager
+
+from rundezvous import broker
+
+
+class RoomListener:
+    def __init__(self, subscription):
+        self._subscription = subscription
+
+    def wait(self, timeout) -> bool:
+        """
+        Waits until something is published to the room, returns False on
+        timeout
+        Publishes since the listener was created count too
+        """
+        try:
+            return self._subscription.get(timeout) is not None
+        except broker.SubscriptionClosed:
+            return True  # Fell behind, so there's plenty to read
+
+
+class RoomEvents:
+    def __init__(self, chat_broker=None):
+        self._broker = chat_broker
+
+    @property
+    def broker(self):
+        return self._broker or broker.get_broker()
+
+    @contextmanager
+    def listen(self, room_id):
+        """
+        Listen before checking for news, so a message that lands between the
+        check and the wait isn't missed
+        """
+        with self.broker.subscribe(broker.room_channel(room_id)) as subscription:
+            yield RoomListener(subscription)
+
+
+room_events = RoomEvents()
@@ -0,0 +1,102 @@
+"""
+Arrival geofences, precomputed once per Rundezvous when the meetup starts
+so that checking a location update is usually just a bounding box test
+"""
+
+import threading
+
+from collections import OrderedDict
+
+from django.contrib.gis.geos import Point
+
+from places import const as place_const
+from places import geo
+
+from rundezvous import const
+
+
+class ArrivalGeofence:
+    def __init__(self, landmark_location: Point, srid: int, meters: float):
+        self.srid = srid
+        self.meters = meters
+
+        # The exact check measures in srid, so allow for its scale error
+        self.bbox = geo.bbox_around(
+            landmark_location.x,
+            landmark_location.y,
+            meters * const.GEOFENCE_MARGIN,
+        )
+
+        self.center = landmark_location.transform(srid, clone=True)
+
+    def could_contain(self, geometry) -> bool:
+        """Cheap test, False means geometry is definitely outside"""
+        min_lon, min_lat, max_lon, max_lat = geometry.extent
+        fence_min_lon, fence_min_lat, fence_max_lon, fence_max_lat = self.bbox
+
+        return min_lon <= fence_max_lon and max_lon >= fence_min_lon and \
+            min_lat <= fence_max_lat and max_lat >= fence_min_lat
+
+    def contains(self, geometry) -> bool:
+        """Whether any part of geometry (srid=4326) is within the fence"""
+        if not self.could_contain(geometry):
+            return False
+
+        # Near the boundary, so do the exact check in the projection
+        projected = geometry.transform(self.srid, clone=True)
+
+        return projected.distance(self.center) < self.meters
+
+
+class GeofenceCache:
+    """LRU of ArrivalGeofences keyed by Rundezvous id"""
+    def __init__(self, size=const.GEOFENCE_CACHE_SIZE):
+        self.size = size
+
+        self._lock = threading.Lock()
+        self._geofences = OrderedDict()
+
+    def build(self, rundezvous):
+        """
+        Builds (or rebuilds) the geofence around rundezvous.landmark, measured
+        in the projection of the landmark's State
+        """
+        landmark = rundezvous.landmark
+
+        if landmark.state_id is not None:
+            srid = landmark.state.projection_srid
+        else:
+            srid = place_const.DEFAULT_PROJECTION_SRID
+
+        geofence = ArrivalGeofence(
+            landmark.location,
+            srid,
+            const.MEETUP_DISTANCE_THRESHOLD.m,
+        )
+
+        with self._lock:
+            self._geofences[rundezvous.id] = geofence
+            self._geofences.move_to_end(rundezvous.id)
+
+            while len(self._geofences) > self.size:
+                self._geofences.popitem(last=False)
+
+        return geofence
+
+    def get(self, rundezvous):
+        """Returns the cached geofence, building it if this process hasn't"""
+        with self._lock:
+            try:
+                self._geofences.move_to_end(rundezvous.id)
+                return self._geofences[rundezvous.id]
+            except KeyError:
+                pass
+
+        return self.build(rundezvous)
+
+    def discard(self, rundezvous_id):
+        with self._lock:
+            self._geofences.pop(rundezvous_id, None)
+
+
+arrival_geofences = GeofenceCache()
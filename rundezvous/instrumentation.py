@@ -0,0 +1,153 @@
+"""
+Per-request accounting of SQL queries, view time and template render time,
+so N+1 queries show up in the logs (and tests) instead of in code review
+
+    with instrumentation.instrument() as stats:
+        ...
+    stats.queries, stats.sql_ms, stats.template_ms
+
+InstrumentationMiddleware wraps every request in instrument(), logs the
+result and, with DEBUG on, adds a Server-Timing header
+"""
+
+import logging
+import threading
+import time
+
+from contextlib import contextmanager, ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.template import base as template_base
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()  # .active is the stack of RequestStats being recorded
+
+_patch_lock = threading.Lock()
+_original_render = None
+
+
+class RequestStats:
+    def __init__(self):
+        self.sql = []  # (sql, ms) of every query, in order
+        self.sql_ms = 0.0
+        self.template_ms = 0.0
+        self.total_ms = 0.0
+
+    @property
+    def queries(self) -> int:
+        return len(self.sql)
+
+    def record_query(self, sql, ms):
+        self.sql.append((sql, ms))
+        self.sql_ms += ms
+
+    def as_dict(self):
+        return {
+            'queries': self.queries,
+            'sql_ms': round(self.sql_ms, 3),
+            'template_ms': round(self.template_ms, 3),
+            'total_ms': round(self.total_ms, 3),
+        }
+
+    def server_timing(self) -> str:
+        """https://www.w3.org/TR/server-timing/, shown by browser devtools"""
+        return ', '.join([
+            f'sql;dur={self.sql_ms:.3f};desc="{self.queries} queries"',
+            f'template;dur={self.template_ms:.3f}',
+            f'total;dur={self.total_ms:.3f}',
+        ])
+
+
+def _active():
+    return getattr(_local, 'active', [])
+
+
+def _timed_render(self, context):
+    """Template.render, timing the outermost render of every template tree"""
+    if getattr(_local, 'rendering', False) or not _active():
+        return _original_render(self, context)
+
+    _local.rendering = True
+    started = time.perf_counter()
+    try:
+        return _original_render(self, context)
+    finally:
+        _local.rendering = False
+        ms = (time.perf_counter() - started) * 1000
+
+        for stats in _active():
+            stats.template_ms += ms
+
+
+def _patch_templates():
+    """Times Template.render, it's a no-op unless something is recording"""
+    global _original_render
+
+    with _patch_lock:
+        if _original_render is None:
+            _original_render = template_base.Template.render
+            template_base.Template.render = _timed_render
+
+
+@contextmanager
+def instrument():
+    """Records the queries and render time of the block into RequestStats"""
+    _patch_templates()
+
+    stats = RequestStats()
+
+    def execute_wrapper(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            stats.record_query(sql, (time.perf_counter() - started) * 1000)
+
+    if not hasattr(_local, 'active'):
+        _local.active = []
+
+    _local.active.append(stats)
+    started = time.perf_counter()
+
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(execute_wrapper))
+
+            yield stats
+    finally:
+        stats.total_ms = (time.perf_counter() - started) * 1000
+        _local.active.remove(stats)
+
+
+class InstrumentationMiddleware:
+    """Should come first, so the other middleware's queries are counted too"""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with instrument() as stats:
+            response = self.get_response(request)
+
+        match = request.resolver_match
+
+        logger.info(
+            "%s %s: %d queries in %.1fms, %.1fms total",
+            request.method,
+            request.path,
+            stats.queries,
+            stats.sql_ms,
+            stats.total_ms,
+            extra={
+                'url_name': match.url_name if match is not None else None,
+                'status': response.status_code,
+                **stats.as_dict(),
+            },
+        )
+
+        if settings.DEBUG:
+            response['Server-Timing'] = stats.server_timing()
+
+        return response
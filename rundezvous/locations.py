@@ -0,0 +1,118 @@
+"""
+Write-behind buffering of location updates
+GPS pings arrive far more often than anything needs them on disk, so only the
+latest position per user is kept and they're all written in one bulk_update
+"""
+
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LocationBuffer:
+    fields = ['location', 'location_updated_at', 'state']
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}  # user_id -> (location, location_updated_at, state_id)
+        self._last_flush = time.monotonic()
+        self._thread = None
+
+        # Whatever is left at exit, even if the timer thread never started
+        atexit.register(self.flush)
+
+    @property
+    def interval(self):
+        """Seconds between flushes, 0 writes every update through immediately"""
+        return settings.LOCATION_FLUSH_INTERVAL / 1000
+
+    def put(self, user):
+        """Buffers the user's current location, replacing any older one"""
+        with self._lock:
+            self._pending[user.id] = (
+                user.location,
+                user.location_updated_at,
+                user.state_id,
+            )
+
+            due = len(self._pending) >= settings.LOCATION_FLUSH_SIZE or \
+                time.monotonic() - self._last_flush >= self.interval
+
+        if due:
+            try:
+                self.flush()
+            except Exception:  # Kept pending, not this request's problem
+                logger.exception("Flushing buffered locations failed")
+        else:
+            self._ensure_thread()
+
+    def get(self, user_id):
+        """Returns the buffered (location, location_updated_at, state_id)"""
+        with self._lock:
+            return self._pending.get(user_id)
+
+    def flush(self):
+        """Writes every buffered location, returns how many were written"""
+        from rundezvous.models import SiteUser
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+
+        if not pending:
+            return 0
+
+        users = [
+            SiteUser(
+                id=user_id,
+                location=location,
+                location_updated_at=updated_at,
+                state_id=state_id,
+            )
+            for user_id, (location, updated_at, state_id) in pending.items()
+        ]
+
+        try:
+            SiteUser.objects.bulk_update(users, self.fields)
+        except Exception:
+            with self._lock:  # Try again next time unless there's a newer one
+                for user_id, entry in pending.items():
+                    self._pending.setdefault(user_id, entry)
+            raise
+
+        return len(users)
+
+    def _ensure_thread(self):
+        """Flushes on a timer so a quiet period doesn't strand updates"""
+        if self._thread is not None:
+            return
+
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name='location-buffer',
+                    daemon=True,
+                )
+                self._thread.start()
+
+    def _run(self):
+        from django.db import close_old_connections
+
+        while True:
+            time.sleep(max(self.interval, 0.01))
+
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Flushing buffered locations failed")
+            finally:
+                close_old_connections()
+
+
+location_buffer = LocationBuffer()
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from rundezvous import const
+from rundezvous import matching
+
+
+class Command(BaseCommand):
+    help = 'Pairs up LOOKING users in batches until interrupted'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=const.MATCHMAKING_INTERVAL,
+            help='Seconds between matchmaking passes',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run a single matchmaking pass and exit',
+        )
+
+    def handle(self, *args, **options):
+        if options['once']:
+            created = matching.run_matchmaking_pass()
+            self.stdout.write(f"Created {created} rundezvouses")
+        else:
+            matching.run_matchmaking(options['interval'])
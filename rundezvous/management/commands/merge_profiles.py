@@ -0,0 +1,56 @@
+import glob
+import os
+
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from rundezvous import profiling
+
+
+class Command(BaseCommand):
+    help = 'Merges sampled request profiles into one collapsed stack file, ' \
+           'ready for flamegraph.pl or speedscope'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths',
+            nargs='*',
+            help='Profiles to merge (default: everything in PROFILING_DIR)',
+        )
+        parser.add_argument(
+            '--url-name',
+            help='Only merge the profiles of this URL name',
+        )
+        parser.add_argument(
+            '--user',
+            help='Only merge the profiles of this user ID',
+        )
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or sorted(glob.glob(
+            os.path.join(settings.PROFILING_DIR, f'*{profiling.EXTENSION}')
+        ))
+
+        stacks = Counter()
+        merged = 0
+
+        for path in paths:
+            try:
+                url_name, user_id, _ = os.path.basename(path).split('.', 2)
+            except ValueError:
+                self.stderr.write(f"Skipping {path}, not a profile")
+                continue
+
+            if options['url_name'] not in (None, url_name):
+                continue
+            if options['user'] not in (None, user_id):
+                continue
+
+            with open(path) as f:
+                stacks += profiling.read_collapsed(f)
+            merged += 1
+
+        profiling.write_collapsed(stacks, self.stdout)
+        self.stderr.write(f"Merged {merged} profiles")
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from rundezvous import broker
+
+
+class Command(BaseCommand):
+    help = 'Relays chat messages between workers using the SocketBroker'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--socket',
+            default=settings.CHAT_BROKER_SOCKET,
+            help='Path of the Unix socket to listen on',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Relaying chat messages on {options['socket']}")
+
+        try:
+            broker.serve(options['socket'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from rundezvous import const
+from rundezvous import scheduler
+
+
+class Command(BaseCommand):
+    help = 'Fires Rundezvous chat, decision and run deadlines until interrupted'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tick',
+            type=float,
+            default=const.SCHEDULER_TICK,
+            help='Seconds between scheduler ticks',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Fire every deadline that has already passed and exit',
+        )
+
+    def handle(self, *args, **options):
+        lifecycle = scheduler.LifecycleScheduler(options['tick'])
+
+        if options['once']:
+            lifecycle.poll()
+            fired = lifecycle.run_pending()
+            self.stdout.write(f"Fired {fired} deadlines")
+        else:
+            lifecycle.run()
@@ -9,13 +9,16 @@ from django.contrib.gis.db.models.functions import Distance, Centroid
 # https://docs.djangoproject.com/en/2.1/ref/contrib/gis/geoquerysets
 from django.contrib.gis.db.models.aggregates import Collect
 
+from django.db.models import ExpressionWrapper, F, Value
 from django.utils import timezone
 
+from places import managers as place_managers
+
 from rundezvous import const
 
 
 # SiteUser
-class SiteUserSet(models.QuerySet):
+class SiteUserSet(place_managers.SpatialIndexQuerySet):
     def get_midpoint(self) -> Point:
         """Aggregates midpoint from all User.locations"""
         return self.aggregate(
@@ -30,9 +33,40 @@ class SiteUserSet(models.QuerySet):
 
         return self.filter(location_updated_at__gte=user_active_time)
 
-    def order_by_closest_to(self, user):
-        """Gets closest compatible user to current user"""
-        return self \
+    def filter_by_compatible(self, user):
+        """
+        Users who want to meet user, and who user wants to meet
+        Two bitwise ANDs on columns of the row, see rundezvous.compatibility
+        """
+        return self.annotate(
+            wants_user=ExpressionWrapper(
+                F('match_preferences').bitand(user.match_profile),
+                output_field=models.IntegerField(),
+            ),
+            wanted_by_user=ExpressionWrapper(
+                Value(user.match_preferences).bitand(F('match_profile')),
+                output_field=models.IntegerField(),
+            ),
+        ).filter(
+            wants_user=user.match_profile,
+            wanted_by_user=F('match_profile'),
+        )
+
+    def filter_by_within(self, point, distance: measure.Distance):
+        """Users within distance of point, found through the spatial index"""
+        return super().filter_by_within('location', point, distance.m)
+
+    def order_by_closest_to(self, user, within: measure.Distance = None):
+        """
+        Gets closest compatible user to current user
+        Only users within (when given) are sorted, the rest are never read
+        """
+        users = self
+
+        if within is not None:
+            users = users.filter_by_within(user.location, within)
+
+        return users \
             .annotate(distance=Distance('location', user.location)) \
             .order_by('distance')
 
@@ -43,24 +77,33 @@ class SiteUserManager(auth_models.UserManager.from_queryset(SiteUserSet)):
 
 # Rundezvous
 class RundezvousSet(models.QuerySet):
-    def add_expires_at(self):
-        """
-        Annotates QuerySet with expires_at datetime by using created_at and
-        TODO: Stop supporting Spatialite so I can use this
-        """
-        raise NotImplementedError
-
-        # return self.annotate(
-        #     expires_at=ExpressionWrapper(
-        #         F('created_at') + F('expiration_seconds') * timezone.timedelta(seconds=1),
-        #         output_field=DateTimeField(),
-        #     )
-        # )
+    """Every deadline is an indexed column, so these are all range scans"""
+    def filter_by_open(self):
+        return self.filter(ended_at__isnull=True)
+
+    def expired(self, now=None):
+        """Open Rundezvouses whose meetup ran out of time"""
+        return self.filter_by_open().filter(
+            expires_at__lte=now or timezone.now(),
+        )
+
+    def unexpired(self, now=None):
+        """Open Rundezvouses whose meetup still has time left"""
+        return self.filter_by_open().filter(
+            expires_at__gt=now or timezone.now(),
+        )
+
+    def chat_ended(self, now=None):
+        """Open Rundezvouses still in the chatroom after the chat time limit"""
+        return self.filter_by_open().filter(
+            landmark__isnull=True,
+            chat_ends_at__lte=now or timezone.now(),
+        )
+
+    def end(self, now=None) -> int:
+        """Ends them all with one UPDATE, returns how many were ended"""
+        return self.filter_by_open().update(ended_at=now or timezone.now())
 
 
 class RundezvousManager(models.Manager.from_queryset(RundezvousSet)):
-    def expired(self):
-        raise NotImplementedError
-
-    def unexpired(self):
-        raise NotImplementedError
+    pass
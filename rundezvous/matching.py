@@ -0,0 +1,461 @@
+"""
+Process-local structures used to find Rundezvous partners without scanning
+the SiteUser table on every request
+"""
+
+import bisect
+import logging
+import math
+import threading
+import time
+
+from array import array
+from collections import defaultdict, OrderedDict
+
+from django.db import connection, transaction, close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from places import geo
+
+from rundezvous import compatibility
+from rundezvous import const
+from rundezvous import scoring
+
+logger = logging.getLogger(__name__)
+
+# What the index keeps of every LOOKING user
+INDEXED_FIELDS = (
+    'id',
+    'location',
+    'location_updated_at',
+    'match_profile',
+    'match_preferences',
+)
+
+
+def chunked(items, params_per_item=1):
+    """
+    Splits items into lists small enough for the database's limit on query
+    parameters (999 on older SQLite), for __in lookups over many ids
+    """
+    items = list(items)
+
+    limit = connection.features.max_query_params
+    size = max(1, limit // params_per_item) if limit else len(items) or 1
+
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class LookingUserIndex:
+    """
+    Fixed-cell grid of LOOKING users, keyed by State
+    A partner search only has to look at the few cells overlapping the search
+    radius instead of every user in the State
+    Each process has its own: sync only sees this process's updates, so a
+    State is reloaded from the DB once it's older than ttl seconds to pick
+    up (and drop) users changed by other workers. Candidates are always
+    confirmed against the DB, a stale entry only costs a wasted lookup
+    """
+    def __init__(self, cell_degrees=const.MATCHING_CELL_DEGREES,
+                 ttl=const.MATCHING_STATE_TTL):
+        self.cell_degrees = cell_degrees
+        self.ttl = ttl
+
+        self._lock = threading.RLock()
+        self._states = {}  # state_id -> {cell: {user_id: entry}}
+        self._users = {}  # user_id -> (state_id, cell)
+        self._loaded_states = {}  # state_id -> time.monotonic() of loading
+
+    def _cell(self, lon, lat):
+        return (
+            math.floor(lon / self.cell_degrees),
+            math.floor(lat / self.cell_degrees),
+        )
+
+    def clear(self):
+        with self._lock:
+            self._states.clear()
+            self._users.clear()
+            self._loaded_states.clear()
+
+    def __contains__(self, user_id):
+        with self._lock:
+            return user_id in self._users
+
+    def add(self, user_id, state_id, lon, lat, updated_at,
+            profile=compatibility.DEFAULT_PROFILE,
+            preferences=compatibility.DEFAULT_PREFERENCES):
+        """Adds the user to the index, or moves them if they're already in it"""
+        cell = self._cell(lon, lat)
+        entry = (lon, lat, updated_at, profile, preferences)
+
+        with self._lock:
+            self.discard(user_id)
+
+            self._states.setdefault(state_id, {}) \
+                .setdefault(cell, {})[user_id] = entry
+            self._users[user_id] = (state_id, cell)
+
+    def discard(self, user_id):
+        with self._lock:
+            try:
+                state_id, cell = self._users.pop(user_id)
+            except KeyError:
+                return
+
+            cells = self._states[state_id]
+            del cells[cell][user_id]
+            if not cells[cell]:
+                del cells[cell]
+
+    def sync(self, user):
+        """Makes the index reflect the current status and location of user"""
+        from rundezvous.models import SiteUser
+
+        if user.status == SiteUser.Status.LOOKING and user.location is not None:
+            self.add(
+                user.id,
+                user.state_id,
+                user.location.x,
+                user.location.y,
+                user.location_updated_at,
+                user.match_profile,
+                user.match_preferences,
+            )
+        else:
+            self.discard(user.id)
+
+    def populate(self, state_id, users, replace=False):
+        """
+        Adds [(user_id, location, updated_at[, profile, preferences])] and
+        marks state as loaded
+        With replace, the State's users are exactly users afterwards
+        """
+        with self._lock:
+            if replace:
+                for cell in list(self._states.get(state_id, {}).values()):
+                    for user_id in list(cell):
+                        self.discard(user_id)
+
+            for user_id, location, updated_at, *masks in users:
+                if replace or user_id not in self._users:
+                    self.add(
+                        user_id,
+                        state_id,
+                        location.x,
+                        location.y,
+                        updated_at,
+                        *masks,
+                    )
+
+            self._loaded_states[state_id] = time.monotonic()
+
+    def _load_state(self, state_id):
+        """
+        Fills the index with a State's LOOKING users the first time it's used,
+        and refills it every ttl seconds after that
+        Users that start looking in this process are added by sync meanwhile
+        """
+        from rundezvous.models import SiteUser
+
+        users = SiteUser.objects \
+            .filter(state_id=state_id, status=SiteUser.Status.LOOKING) \
+            .filter(location__isnull=False) \
+            .filter_by_active() \
+            .values_list(*INDEXED_FIELDS)
+
+        self.populate(state_id, list(users), replace=True)
+
+    def nearby(self, state_id, lon, lat, meters, exclude=(),
+               profile=None, preferences=None):
+        """
+        Returns [(distance, user_id)] of active users within meters of
+        (lon, lat), closest first
+        Given the searching user's profile and preferences, only users
+        compatible with them are returned
+        """
+        loaded_at = self._loaded_states.get(state_id)
+        if loaded_at is None or time.monotonic() - loaded_at > self.ttl:
+            self._load_state(state_id)
+
+        active_since = timezone.now() - const.USER_ACTIVE_TIME
+
+        min_lon, min_lat, max_lon, max_lat = geo.bbox_around(lon, lat, meters)
+        min_x, min_y = self._cell(min_lon, min_lat)
+        max_x, max_y = self._cell(max_lon, max_lat)
+
+        candidates = []
+
+        with self._lock:
+            cells = self._states.get(state_id, {})
+
+            for x in range(min_x, max_x + 1):
+                for y in range(min_y, max_y + 1):
+                    for user_id, entry in cells.get((x, y), {}).items():
+                        other_lon, other_lat, updated_at, *masks = entry
+
+                        if user_id in exclude:
+                            continue
+                        if updated_at is None or updated_at < active_since:
+                            continue
+
+                        candidates.append((user_id, other_lon, other_lat, *masks))
+
+        if not candidates:
+            return []
+
+        # Distances and compatibility for all of them in one go
+        ids, lons, lats, other_profiles, other_preferences = zip(*candidates)
+
+        scorer = scoring.CandidateSet(
+            ids,
+            lons,
+            lats,
+            other_profiles,
+            other_preferences,
+        )
+
+        return scorer.nearest(
+            lon,
+            lat,
+            len(ids),
+            meters,
+            profile=profile,
+            preferences=preferences,
+        )
+
+
+looking_users = LookingUserIndex()
+
+
+class MetUsersCache:
+    """
+    Sorted arrays of the users each user has met (reviewed, or been reviewed
+    by), for the most recently matched users
+    Checking a candidate is a binary search instead of a NOT IN subquery
+    that grows with every Rundezvous. Reviews made by other processes only
+    show up once an entry is reloaded, so matches are still confirmed
+    against the database one pair at a time (see confirm_unmet)
+    """
+    def __init__(self, size=const.MET_USERS_CACHE_SIZE):
+        self.size = size
+
+        self._lock = threading.Lock()
+        self._met = OrderedDict()  # user_id -> array of met user ids
+
+    def clear(self):
+        with self._lock:
+            self._met.clear()
+
+    def _store(self, user_id, met):
+        self._met[user_id] = met
+        self._met.move_to_end(user_id)
+
+        while len(self._met) > self.size:
+            self._met.popitem(last=False)
+
+    def preload(self, user_ids):
+        """Loads every user not cached yet, one query per chunked()"""
+        from rundezvous.models import Review
+
+        with self._lock:
+            missing = [i for i in user_ids if i not in self._met]
+
+        if not missing:
+            return
+
+        met = defaultdict(set)
+        for chunk in chunked(missing, params_per_item=2):
+            for reviewer_id, reviewed_id in Review.objects \
+                    .filter(Q(reviewer_id__in=chunk) | Q(reviewed_id__in=chunk)) \
+                    .values_list('reviewer_id', 'reviewed_id'):
+                met[reviewer_id].add(reviewed_id)
+                met[reviewed_id].add(reviewer_id)
+
+        with self._lock:
+            for user_id in missing:
+                self._store(user_id, array('q', sorted(met[user_id])))
+
+    def get(self, user_id):
+        with self._lock:
+            met = self._met.get(user_id)
+            if met is not None:
+                self._met.move_to_end(user_id)
+                return met
+
+        self.preload([user_id])
+
+        with self._lock:
+            return self._met.get(user_id, array('q'))
+
+    def has_met(self, user_id, other_id) -> bool:
+        met = self.get(user_id)
+
+        i = bisect.bisect_left(met, other_id)
+        return i < len(met) and met[i] == other_id
+
+    def __contains__(self, pair):
+        """So it can stand in for a set of met pairs"""
+        return self.has_met(*pair)
+
+    def add(self, user_id, other_id):
+        """Records a meeting in both directions, for cached users only"""
+        with self._lock:
+            for a, b in ((user_id, other_id), (other_id, user_id)):
+                met = self._met.get(a)
+
+                if met is not None:
+                    i = bisect.bisect_left(met, b)
+                    if i == len(met) or met[i] != b:
+                        met.insert(i, b)
+
+    def discard(self, user_id, other_id):
+        """Just drops the entries, both directions may have to be reloaded"""
+        with self._lock:
+            self._met.pop(user_id, None)
+            self._met.pop(other_id, None)
+
+
+met_users = MetUsersCache()
+
+
+def confirm_unmet(pairs):
+    """
+    Drops the pairs that have met according to the database, with one query
+    (per chunked() of pairs)
+    The cache can miss reviews made by other processes since it was loaded
+    """
+    from rundezvous.models import Review
+
+    pairs = list(pairs)
+
+    met = set()
+    # Both ends of each pair go into both IN lists
+    for chunk in chunked(pairs, params_per_item=4):
+        user_ids = {user_id for pair in chunk for user_id in pair}
+
+        met.update(
+            Review.objects
+            .filter(reviewer_id__in=user_ids, reviewed_id__in=user_ids)
+            .values_list('reviewer_id', 'reviewed_id')
+        )
+
+    confirmed = []
+    for user_id, other_id in pairs:
+        if (user_id, other_id) in met or (other_id, user_id) in met:
+            met_users.add(user_id, other_id)
+        else:
+            confirmed.append((user_id, other_id))
+
+    return confirmed
+
+
+def pair_users(users, met, meters):
+    """
+    Greedily pairs up the closest users first
+    users is [(user_id, location, updated_at[, profile, preferences])] for a
+    single State, met is a set of (user_id, user_id) that have already met in
+    either direction, or the MetUsersCache
+    Returns [(user_id, user_id)]
+    """
+    if not users:
+        return []
+
+    scorer = scoring.CandidateSet.from_users(users)
+
+    edges = []
+    for distance, user_id, other_id in scorer.pairs_within(meters):
+        if (user_id, other_id) not in met and (other_id, user_id) not in met:
+            edges.append((distance, user_id, other_id))
+
+    edges.sort()
+
+    paired = set()
+    pairs = []
+    for _, user_id, other_id in edges:
+        if user_id not in paired and other_id not in paired:
+            paired.update((user_id, other_id))
+            pairs.append((user_id, other_id))
+
+    return pairs
+
+
+def run_matchmaking_pass():
+    """
+    Snapshots every LOOKING user, pairs them up State by State and creates
+    all of the resulting Rundezvouses in one transaction
+    Returns the number of Rundezvouses created
+    """
+    from rundezvous.models import SiteUser, Rundezvous
+
+    looking = SiteUser.objects \
+        .filter(status=SiteUser.Status.LOOKING) \
+        .filter(location__isnull=False) \
+        .filter_by_active() \
+        .values_list('state_id', *INDEXED_FIELDS)
+
+    by_state = defaultdict(list)
+    for state_id, *user in looking:
+        by_state[state_id].append(user)
+
+    met_users.preload([user_id for users in by_state.values() for user_id, *_ in users])
+
+    pairs = []
+    for users in by_state.values():
+        pairs += pair_users(users, met_users, const.MEETUP_DISTANCE_THRESHOLD.m)
+
+    pairs = confirm_unmet(pairs)
+
+    if not pairs:
+        return 0
+
+    matched_ids = [user_id for pair in pairs for user_id in pair]
+
+    created = 0
+    with transaction.atomic():
+        users = SiteUser.objects.in_bulk(matched_ids)
+
+        for pair in pairs:
+            try:
+                with transaction.atomic():  # Savepoint, just this pair
+                    Rundezvous.create_for_users(
+                        [users[user_id] for user_id in pair]
+                    )
+            except Rundezvous.UnavailableUserError:
+                continue  # Stopped looking since the snapshot
+            else:
+                created += 1
+
+    return created
+
+
+def run_matchmaking(interval=const.MATCHMAKING_INTERVAL):
+    """Runs a matchmaking pass every interval seconds, forever"""
+    while True:
+        started = time.monotonic()
+
+        try:
+            created = run_matchmaking_pass()
+        except Exception:
+            logger.exception("Matchmaking pass failed")
+        else:
+            logger.info("Matchmaking pass created %d rundezvouses", created)
+        finally:
+            close_old_connections()
+
+        time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+
+def start_matchmaking_thread(interval=const.MATCHMAKING_INTERVAL):
+    """For single-process deployments that don't run the matchmake command"""
+    thread = threading.Thread(
+        target=run_matchmaking,
+        args=(interval,),
+        name='matchmaking',
+        daemon=True,
+    )
+    thread.start()
+
+    return thread
@@ -0,0 +1,47 @@
+# Generated by Django 2.2 on 2026-10-18 10:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def denormalize_active_rundezvous(apps, schema_editor):
+    SiteUser = apps.get_model('rundezvous', 'SiteUser')
+    UserToRundezvous = apps.get_model('rundezvous', 'UserToRundezvous')
+
+    active = UserToRundezvous.objects \
+        .filter(is_active=True) \
+        .order_by('user_id', '-rundezvous__created_at')
+
+    latest = {}
+    for utr in active:
+        if utr.user_id in latest:
+            # Only the newest can stay active under the new constraint
+            utr.is_active = False
+            utr.save(update_fields=['is_active'])
+        else:
+            latest[utr.user_id] = utr.rundezvous_id
+
+    for user_id, rundezvous_id in latest.items():
+        SiteUser.objects \
+            .filter(id=user_id) \
+            .update(active_rundezvous_id=rundezvous_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rundezvous', '0002_auto_20190616_1913'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='siteuser',
+            name='active_rundezvous',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='active_users', to='rundezvous.Rundezvous'),
+        ),
+        migrations.RunPython(denormalize_active_rundezvous, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='usertorundezvous',
+            constraint=models.UniqueConstraint(condition=models.Q(is_active=True), fields=('user',), name='one_active_rundezvous_per_user'),
+        ),
+    ]
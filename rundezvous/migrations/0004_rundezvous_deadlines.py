@@ -0,0 +1,52 @@
+# Generated by Django 2.2 on 2026-10-18 10:41
+
+from django.db import migrations, models
+from django.utils import timezone
+
+from rundezvous import const
+
+
+def materialize_deadlines(apps, schema_editor):
+    Rundezvous = apps.get_model('rundezvous', 'Rundezvous')
+
+    for rundezvous in Rundezvous.objects.all().iterator():
+        rundezvous.chat_ends_at = rundezvous.created_at + const.CHAT_TIME_LIMIT
+        rundezvous.meet_decision_ends_at = \
+            rundezvous.chat_ends_at + const.MEET_DECISION_TIME_LIMIT
+
+        if rundezvous.started_at is not None \
+                and rundezvous.expiration_seconds is not None:
+            rundezvous.expires_at = rundezvous.started_at + \
+                timezone.timedelta(seconds=rundezvous.expiration_seconds)
+
+        rundezvous.save(update_fields=[
+            'chat_ends_at',
+            'meet_decision_ends_at',
+            'expires_at',
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rundezvous', '0003_active_rundezvous'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rundezvous',
+            name='chat_ends_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='rundezvous',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='rundezvous',
+            name='meet_decision_ends_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(materialize_deadlines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 2.2 on 2026-10-18 11:03
+
+from django.db import migrations
+
+SPATIAL_COLUMNS = (
+    ('rundezvous_siteuser', 'location'),
+)
+
+
+def create_spatial_indexes(apps, schema_editor):
+    """Same as places.0004_spatial_indexes, for SiteUser.location"""
+    connection = schema_editor.connection
+
+    if not getattr(connection.ops, 'spatialite', False):
+        return  # Every other backend creates its own with the column
+
+    with connection.cursor() as cursor:
+        for table, column in SPATIAL_COLUMNS:
+            cursor.execute(
+                'SELECT spatial_index_enabled FROM geometry_columns '
+                'WHERE f_table_name = %s AND f_geometry_column = %s',
+                [table, column],
+            )
+            row = cursor.fetchone()
+
+            if row is not None and not row[0]:
+                cursor.execute('SELECT CreateSpatialIndex(%s, %s)', [table, column])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rundezvous', '0004_rundezvous_deadlines'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_spatial_indexes, migrations.RunPython.noop),
+    ]
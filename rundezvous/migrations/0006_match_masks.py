@@ -0,0 +1,46 @@
+# Generated by Django 2.2 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+from rundezvous import compatibility
+
+
+def compute_match_masks(apps, schema_editor):
+    SiteUser = apps.get_model('rundezvous', 'SiteUser')
+    Preferences = apps.get_model('rundezvous', 'Preferences')
+
+    preferences = Preferences.objects.in_bulk()
+
+    users = list(SiteUser.objects.only('id', 'gender'))
+    for user in users:
+        user_preferences = preferences.get(user.id)
+
+        user.match_profile = compatibility.profile_mask(user.gender, user_preferences)
+        user.match_preferences = compatibility.preferences_mask(user_preferences)
+
+    SiteUser.objects.bulk_update(
+        users,
+        ['match_profile', 'match_preferences'],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rundezvous', '0005_spatial_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='siteuser',
+            name='match_preferences',
+            field=models.PositiveSmallIntegerField(default=15, editable=False),
+        ),
+        migrations.AddField(
+            model_name='siteuser',
+            name='match_profile',
+            field=models.PositiveSmallIntegerField(default=10, editable=False),
+        ),
+        migrations.RunPython(compute_match_masks, migrations.RunPython.noop),
+    ]
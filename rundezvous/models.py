@@ -4,18 +4,25 @@ from django.contrib.gis.db import models as models
 from django.contrib.auth import models as auth_models
 
 from django.contrib.gis.db.models import Subquery
+from django.db import transaction
 
 from django.utils import timezone
 from django.contrib.gis import measure
+from django.contrib.gis.geos import LineString
 
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 # Rundezvous depends on Chat, Places apps
 from places import models as place_models
 from places import const as place_const
+from places import geocoding
 
+from rundezvous import compatibility
 from rundezvous import const
+from rundezvous import geofence
+from rundezvous import locations
 from rundezvous import managers
+from rundezvous import matching
 
 
 class SiteUser(auth_models.AbstractUser):
@@ -47,6 +54,15 @@ class SiteUser(auth_models.AbstractUser):
         ],
         default=FEMALE,  # Female is actually the default biological gender
     )
+    # Gender and Preferences as bitmasks, see rundezvous.compatibility
+    match_profile = models.PositiveSmallIntegerField(
+        default=compatibility.DEFAULT_PROFILE,
+        editable=False,
+    )
+    match_preferences = models.PositiveSmallIntegerField(
+        default=compatibility.DEFAULT_PREFERENCES,
+        editable=False,
+    )
     # display_color TODO: Import django-colorpicker
     reputation = models.IntegerField(
         default=0,
@@ -93,6 +109,14 @@ class SiteUser(auth_models.AbstractUser):
         ],
         default=Status.NONE,
     )
+    active_rundezvous = models.ForeignKey(
+        # Denormalized from UserToRundezvous.is_active, read on every request
+        'Rundezvous',
+        related_name='active_users',
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+    )
     rundezvouses = models.ManyToManyField(
         'Rundezvous',
         related_name='users',
@@ -109,6 +133,23 @@ class SiteUser(auth_models.AbstractUser):
     def __str__(self):
         return f"{self.email} ({self.display_name or '?'})"
 
+    # Written by rundezvous.signals with F() expressions, never from memory
+    MATCH_FIELDS = {'match_profile', 'match_preferences'}
+
+    def save(self, *args, **kwargs):
+        """A full save of an existing user leaves the match masks alone"""
+        if not self._state.adding and kwargs.get('update_fields') is None \
+                and not kwargs.get('force_insert') and not args:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.MATCH_FIELDS
+                and field.attname not in deferred
+            ]
+
+        super().save(*args, **kwargs)
+
     @property
     def latitude(self):
         return self.location.y
@@ -117,17 +158,14 @@ class SiteUser(auth_models.AbstractUser):
     def longitude(self):
         return self.location.x
 
-    @property
-    def active_rundezvous(self):
-        try:
-            return self.usertorundezvous_set.get(
-                is_active=True,
-            ).rundezvous
-        except UserToRundezvous.DoesNotExist:
-            return None
-        except UserToRundezvous.MultipleObjectsReturned:
-            # TODO: Figure out what to do here, this is bad but possible
-            raise
+    def leave_active_rundezvous(self):
+        """Deactivates the user's Rundezvous, keeping it for the record"""
+        self.usertorundezvous_set \
+            .filter(is_active=True) \
+            .update(is_active=False)
+
+        self.active_rundezvous = None
+        self.save(update_fields=['active_rundezvous'])
 
     @property
     def unmet_users(self):
@@ -136,65 +174,122 @@ class SiteUser(auth_models.AbstractUser):
             exclude(id=self.id). \
             exclude(id__in=Subquery(self.met_users.values_list('id', flat=True)))
 
-    def update_location(self, new_location):
+    def update_location(self, new_location, trajectory=None, updated_at=None):
         """
         Called by the middleware to update user's location
+        trajectory is every point since the last update, ending at new_location,
+        so that passing by the Rundezvous between updates still counts
+        The write is buffered (see rundezvous.locations), arrival isn't
         """
+        # Arrival is checked along the whole way from the last known location
+        path = [self.location] if self.location is not None else []
+        path += trajectory or [new_location]
+
         self.location = new_location
-        self.location_updated_at = timezone.now()
+        self.location_updated_at = updated_at or timezone.now()
+        self.state_id = geocoding.reverse_geocoder.get_state_id(new_location)
 
-        self.save()
+        locations.location_buffer.put(self)
+        matching.looking_users.sync(self)
 
-        if self.active_rundezvous and self.check_rundezvous_arrived():
-            self.handle_rundezvous_arrival()
+        rundezvous = self.active_rundezvous
 
-    def check_rundezvous_arrived(self):
-        """Returns whether user is within threshold of Rundezvous"""
-        # The user's location is stored in lat long (srid=4326) so it must be
-        # transformed into a coordinate system measure in meters before the
-        # distance between the two points can be calculated
-        srid = self.state.projection_srid  # The default
+        if rundezvous is None or rundezvous.landmark_id is None:
+            return  # Not running anywhere yet
 
-        location = self.location. \
-            transform(srid, clone=True)
-        landmark_location = self.active_rundezvous.landmark.location. \
-            transform(srid, clone=True)
-        distance = location.distance(landmark_location)
+        if self.check_rundezvous_arrived(rundezvous, path):
+            self.handle_rundezvous_arrival(rundezvous)
 
-        return measure.Distance(m=distance) < const.MEETUP_DISTANCE_THRESHOLD
+    def check_rundezvous_arrived(self, rundezvous=None, trajectory=None):
+        """Returns whether user is (or was) within threshold of Rundezvous"""
+        if rundezvous is None:
+            rundezvous = self.active_rundezvous
+
+        # Repeated points (standing still) don't make a line
+        vertices = [
+            point for i, point in enumerate(trajectory or [])
+            if i == 0 or point != trajectory[i - 1]
+        ]
+
+        if len(vertices) > 1:
+            path = LineString(vertices, srid=place_const.DEFAULT_SRID)
+        elif vertices:
+            path = vertices[0]
+        else:
+            path = self.location
 
-    def handle_rundezvous_arrival(self):
+        # The geofence only transforms path into a coordinate system measured
+        # in meters when it's close enough for the exact distance to matter
+        return rundezvous.arrival_geofence.contains(path)
+
+    def handle_rundezvous_arrival(self, rundezvous=None):
         """
         Should be used as a callback on location update
         """
-        self.status = self.Status.REVIEW
-        self.save()
+        if rundezvous is None:
+            rundezvous = self.active_rundezvous
 
-        active_rundezvous = self.active_rundezvous
+        self.status = self.Status.REVIEW
+        self.save(update_fields=['status'])
 
         # This will get overwritten if the next person made it
-        active_rundezvous.ended_at = timezone.now()
-        active_rundezvous.save()
+        rundezvous.ended_at = timezone.now()
+        rundezvous.save()
 
     def get_meetable_users_within(self, distance: measure.Distance):
         """
         Gets all users less than distance miles away from user
         Used to find the next user to match with
         """
-        return self.unmet_users.filter_by_active().filter(
-            location__distance_lte=(self.location, distance),
-            status=SiteUser.Status.LOOKING,
-        ).order_by_closest_to(self)
+        return self.unmet_users.filter_by_active().filter_by_compatible(self) \
+            .filter(status=SiteUser.Status.LOOKING) \
+            .order_by_closest_to(self, within=distance)
 
     def find_rundezvous_partner(self):
-        """Returns closest eligible user"""
-        partner = self. \
-            get_meetable_users_within(const.MEETUP_DISTANCE_THRESHOLD).first()
-
-        if partner is None:
+        """
+        Returns closest eligible user
+        Candidates come from the in-memory index of LOOKING users, minus the
+        ones this user has met (also kept in memory), the DB is only asked to
+        confirm that the closest ones are still meetable
+        """
+        if self.location is None:
             raise SiteUser.DoesNotExist
-        else:
-            return partner
+
+        candidates = [
+            user_id for _, user_id in matching.looking_users.nearby(
+                self.state_id,
+                self.longitude,
+                self.latitude,
+                const.MEETUP_DISTANCE_THRESHOLD.m,
+                exclude={self.id},
+                profile=self.match_profile,
+                preferences=self.match_preferences,
+            )
+            if not matching.met_users.has_met(self.id, user_id)
+        ]
+
+        for i in range(0, len(candidates), const.PARTNER_CANDIDATES):
+            chunk = candidates[i:i + const.PARTNER_CANDIDATES]
+
+            confirmed = SiteUser.objects \
+                .filter_by_active() \
+                .filter_by_compatible(self) \
+                .filter(
+                    id__in=chunk,
+                    state=self.state,
+                    status=SiteUser.Status.LOOKING,
+                ) \
+                .in_bulk()
+
+            unmet = matching.confirm_unmet([
+                (self.id, user_id) for user_id in chunk  # Still closest first
+                if user_id in confirmed
+            ])
+
+            if unmet:
+                return confirmed[unmet[0][1]]
+
+        raise SiteUser.DoesNotExist
 
     def make_meetup_decision(self, decision: bool):
         rundezvous = self.active_rundezvous
@@ -299,6 +394,23 @@ class Rundezvous(models.Model):
         ]
     )
 
+    # DEADLINES - Stored rather than computed so they can be range queried
+    chat_ends_at = models.DateTimeField(  # Written by save on creation
+        null=True,
+        blank=True,
+        db_index=True,
+    )
+    meet_decision_ends_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        db_index=True,
+    )
+    expires_at = models.DateTimeField(  # Written by start_meetup
+        null=True,
+        blank=True,
+        db_index=True,
+    )
+
     # TODO: Add archival logic
 
     def __str__(self):
@@ -310,69 +422,115 @@ class Rundezvous(models.Model):
     class RunTimeError(TimeoutError):
         pass
 
-    @property
-    def chat_ends_at(self) -> timezone.datetime:
-        return self.created_at + const.CHAT_TIME_LIMIT
+    class UnavailableUserError(Exception):
+        """Somebody was matched or stopped looking in the meantime"""
+        pass
 
-    @property
-    def meet_decision_ends_at(self) -> timezone.datetime:
-        return self.created_at + \
-               const.CHAT_TIME_LIMIT + const.MEET_DECISION_TIME_LIMIT
+    def save(self, *args, **kwargs):
+        if self.chat_ends_at is None:
+            created_at = self.created_at or timezone.now()
 
-    @property
-    def expires_at(self) -> timezone.datetime:
-        if self.landmark is not None:
-            return self.started_at + \
-                   timezone.timedelta(seconds=self.expiration_seconds)
-        else:
-            raise place_models.Landmark.DoesNotExist
+            self.chat_ends_at = created_at + const.CHAT_TIME_LIMIT
+            self.meet_decision_ends_at = \
+                self.chat_ends_at + const.MEET_DECISION_TIME_LIMIT
+
+        super().save(*args, **kwargs)
 
     @property
     def seconds_left(self) -> int:
         """This will also be computed in the GUI if I'm not insane"""
+        if self.expires_at is None:
+            raise place_models.Landmark.DoesNotExist  # Not running yet
+
         return int((self.expires_at - timezone.now()).total_seconds())
 
     @property
     def is_expired(self):
         return self.seconds_left < 0
 
+    @property
+    def arrival_geofence(self) -> geofence.ArrivalGeofence:
+        """Built by start_meetup, cached for the rest of the meetup"""
+        return geofence.arrival_geofences.get(self)
+
     @classmethod
     def create_for_users(cls, users: Iterable[SiteUser]):
         """
         Create a Rundezvous, and add all of the users to it
         This should work for any number of users, even just one
+        Costs the same four queries however many users there are, and raises
+        UnavailableUserError (creating nothing) unless all of them were
+        still LOOKING
         """
-        rundezvous = cls.objects.create()
+        users = list(users)
+        user_ids = [user.id for user in users]
 
-        for user in users:
-            user.rundezvouses.add(  # Pycharm is mistaken here
-                rundezvous,
-                through_defaults={'is_active': True},
-            )
-            user.rundezvous_status = SiteUser.Status.CHATTING
-            user.save()
+        with transaction.atomic():
+            rundezvous = cls.objects.create()
 
-    def start_meetup(self):
+            claimed = SiteUser.objects \
+                .filter(id__in=user_ids, status=SiteUser.Status.LOOKING) \
+                .update(
+                    status=SiteUser.Status.CHATTING,
+                    active_rundezvous=rundezvous,
+                )
+
+            if claimed != len(set(user_ids)):
+                raise cls.UnavailableUserError  # Rolls back the Rundezvous
+
+            UserToRundezvous.objects.bulk_create([
+                UserToRundezvous(
+                    user_id=user_id,
+                    rundezvous=rundezvous,
+                    is_active=True,
+                )
+                for user_id in user_ids
+            ])
+
+            def forget_looking_users():
+                for user_id in user_ids:
+                    matching.looking_users.discard(user_id)
+
+            transaction.on_commit(forget_looking_users)
+
+        for user in users:  # The UPDATE bypassed these instances
+            user.status = SiteUser.Status.CHATTING
+            user.active_rundezvous = rundezvous
+
+        return rundezvous
+
+    def plan_meetup(self, now=None):
         """
-        Sets the closest landmark as the destination, then starts the timer
+        Sets the closest landmark as the destination and the timer, unsaved
         """
-        if not self.users.exists():
+        user = self.users.select_related('state').first()
+        if user is None:
             raise SiteUser.DoesNotExist
 
-        users = self.users
-
-        state = users.first().state  # Assume they're all in the same state
-        midpoint = users.get_midpoint()
+        state = user.state  # Assume they're all in the same state
+        midpoint = self.users.get_midpoint()
 
         # Get closest Landmark
-        landmark = place_models.Landmark.objects.filter(state=state) \
-            .order_by_closest_to(midpoint).first()
+        candidates = place_models.Landmark.objects \
+            .closest_candidates(state, midpoint)
+        landmark = candidates[0] if candidates else None
 
         self.landmark = landmark
-        self.started_at = timezone.now()
+        self.started_at = now or timezone.now()
         self.expiration_seconds = 600  # TODO: Calculate this somehow
+        self.expires_at = self.started_at + \
+            timezone.timedelta(seconds=self.expiration_seconds)
+
+    def start_meetup(self):
+        """
+        Sets the closest landmark as the destination, then starts the timer
+        """
+        self.plan_meetup()
         self.save()
 
+        if self.landmark is not None:
+            geofence.arrival_geofences.build(self)
+
 
 class UserToRundezvous(models.Model):
     """
@@ -381,6 +539,13 @@ class UserToRundezvous(models.Model):
     """
     class Meta:
         verbose_name_plural = 'user to rundezvouses'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user'],
+                condition=models.Q(is_active=True),
+                name='one_active_rundezvous_per_user',
+            ),
+        ]
 
     user = models.ForeignKey(
         SiteUser,
@@ -0,0 +1,140 @@
+"""
+On-demand profiling of production requests with a stack sampler
+A thread looks at the request's stack every few milliseconds instead of
+tracing every call, so a profiled request runs at nearly full speed
+
+Profiles are written in the collapsed stack format, one line per stack:
+
+    django.core.handlers.base._get_response;rundezvous.views.rundezvous.waiting_room 42
+
+which flamegraph.pl and speedscope read directly
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+
+from collections import Counter
+
+from django.conf import settings
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_PARAM = 'profile'
+EXTENSION = '.collapsed'
+
+
+def frame_name(frame):
+    return f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_name}"
+
+
+class StackSampler:
+    """Counts the collapsed stacks of one thread, sampled every interval"""
+    def __init__(self, thread_id=None, interval=None):
+        if interval is None:
+            interval = settings.PROFILING_INTERVAL / 1000
+
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+
+        names = []
+        while frame is not None:
+            names.append(frame_name(frame))
+            frame = frame.f_back
+
+        if names:
+            self.stacks[';'.join(reversed(names))] += 1  # Root first
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run,
+            name='stack-sampler',
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def write_collapsed(stacks, f):
+    for stack, count in sorted(stacks.items()):
+        f.write(f"{stack} {count}\n")
+
+
+def read_collapsed(f):
+    """Returns a Counter of the stacks in a collapsed file"""
+    stacks = Counter()
+
+    for line in f:
+        stack, _, count = line.rstrip('\n').rpartition(' ')
+        if stack:
+            stacks[stack] += int(count)
+
+    return stacks
+
+
+def profile_path(url_name, user_id):
+    """Tagged with the URL name and user, see merge_profiles"""
+    return os.path.join(
+        settings.PROFILING_DIR,
+        f"{url_name or 'unknown'}.{user_id or 'anonymous'}."
+        f"{int(time.time() * 1000000)}{EXTENSION}",
+    )
+
+
+def should_profile(request) -> bool:
+    """Staff can ask for a profile, everybody else is sampled at random"""
+    if request.user.is_staff and (
+        request.META.get(PROFILE_HEADER) == '1' or
+        request.GET.get(PROFILE_PARAM) == '1'
+    ):
+        return True
+
+    rate = settings.PROFILING_SAMPLE_RATE
+    return rate > 0 and random.random() < rate
+
+
+class ProfilingMiddleware:
+    """Must come after AuthenticationMiddleware, staff are told by request.user"""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not should_profile(request):
+            return self.get_response(request)
+
+        with StackSampler() as sampler:
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        path = profile_path(
+            match.url_name if match is not None else None,
+            request.user.id,
+        )
+
+        os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+        with open(path, 'w') as f:
+            write_collapsed(sampler.stacks, f)
+
+        return response
@@ -0,0 +1,285 @@
+"""
+Fires Rundezvous deadlines as they pass instead of when somebody happens to
+make a request
+Pending deadlines sit in a hierarchical timer wheel, so scheduling is O(1) and
+each tick only looks at the deadlines due in it. Everything due in the same
+tick is handled with a few bulk queries, however many Rundezvouses there are
+"""
+
+import logging
+import threading
+import time
+
+from collections import defaultdict
+
+from django.db import transaction, close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from rundezvous import const
+from rundezvous import geofence
+
+logger = logging.getLogger(__name__)
+
+DECIDE = 'decide'  # The meetup decision is over: RUNNING, or back to NONE
+EXPIRE = 'expire'  # The meetup ran out of time: everybody left goes to REVIEW
+
+
+class TimerWheel:
+    """
+    Hierarchical timer wheel of items due at some tick
+    Level 0 has a slot per tick, each level above a slot per whole turn of
+    the level below. Items cascade down a level as their slot comes up, and
+    fire from level 0
+    """
+    def __init__(self, start_tick, slots=const.SCHEDULER_WHEEL_SLOTS,
+                 levels=const.SCHEDULER_WHEEL_LEVELS):
+        self.slots = slots
+        self.levels = levels
+        self.current = start_tick  # Next tick to fire
+
+        self._wheels = [[[] for _ in range(slots)] for _ in range(levels)]
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def _place(self, due, item):
+        due = max(due, self.current)  # Overdue fires on the next tick
+        delta = due - self.current
+
+        for level in range(self.levels):
+            span = self.slots ** level
+
+            if delta < span * self.slots or level == self.levels - 1:
+                slot = (due // span) % self.slots
+                self._wheels[level][slot].append((due, item))
+                return
+
+    def schedule(self, due, item):
+        with self._lock:
+            self._place(due, item)
+            self.count += 1
+
+    def _cascade(self):
+        """Moves the items in the slots coming up into the levels below"""
+        top = 0
+        while top + 1 < self.levels and \
+                self.current % self.slots ** (top + 1) == 0:
+            top += 1
+
+        for level in range(top, 0, -1):
+            span = self.slots ** level
+            slot = (self.current // span) % self.slots
+
+            bucket = self._wheels[level][slot]
+            self._wheels[level][slot] = []
+
+            for due, item in bucket:
+                self._place(due, item)
+
+    def advance(self, tick):
+        """Returns [(tick, [item])] of every tick up to and including tick"""
+        fired = []
+
+        with self._lock:
+            while self.current <= tick:
+                self._cascade()
+
+                slot = self.current % self.slots
+                bucket = self._wheels[0][slot]
+                self._wheels[0][slot] = []
+
+                if bucket:
+                    fired.append((self.current, [item for _, item in bucket]))
+                    self.count -= len(bucket)
+
+                self.current += 1
+
+        return fired
+
+
+def to_tick(when, tick=const.SCHEDULER_TICK):
+    """Rounded up, so nothing fires before its deadline"""
+    return -int(-when.timestamp() // tick)
+
+
+def decide(rundezvous_ids, now):
+    """
+    Starts the meetups everybody agreed to, and sends everybody else home
+    Returns the Rundezvouses started, so their expiry can be scheduled
+    """
+    from rundezvous.models import SiteUser, Rundezvous, UserToRundezvous
+
+    with transaction.atomic():
+        due = list(
+            Rundezvous.objects
+            .filter(id__in=rundezvous_ids, landmark__isnull=True)
+            .filter_by_open()
+            .filter(meet_decision_ends_at__lte=now)
+            .values_list('id', flat=True)
+        )
+
+        agreed, undecided = set(), set()
+        for rundezvous_id, decision in UserToRundezvous.objects \
+                .filter(rundezvous_id__in=due) \
+                .values_list('rundezvous_id', 'meetup_decision'):
+            (agreed if decision else undecided).add(rundezvous_id)
+        agreed -= undecided  # Everybody has to want to meet
+
+        # Finding each landmark still takes a few queries per Rundezvous
+        started = []
+        for rundezvous in Rundezvous.objects.filter(id__in=agreed):
+            rundezvous.plan_meetup(now)
+
+            if rundezvous.landmark_id is not None:
+                started.append(rundezvous)
+
+        Rundezvous.objects.bulk_update(
+            started,
+            ['landmark', 'started_at', 'expiration_seconds', 'expires_at'],
+        )
+
+        started_ids = {rundezvous.id for rundezvous in started}
+        declined = [i for i in due if i not in started_ids]
+
+        SiteUser.objects \
+            .filter(active_rundezvous_id__in=started_ids) \
+            .filter(status=SiteUser.Status.CHATTING) \
+            .update(status=SiteUser.Status.RUNNING)
+
+        if declined:
+            Rundezvous.objects.filter(id__in=declined).end(now)
+            UserToRundezvous.objects \
+                .filter(rundezvous_id__in=declined) \
+                .update(is_active=False)
+            SiteUser.objects \
+                .filter(active_rundezvous_id__in=declined) \
+                .update(status=SiteUser.Status.NONE, active_rundezvous=None)
+
+    for rundezvous in started:
+        geofence.arrival_geofences.build(rundezvous)
+
+    return started
+
+
+def expire(rundezvous_ids, now):
+    """Ends the meetups, whoever hasn't arrived yet goes to review"""
+    from rundezvous.models import SiteUser, Rundezvous
+
+    with transaction.atomic():
+        due = list(
+            Rundezvous.objects
+            .filter(id__in=rundezvous_ids, expires_at__lte=now)
+            .values_list('id', flat=True)
+        )
+
+        Rundezvous.objects.filter(id__in=due).end(now)
+        SiteUser.objects \
+            .filter(active_rundezvous_id__in=due) \
+            .filter(status=SiteUser.Status.RUNNING) \
+            .update(status=SiteUser.Status.REVIEW)
+
+    for rundezvous_id in due:
+        geofence.arrival_geofences.discard(rundezvous_id)
+
+
+class LifecycleScheduler:
+    def __init__(self, tick=const.SCHEDULER_TICK):
+        self.tick = tick
+        self.wheel = TimerWheel(to_tick(timezone.now(), tick))
+
+        self._last_id = 0
+        self._last_started_at = None
+
+    def schedule(self, rundezvous_id, landmark_id, meet_decision_ends_at,
+                 expires_at):
+        if landmark_id is None and meet_decision_ends_at is not None:
+            self.wheel.schedule(
+                to_tick(meet_decision_ends_at, self.tick),
+                (DECIDE, rundezvous_id),
+            )
+        elif expires_at is not None:
+            self.wheel.schedule(
+                to_tick(expires_at, self.tick),
+                (EXPIRE, rundezvous_id),
+            )
+
+    def poll(self):
+        """Schedules Rundezvouses created or started since the last poll"""
+        from rundezvous.models import Rundezvous
+
+        if self._last_id == 0:
+            new = Q(ended_at__isnull=True)  # First poll, load everything
+        else:
+            new = Q(id__gt=self._last_id)
+            if self._last_started_at is not None:
+                new |= Q(started_at__gt=self._last_started_at)
+
+        pending = Rundezvous.objects.filter(new).values_list(
+            'id',
+            'landmark_id',
+            'meet_decision_ends_at',
+            'expires_at',
+            'started_at',
+        )
+
+        for rundezvous_id, landmark_id, decision_ends_at, expires_at, \
+                started_at in pending:
+            self.schedule(rundezvous_id, landmark_id, decision_ends_at, expires_at)
+
+            self._last_id = max(self._last_id, rundezvous_id)
+            if started_at is not None and (
+                self._last_started_at is None or
+                started_at > self._last_started_at
+            ):
+                self._last_started_at = started_at
+
+    def run_pending(self, now=None):
+        """Fires everything due by now, returns how many deadlines fired"""
+        now = now or timezone.now()
+        fired = 0
+
+        for _, items in self.wheel.advance(int(now.timestamp() // self.tick)):
+            by_kind = defaultdict(list)
+            for kind, rundezvous_id in items:
+                by_kind[kind].append(rundezvous_id)
+
+            if by_kind[DECIDE]:
+                for rundezvous in decide(by_kind[DECIDE], now):
+                    self.schedule(rundezvous.id, rundezvous.landmark_id,
+                                  None, rundezvous.expires_at)
+            if by_kind[EXPIRE]:
+                expire(by_kind[EXPIRE], now)
+
+            fired += len(items)
+
+        return fired
+
+    def run(self):
+        """Polls and fires every tick, forever"""
+        while True:
+            started = time.monotonic()
+
+            try:
+                self.poll()
+                fired = self.run_pending()
+            except Exception:
+                logger.exception("Lifecycle scheduler tick failed")
+            else:
+                if fired:
+                    logger.info("Fired %d rundezvous deadlines", fired)
+            finally:
+                close_old_connections()
+
+            time.sleep(max(0.0, self.tick - (time.monotonic() - started)))
+
+
+def start_scheduler_thread(tick=const.SCHEDULER_TICK):
+    """For single-process deployments that don't run the schedule command"""
+    thread = threading.Thread(
+        target=LifecycleScheduler(tick).run,
+        name='lifecycle-scheduler',
+        daemon=True,
+    )
+    thread.start()
+
+    return thread
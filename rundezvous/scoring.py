@@ -0,0 +1,125 @@
+"""
+Vectorized distances between LOOKING users
+A State's users are loaded into contiguous float64 arrays sorted by latitude,
+so everybody within range of a user is one contiguous slice and their
+distances (and compatibility) are a single NumPy operation over it
+"""
+
+import numpy as np
+
+from places import const as place_const
+from places import geo
+
+from rundezvous import compatibility
+
+
+def haversine(lon, lat, lons, lats):
+    """Great-circle distances in meters from (lon, lat) to every (lons, lats)"""
+    lon, lat = np.radians(lon), np.radians(lat)
+    lons, lats = np.radians(lons), np.radians(lats)
+
+    a = np.sin((lats - lat) / 2) ** 2 + \
+        np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+
+    return 2 * place_const.EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class CandidateSet:
+    def __init__(self, ids, lons, lats, profiles=None, preferences=None):
+        order = np.argsort(lats, kind='stable')
+
+        self.ids = np.asarray(ids, dtype=np.int64)[order]
+        self.lons = np.asarray(lons, dtype=np.float64)[order]
+        self.lats = np.asarray(lats, dtype=np.float64)[order]
+
+        if profiles is None:
+            profiles = np.full(len(order), compatibility.DEFAULT_PROFILE)
+        if preferences is None:
+            preferences = np.full(len(order), compatibility.DEFAULT_PREFERENCES)
+
+        self.profiles = np.asarray(profiles, dtype=np.int64)[order]
+        self.preferences = np.asarray(preferences, dtype=np.int64)[order]
+
+    @classmethod
+    def from_users(cls, users):
+        """users is [(user_id, location, updated_at[, profile, preferences])]"""
+        users = list(users)
+
+        has_masks = all(len(user) == 5 for user in users)
+
+        return cls(
+            [user[0] for user in users],
+            [user[1].x for user in users],
+            [user[1].y for user in users],
+            [user[3] for user in users] if has_masks else None,
+            [user[4] for user in users] if has_masks else None,
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _window(self, lat, meters):
+        """Slice of the users close enough in latitude to be within meters"""
+        _, min_lat, _, max_lat = geo.bbox_around(0.0, lat, meters)
+
+        return slice(
+            np.searchsorted(self.lats, min_lat, side='left'),
+            np.searchsorted(self.lats, max_lat, side='right'),
+        )
+
+    def _compatible(self, window, profile, preferences):
+        return (self.preferences[window] & profile == profile) & \
+            (preferences & self.profiles[window] == self.profiles[window])
+
+    def nearest(self, lon, lat, k, meters, exclude=(), profile=None,
+                preferences=None):
+        """Returns up to k [(distance, user_id)] within meters, closest first"""
+        window = self._window(lat, meters)
+
+        distances = haversine(lon, lat, self.lons[window], self.lats[window])
+        keep = distances <= meters
+
+        if profile is not None:
+            keep &= self._compatible(window, profile, preferences)
+        if exclude:
+            keep &= ~np.isin(self.ids[window], list(exclude))
+
+        ids, distances = self.ids[window][keep], distances[keep]
+
+        if len(ids) > k:  # Partial sort, only the k closest are ordered
+            closest = np.argpartition(distances, k)[:k]
+            ids, distances = ids[closest], distances[closest]
+
+        order = np.argsort(distances, kind='stable')
+        return list(zip(distances[order].tolist(), ids[order].tolist()))
+
+    def pairs_within(self, meters):
+        """
+        Returns [(distance, user_id, user_id)] of every compatible pair within
+        meters of each other, smaller id first
+        """
+        pairs = []
+
+        for i in range(len(self.ids)):
+            # Users further along in latitude, so every pair is seen once
+            window = self._window(self.lats[i], meters)
+            window = slice(i + 1, window.stop)
+
+            distances = haversine(
+                self.lons[i], self.lats[i],
+                self.lons[window], self.lats[window],
+            )
+            keep = (distances <= meters) & self._compatible(
+                window,
+                self.profiles[i],
+                self.preferences[i],
+            )
+
+            user_id = int(self.ids[i])
+            for distance, other_id in zip(
+                distances[keep].tolist(),
+                self.ids[window][keep].tolist(),
+            ):
+                pairs.append((distance, *sorted((user_id, other_id))))
+
+        return pairs
@@ -0,0 +1,79 @@
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from rundezvous import compatibility
+from rundezvous import models
+from rundezvous import matching
+
+
+@receiver(pre_save, sender=models.SiteUser)
+def update_match_profile(sender, instance, **kwargs):
+    """New users start with the gender bit, the activity bit follows Preferences"""
+    if instance._state.adding:
+        instance.match_profile = \
+            compatibility.GENDER_BITS[instance.gender] | \
+            (instance.match_profile & compatibility.ACTIVITIES)
+
+
+@receiver(post_save, sender=models.SiteUser)
+def save_match_profile(sender, instance, created, update_fields, **kwargs):
+    """
+    SiteUser.save never writes the masks of an existing user, so the gender bit
+    is set in place and the activity bit written by Preferences is kept
+    """
+    if created or update_fields is None or 'gender' not in update_fields:
+        return
+
+    models.SiteUser.objects.filter(id=instance.id).update(
+        match_profile=F('match_profile')
+        .bitand(compatibility.ACTIVITIES)
+        .bitor(compatibility.GENDER_BITS[instance.gender]),
+    )
+    instance.refresh_from_db(fields=list(models.SiteUser.MATCH_FIELDS))
+
+
+@receiver(post_save, sender=models.SiteUser)
+def sync_looking_user(sender, instance, **kwargs):
+    """Status changes and location updates both go through save"""
+    matching.looking_users.sync(instance)
+
+
+@receiver(post_delete, sender=models.SiteUser)
+def discard_looking_user(sender, instance, **kwargs):
+    matching.looking_users.discard(instance.id)
+
+
+@receiver(post_save, sender=models.Review)
+def add_met_users(sender, instance, created, **kwargs):
+    if created:
+        matching.met_users.add(instance.reviewer_id, instance.reviewed_id)
+
+
+@receiver(post_delete, sender=models.Review)
+def discard_met_users(sender, instance, **kwargs):
+    matching.met_users.discard(instance.reviewer_id, instance.reviewed_id)
+
+
+def update_match_preferences(user_id, preferences):
+    activity = compatibility.activity(preferences)
+
+    models.SiteUser.objects.filter(id=user_id).update(
+        match_profile=F('match_profile')
+        .bitand(compatibility.ALL_GENDERS)
+        .bitor(activity),
+        match_preferences=compatibility.preferences_mask(preferences),
+    )
+
+    if user_id in matching.looking_users:
+        matching.looking_users.sync(models.SiteUser.objects.get(id=user_id))
+
+
+@receiver(post_save, sender=models.Preferences)
+def save_match_preferences(sender, instance, **kwargs):
+    update_match_preferences(instance.user_id, instance)
+
+
+@receiver(post_delete, sender=models.Preferences)
+def reset_match_preferences(sender, instance, **kwargs):
+    update_match_preferences(instance.user_id, None)
@@ -19,35 +19,52 @@ function ajax_form(selector, callback)
     });
 }
 
-function load_message(id)
+function check_for_messages(wait)
 {
+    // Long polling, the server holds the request until a message arrives
+    // TODO: Use channels / RabbitMQ, etc. something besides polling
+    if (wait === undefined)
+        wait = 25;  // Seconds, the server caps this
+
+    let last_message_id = $('.message').last().data('message-id') || 0;
+
     $.ajax({
-        url: '/chat/message/' + id,
+        url: '/run/chatroom/new_messages/' + last_message_id,
+        data: {wait: wait, format: 'html'},
         type: 'GET',
         success: function (data) {
-            $('#messages-list').append(data)
+            // Every new message, already rendered, in one response
+            let container = $('#messages-container');
+            $(data).filter('li').each(function () {
+                // Your own messages may already be there from the form
+                if ($('#' + this.id).length === 0)
+                    $('#messages-list').append(this);
+            });
+            container.scrollTop(container.prop("scrollHeight"));
+            check_for_messages(wait);
+        },
+        error: function () {
+            // Don't hammer the server while it's having trouble
+            setTimeout(() => check_for_messages(wait), 5000);
         }
     });
 }
 
-function check_for_messages(timeout)
+function stream_messages(url, user_id)
 {
-    // TODO: Use long polling, channels / RabbitMQ, etc. something besides polling
-    if (timeout === undefined)
-        timeout = 1000;  // One second by default
+    // Server-sent events, the browser reconnects by itself with Last-Event-ID
+    let last_message_id = $('.message').last().data('message-id') || 0;
+    let source = new EventSource(url + '?last_message_id=' + last_message_id);
 
-    // Eventually do this asynchronously
-    last_message_id = $('.message').last().data('message-id');
+    source.addEventListener('message', function (event) {
+        let message = JSON.parse(event.data);
 
-    $.ajax({
-        url: '/chat/chatroom/new_messages/' + last_message_id,
-        type: 'GET',
-        success: function (data) {
-            for (let message_id in data.message_ids) {
-                load_message(data.message_ids[message_id]);
-            }
-        }
-    });
+        // The sender already has their own messages from the form response
+        if (message.sent_by === user_id || $('#message' + message.id).length)
+            return;
 
-    setTimeout(() => check_for_messages(timeout), timeout);
+        let container = $('#messages-container');
+        $('#messages-list').append(message.html);
+        container.scrollTop(container.prop("scrollHeight"));
+    });
 }
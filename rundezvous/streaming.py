@@ -0,0 +1,221 @@
+"""
+Server-sent event streams of the messages sent to a Rundezvous room
+Messages are rendered once by the sender's request and published through the
+broker, so open streams never touch the database after they start
+"""
+
+import asyncio
+import json
+import types
+
+from importlib import import_module
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from django.contrib import auth
+from django.db import connection
+from django.http.cookie import parse_cookie
+from django.shortcuts import reverse
+from django.template.loader import render_to_string
+
+from rundezvous import const
+from rundezvous import broker
+
+KEEPALIVE = ': keepalive\n\n'
+
+
+def render_message(message) -> dict:
+    """The published form of a ChatMessage, rendered for the other users"""
+    return {
+        'id': message.id,
+        'sent_by': message.sent_by_id,
+        'html': render_to_string(
+            'rundezvous/chatroom/message.html',
+            {'message': message, 'user': None},
+        ),
+    }
+
+
+def format_event(message: dict) -> str:
+    return f"id: {message['id']}\nevent: message\ndata: {json.dumps(message)}\n\n"
+
+
+def missed_messages(room_id, last_message_id):
+    """Messages sent before the stream was opened, for reconnecting clients"""
+    from rundezvous.models import ChatMessage
+
+    messages = ChatMessage.objects \
+        .filter(room_id=room_id, id__gt=last_message_id) \
+        .select_related('sent_by')
+
+    return [render_message(message) for message in messages]
+
+
+def stream_room(room_id, last_message_id):
+    """Yields the events of a room forever, for StreamingHttpResponse"""
+    channel = broker.room_channel(room_id)
+
+    # Subscribe first so nothing slips between the query and the stream
+    with broker.get_broker().subscribe(channel) as subscription:
+        for message in missed_messages(room_id, last_message_id):
+            last_message_id = message['id']
+            yield format_event(message)
+
+        while True:
+            try:
+                message = subscription.get(timeout=const.STREAM_KEEPALIVE)
+            except broker.SubscriptionClosed:
+                return  # The client reconnects with Last-Event-ID
+
+            if message is None:
+                yield KEEPALIVE
+            elif message['id'] > last_message_id:
+                last_message_id = message['id']
+                yield format_event(message)
+
+
+def _room_for_session(session_key):
+    """Same authentication as a normal request, returns the room id or None"""
+    try:
+        store = import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+        user = auth.get_user(types.SimpleNamespace(session=store))
+
+        if user.is_anonymous:
+            return None
+
+        room = user.active_rundezvous
+        return room.id if room is not None else None
+    finally:
+        connection.close()  # This runs on an executor thread
+
+
+def _missed_messages(room_id, last_message_id):
+    try:
+        return missed_messages(room_id, last_message_id)
+    finally:
+        connection.close()
+
+
+class ChatStreamApplication:
+    """
+    ASGI application serving the chat stream, passing everything else on
+    An open stream is just a parked coroutine, so one worker can hold
+    thousands of them
+    """
+    def __init__(self, application=None):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == reverse('chat-stream'):
+            await self.stream(scope, receive, send)
+        elif self.application is not None:
+            await self.application(scope, receive, send)
+        else:
+            await self.respond(send, 404, b"Not found")
+
+    @staticmethod
+    async def respond(send, status, body):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'text/plain')],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    @staticmethod
+    def last_message_id(scope, headers):
+        query = parse_qs(scope.get('query_string', b'').decode())
+
+        last_message_id = headers.get(b'last-event-id', b'').decode() or \
+            query.get('last_message_id', ['0'])[0]
+
+        try:
+            return int(last_message_id)
+        except ValueError:
+            return 0
+
+    async def stream(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+
+        headers = dict(scope['headers'])
+        cookies = parse_cookie(headers.get(b'cookie', b'').decode('latin-1'))
+
+        room_id = await loop.run_in_executor(
+            None,
+            _room_for_session,
+            cookies.get(settings.SESSION_COOKIE_NAME),
+        )
+        if room_id is None:
+            await self.respond(send, 404, b"You are not in any chatroom")
+            return
+
+        last_message_id = self.last_message_id(scope, headers)
+
+        subscription = broker.get_broker().subscribe_async(
+            broker.room_channel(room_id),
+            loop,
+        )
+        disconnected = asyncio.ensure_future(self.wait_for_disconnect(receive))
+
+        try:
+            missed = await loop.run_in_executor(
+                None,
+                _missed_messages,
+                room_id,
+                last_message_id,
+            )
+
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [
+                    (b'content-type', b'text/event-stream'),
+                    (b'cache-control', b'no-cache'),
+                ],
+            })
+
+            for message in missed:
+                last_message_id = message['id']
+                await self.send_event(send, format_event(message))
+
+            while True:
+                getter = asyncio.ensure_future(
+                    subscription.get(timeout=const.STREAM_KEEPALIVE)
+                )
+                await asyncio.wait(
+                    {getter, disconnected},
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+
+                if disconnected.done():
+                    getter.cancel()
+                    return
+
+                try:
+                    message = getter.result()
+                except broker.SubscriptionClosed:
+                    break  # The client reconnects with Last-Event-ID
+
+                if message is None:
+                    await self.send_event(send, KEEPALIVE)
+                elif message['id'] > last_message_id:
+                    last_message_id = message['id']
+                    await self.send_event(send, format_event(message))
+
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            subscription.close()
+            disconnected.cancel()
+
+    @staticmethod
+    async def send_event(send, event):
+        await send({
+            'type': 'http.response.body',
+            'body': event.encode(),
+            'more_body': True,
+        })
+
+    @staticmethod
+    async def wait_for_disconnect(receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
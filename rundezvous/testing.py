@@ -0,0 +1,48 @@
+"""
+Test helpers for keeping the number of queries per view in check
+A view that goes over its budget fails the suite, so N+1 regressions are
+caught when they're introduced
+"""
+
+from contextlib import contextmanager
+
+from django.shortcuts import reverse
+
+from rundezvous import instrumentation
+
+# Most queries a request to each URL name may make, including the session
+# and user lookups, once the in-process caches are warm
+QUERY_BUDGETS = {
+    'update-location': 5,
+    'update-location-batch': 5,
+    'new-messages': 3,
+    'rundezvous-router': 2,
+    'state': 5,
+}
+
+
+class QueryBudgetMixin:
+    """For TestCases, checks requests against QUERY_BUDGETS"""
+    query_budgets = QUERY_BUDGETS
+
+    @contextmanager
+    def assertQueryBudget(self, url_name, budget=None):
+        if budget is None:
+            budget = self.query_budgets[url_name]
+
+        with instrumentation.instrument() as stats:
+            yield stats
+
+        if stats.queries > budget:
+            self.fail(
+                f"{url_name} made {stats.queries} queries, its budget is "
+                f"{budget}:\n" + '\n'.join(sql for sql, _ in stats.sql)
+            )
+
+    def request_within_budget(self, method, url_name, *args, budget=None,
+                              url_kwargs=None, **kwargs):
+        """Requests url_name with self.client, failing if over budget"""
+        url = reverse(url_name, kwargs=url_kwargs)
+
+        with self.assertQueryBudget(url_name, budget):
+            return getattr(self.client, method)(url, *args, **kwargs)
@@ -1,10 +1,40 @@
-from django.test import TestCase
+import json
+import os
+import socket
+import struct
+import tempfile
+import threading
+import time
+
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection, transaction, IntegrityError
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
 from django.shortcuts import reverse
 
-from django.contrib.gis.geos import Point
+from django.utils import timezone
+
+from django.contrib.gis.geos import Point, LineString
 
+from places import models as place_models
+
+from rundezvous import compatibility
+from rundezvous import const
 from rundezvous import models
+from rundezvous import broker
+from rundezvous import events
+from rundezvous import geofence
+from rundezvous import instrumentation
+from rundezvous import locations
+from rundezvous import matching
+from rundezvous import profiling
+from rundezvous import scheduler
+from rundezvous import scoring
+from rundezvous import streaming
+from rundezvous import testing
 
 
 class UserTestCase(TestCase):
@@ -55,3 +85,970 @@ class TestUserLocationUpdateView(UserTestCase):
 
         # User should be redirected to the location_required page
         self.assertTemplateUsed(response, 'rundezvous/location_required.html')
+
+
+@override_settings(LOCATION_FLUSH_INTERVAL=60 * 1000, LOCATION_FLUSH_SIZE=2)
+class TestLocationBuffer(UserTestCase):
+    def setUp(self):
+        super().setUp()
+        locations.location_buffer.flush()  # Restarts the flush interval
+
+    def tearDown(self):
+        locations.location_buffer.flush()
+
+    def test_location_is_written_on_flush(self):
+        self.user.update_location(Point(37.623664172, 55.756496974))
+
+        self.assertEqual(self.user.latitude, 46.7316913)  # Not written yet
+
+        self.assertEqual(locations.location_buffer.flush(), 1)
+        self.assertEqual(self.user.latitude, 55.756496974)
+
+    def test_buffer_flushes_when_full(self):
+        other = models.SiteUser.objects.create(
+            username='other',
+            email='other@example.com',
+        )
+
+        self.user.update_location(Point(37.623664172, 55.756496974))
+        other.update_location(Point(37.623664172, 55.756496974))
+
+        self.assertEqual(self.user.latitude, 55.756496974)
+        self.assertEqual(locations.location_buffer.get(other.id), None)
+
+    def test_failed_flush_keeps_locations_pending(self):
+        buffer = locations.LocationBuffer()
+        buffer.fields = ['no_such_field']  # Makes bulk_update raise
+        user = self.user
+
+        with override_settings(LOCATION_FLUSH_SIZE=1), \
+                self.assertLogs('rundezvous.locations', 'ERROR'):
+            buffer.put(user)  # Doesn't raise into the request
+
+        self.assertIsNotNone(buffer.get(user.id))
+        buffer._pending.clear()
+
+
+class TestFindRundezvousPartner(TestCase):
+    def setUp(self):
+        matching.looking_users.clear()
+        matching.met_users.clear()
+
+        self.user = self.make_user('seeker', Point(-117.1701676, 46.7316913))
+
+    @staticmethod
+    def make_user(username, location, status=models.SiteUser.Status.LOOKING):
+        return models.SiteUser.objects.create(
+            username=username,
+            email=f'{username}@example.com',
+            location=location,
+            location_updated_at=timezone.now(),
+            status=status,
+        )
+
+    def test_closest_looking_user_is_found(self):
+        self.make_user('far', Point(-117.1701676, 46.7346913))  # ~330m
+        near = self.make_user('near', Point(-117.1701676, 46.7326913))  # ~110m
+
+        self.assertEqual(self.user.find_rundezvous_partner(), near)
+
+    def test_users_out_of_range_or_not_looking_are_ignored(self):
+        self.make_user('distant', Point(-117.1701676, 46.8316913))  # ~11km
+        self.make_user(
+            'busy',
+            Point(-117.1701676, 46.7326913),
+            status=models.SiteUser.Status.CHATTING,
+        )
+
+        with self.assertRaises(models.SiteUser.DoesNotExist):
+            self.user.find_rundezvous_partner()
+
+    def test_user_who_stops_looking_leaves_index(self):
+        partner = self.make_user('partner', Point(-117.1701676, 46.7326913))
+
+        partner.status = models.SiteUser.Status.NONE
+        partner.save()
+
+        with self.assertRaises(models.SiteUser.DoesNotExist):
+            self.user.find_rundezvous_partner()
+
+    def test_index_reloads_states_changed_elsewhere(self):
+        index = matching.LookingUserIndex(ttl=0)
+        index.nearby(None, -117.1701676, 46.7316913, 800)
+
+        # Like users changed by another process, no signal reaches index
+        models.SiteUser.objects.filter(id=self.user.id).update(
+            status=models.SiteUser.Status.CHATTING,
+        )
+        models.SiteUser.objects.bulk_create([models.SiteUser(
+            username='elsewhere',
+            email='elsewhere@example.com',
+            location=Point(-117.1701676, 46.7326913),
+            location_updated_at=timezone.now(),
+            status=models.SiteUser.Status.LOOKING,
+        )])
+        elsewhere = models.SiteUser.objects.get(username='elsewhere')
+
+        self.assertEqual(
+            [user_id for _, user_id in index.nearby(None, -117.1701676, 46.7316913, 800)],
+            [elsewhere.id],
+        )
+
+    def test_users_already_met_are_skipped(self):
+        met = self.make_user('ex', Point(-117.1701676, 46.7326913))
+        other = self.make_user('other', Point(-117.1701676, 46.7346913))
+
+        models.Review.objects.create(reviewer=met, reviewed=self.user)
+
+        self.assertTrue(matching.met_users.has_met(self.user.id, met.id))
+        self.assertEqual(self.user.find_rundezvous_partner(), other)
+
+    def test_stale_met_users_cache_is_confirmed(self):
+        met = self.make_user('ex', Point(-117.1701676, 46.7326913))
+        matching.met_users.preload([self.user.id])
+
+        # Like a review written by another process, no signal reaches here
+        models.Review.objects.bulk_create([
+            models.Review(reviewer=self.user, reviewed=met),
+        ])
+
+        with self.assertRaises(models.SiteUser.DoesNotExist):
+            self.user.find_rundezvous_partner()
+        self.assertTrue(matching.met_users.has_met(met.id, self.user.id))
+
+    def test_met_users_preload_is_chunked(self):
+        cache = matching.MetUsersCache(size=5000)
+        user_ids = list(range(1, 3001))  # Past SQLite's 999 parameters
+
+        cache.preload(user_ids)
+
+        self.assertEqual(len(cache.get(3000)), 0)
+
+    def test_confirm_unmet_is_chunked(self):
+        pairs = [(i, i + 1) for i in range(1, 2001, 2)]
+
+        self.assertEqual(matching.confirm_unmet(pairs), pairs)
+
+    def test_met_users_cache_stays_sorted(self):
+        cache = matching.MetUsersCache()
+        cache.preload([self.user.id])
+
+        for other_id in (50, 7, 21):
+            cache.add(self.user.id, other_id)
+
+        self.assertEqual(list(cache.get(self.user.id)), [7, 21, 50])
+
+
+class TestCompatibility(TestCase):
+    @staticmethod
+    def make_user(username, gender, **preferences):
+        user = models.SiteUser.objects.create(
+            username=username,
+            email=f'{username}@example.com',
+            gender=gender,
+        )
+        models.Preferences.objects.create(user=user, **preferences)
+
+        user.refresh_from_db()
+        return user
+
+    def test_masks_follow_preferences(self):
+        user = self.make_user('him', models.SiteUser.MALE, females=True, hookups=True)
+
+        self.assertEqual(
+            user.match_profile,
+            compatibility.MALE | compatibility.HOOKUPS,
+        )
+        self.assertEqual(
+            user.match_preferences,
+            compatibility.FEMALE | compatibility.HOOKUPS,
+        )
+
+    def test_gender_change_updates_profile(self):
+        user = self.make_user('them', models.SiteUser.MALE, hookups=True)
+
+        user.gender = models.SiteUser.OTHER
+        user.save(update_fields=['gender'])
+        user.refresh_from_db()
+
+        self.assertEqual(
+            user.match_profile,
+            compatibility.OTHER | compatibility.HOOKUPS,
+        )
+
+    def test_stale_save_keeps_preferences(self):
+        user = self.make_user('them', models.SiteUser.MALE)
+        stale = models.SiteUser.objects.get(id=user.id)
+
+        models.Preferences.objects.filter(user=user).delete()
+        models.Preferences.objects.create(user=user, hookups=True)
+        stale.gender = models.SiteUser.OTHER
+        stale.save()
+        user.refresh_from_db()
+
+        self.assertEqual(
+            user.match_profile,
+            compatibility.OTHER | compatibility.HOOKUPS,
+        )
+        self.assertEqual(stale.match_profile, user.match_profile)
+
+    def test_compatibility_is_two_way(self):
+        him = self.make_user('him', models.SiteUser.MALE, females=True)
+        her = self.make_user('her', models.SiteUser.FEMALE, females=True)
+        them = self.make_user('them', models.SiteUser.OTHER)
+
+        # He wants her and they want anyone, but she only wants women
+        self.assertEqual(
+            set(models.SiteUser.objects.filter_by_compatible(her)),
+            {her},
+        )
+        self.assertEqual(
+            set(models.SiteUser.objects.filter_by_compatible(him)),
+            set(),
+        )
+
+    def test_different_activities_are_incompatible(self):
+        casual = self.make_user('casual', models.SiteUser.FEMALE, hookups=True)
+        serious = self.make_user('serious', models.SiteUser.FEMALE)
+
+        self.assertFalse(compatibility.compatible(
+            casual.match_profile, casual.match_preferences,
+            serious.match_profile, serious.match_preferences,
+        ))
+
+
+class TestBatchMatchmaking(TestCase):
+    def setUp(self):
+        matching.looking_users.clear()
+        matching.met_users.clear()
+
+    def test_pair_users_prefers_closest_pairs(self):
+        now = timezone.now()
+        users = [
+            (1, Point(-117.1701, 46.7316), now),
+            (2, Point(-117.1701, 46.7318), now),  # ~20m from 1
+            (3, Point(-117.1701, 46.7340), now),
+            (4, Point(-117.1701, 46.7342), now),  # ~20m from 3
+        ]
+
+        pairs = matching.pair_users(users, met=set(), meters=800)
+
+        self.assertCountEqual(pairs, [(1, 2), (3, 4)])
+
+    def test_candidate_set_nearest(self):
+        scorer = scoring.CandidateSet(
+            [1, 2, 3, 4],
+            [-117.1701] * 4,
+            [46.7316, 46.7318, 46.7340, 46.8316],  # The last is ~11km away
+        )
+
+        self.assertEqual(
+            [user_id for _, user_id in scorer.nearest(-117.1701, 46.7316, 5, 800)],
+            [1, 2, 3],
+        )
+        self.assertEqual(
+            [user_id for _, user_id in scorer.nearest(
+                -117.1701, 46.7316, 1, 800, exclude={1},
+            )],
+            [2],
+        )
+
+    def test_pair_users_skips_users_who_already_met(self):
+        now = timezone.now()
+        users = [
+            (1, Point(-117.1701, 46.7316), now),
+            (2, Point(-117.1701, 46.7318), now),
+        ]
+
+        self.assertEqual(matching.pair_users(users, met={(2, 1)}, meters=800), [])
+
+    def test_matchmaking_pass_moves_pairs_to_chatting(self):
+        for username, latitude in (('one', 46.7316), ('two', 46.7318)):
+            models.SiteUser.objects.create(
+                username=username,
+                email=f'{username}@example.com',
+                location=Point(-117.1701, latitude),
+                location_updated_at=timezone.now(),
+                status=models.SiteUser.Status.LOOKING,
+            )
+
+        self.assertEqual(matching.run_matchmaking_pass(), 1)
+
+        self.assertEqual(models.Rundezvous.objects.count(), 1)
+        self.assertFalse(
+            models.SiteUser.objects
+            .filter(status=models.SiteUser.Status.LOOKING)
+            .exists()
+        )
+
+
+class TestUserLocationBatchUpdateView(UserTestCase):
+    def post_samples(self, samples):
+        return self.client.post(
+            reverse('update-location-batch'),
+            json.dumps({'samples': samples}),
+            content_type='application/json',
+        )
+
+    def test_latest_sample_becomes_location(self):
+        now = timezone.now().timestamp()
+
+        response = self.post_samples([
+            [now - 1, 55.756496974, 37.623664172],
+            [now - 5, 46.7316913, -117.1701676],
+        ])
+
+        self.assertEqual(response.json()['samples'], 2)
+        self.assertEqual(self.user.latitude, 55.756496974)
+        self.assertEqual(self.user.longitude, 37.623664172)
+
+    def test_packed_samples(self):
+        now = timezone.now().timestamp()
+
+        response = self.client.post(
+            reverse('update-location-batch'),
+            struct.pack('<3d', now, 55.756496974, 37.623664172),
+            content_type='application/octet-stream',
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.user.latitude, 55.756496974)
+
+    def test_invalid_samples_are_rejected(self):
+        now = timezone.now().timestamp()
+
+        response = self.post_samples([[now, 95.0, 37.623664172]])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.user.latitude, 46.7316913)
+
+    def test_out_of_range_timestamps_are_rejected(self):
+        for timestamp in (-1e12, 0.0):
+            response = self.post_samples([[timestamp, 55.756496974, 37.623664172]])
+
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(self.user.latitude, 46.7316913)
+
+    def test_huge_numbers_are_rejected(self):
+        response = self.client.post(
+            reverse('update-location-batch'),
+            '{"samples": [[1%s, 55.756496974, 37.623664172]]}' % ('0' * 400),
+            content_type='application/json',
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_delayed_batch_does_not_overwrite_newer_location(self):
+        now = timezone.now().timestamp()
+
+        self.post_samples([[now - 1, 55.756496974, 37.623664172]])
+        response = self.post_samples([[now - 5, 46.7316913, -117.1701676]])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.user.latitude, 55.756496974)
+
+
+class TestArrivalGeofence(TestCase):
+    def setUp(self):
+        self.geofence = geofence.ArrivalGeofence(
+            Point(-117.1701676, 46.7316913, srid=4326),  # Honors Hall
+            srid=3857,
+            meters=800,
+        )
+
+    def test_nearby_point_is_inside(self):
+        self.assertTrue(
+            self.geofence.contains(Point(-117.1701676, 46.7326913, srid=4326))
+        )
+
+    def test_far_point_is_rejected_by_bbox(self):
+        far = Point(-117.1701676, 46.8316913, srid=4326)
+
+        self.assertFalse(self.geofence.could_contain(far))
+        self.assertFalse(self.geofence.contains(far))
+
+    def test_path_passing_by_is_inside(self):
+        path = LineString(
+            Point(-117.1801676, 46.7316913),
+            Point(-117.1601676, 46.7316913),
+            srid=4326,
+        )
+
+        self.assertTrue(self.geofence.contains(path))
+
+    def running_user(self):
+        rundezvous = models.Rundezvous.objects.create(
+            landmark=place_models.Landmark.objects.create(
+                name='Honors Hall',
+                location=Point(-117.1701676, 46.7316913),
+            ),
+        )
+        geofence.arrival_geofences.build(rundezvous)
+
+        return models.SiteUser.objects.create(
+            username='runner',
+            email='runner@example.com',
+            location=Point(-117.1901676, 46.7316913, srid=4326),
+            status=models.SiteUser.Status.RUNNING,
+            active_rundezvous=rundezvous,
+        )
+
+    def test_running_past_between_updates_arrives(self):
+        user = self.running_user()
+
+        user.update_location(Point(-117.1501676, 46.7316913, srid=4326))
+
+        self.assertEqual(user.status, models.SiteUser.Status.REVIEW)
+
+    def test_one_sample_trajectory(self):
+        user = self.running_user()
+
+        self.assertFalse(user.check_rundezvous_arrived(
+            user.active_rundezvous,
+            [Point(-117.1901676, 46.8316913, srid=4326)],
+        ))
+
+
+class TestCreateForUsers(TestCase):
+    @staticmethod
+    def looking_users(count, prefix):
+        return [
+            models.SiteUser.objects.create(
+                username=f'{prefix}{i}',
+                email=f'{prefix}{i}@example.com',
+                status=models.SiteUser.Status.LOOKING,
+            )
+            for i in range(count)
+        ]
+
+    def test_users_move_to_chatting(self):
+        users = self.looking_users(2, 'pair')
+
+        rundezvous = models.Rundezvous.create_for_users(users)
+
+        self.assertEqual(
+            set(rundezvous.users.values_list('status', flat=True)),
+            {models.SiteUser.Status.CHATTING},
+        )
+        self.assertEqual(users[0].active_rundezvous, rundezvous)
+
+    def test_queries_do_not_grow_with_group(self):
+        pair, group = self.looking_users(2, 'pair'), self.looking_users(6, 'group')
+
+        with CaptureQueriesContext(connection) as pair_queries:
+            models.Rundezvous.create_for_users(pair)
+
+        with self.assertNumQueries(len(pair_queries)):
+            models.Rundezvous.create_for_users(group)
+
+    def test_unavailable_user_creates_nothing(self):
+        users = self.looking_users(2, 'pair')
+        models.SiteUser.objects \
+            .filter(id=users[1].id) \
+            .update(status=models.SiteUser.Status.NONE)
+
+        with self.assertRaises(models.Rundezvous.UnavailableUserError):
+            models.Rundezvous.create_for_users(users)
+
+        self.assertFalse(models.Rundezvous.objects.exists())
+        self.assertEqual(
+            models.SiteUser.objects.get(id=users[0].id).status,
+            models.SiteUser.Status.LOOKING,
+        )
+
+
+class TestRundezvousDeadlines(TestCase):
+    def test_chat_deadlines_are_stored_on_creation(self):
+        rundezvous = models.Rundezvous.objects.create()
+
+        self.assertEqual(
+            rundezvous.meet_decision_ends_at - rundezvous.chat_ends_at,
+            const.MEET_DECISION_TIME_LIMIT,
+        )
+        self.assertIsNone(rundezvous.expires_at)
+
+    def test_expired_and_unexpired(self):
+        now = timezone.now()
+        minute = timezone.timedelta(minutes=1)
+
+        expired = models.Rundezvous.objects.create(expires_at=now - minute)
+        running = models.Rundezvous.objects.create(expires_at=now + minute)
+        models.Rundezvous.objects.create()  # Still chatting
+
+        self.assertEqual(list(models.Rundezvous.objects.expired(now)), [expired])
+        self.assertEqual(list(models.Rundezvous.objects.unexpired(now)), [running])
+
+    def test_end_expired_in_bulk(self):
+        past = timezone.now() - timezone.timedelta(minutes=1)
+        for _ in range(3):
+            models.Rundezvous.objects.create(expires_at=past)
+
+        with self.assertNumQueries(1):
+            ended = models.Rundezvous.objects.expired().end()
+
+        self.assertEqual(ended, 3)
+        self.assertFalse(models.Rundezvous.objects.expired().exists())
+
+
+class TestTimerWheel(TestCase):
+    def test_items_fire_on_their_tick(self):
+        wheel = scheduler.TimerWheel(1000, slots=4, levels=3)
+
+        # Spans every level, plus one overdue and one past the last level
+        due = {item: 1000 + item * 7 for item in range(20)}
+        due['overdue'] = 990
+        for item, tick in due.items():
+            wheel.schedule(tick, item)
+
+        fired = {}
+        for tick in range(1000, 1200, 5):
+            for fired_tick, items in wheel.advance(tick):
+                fired.update(dict.fromkeys(items, fired_tick))
+
+        due['overdue'] = 1000
+        self.assertEqual(fired, due)
+        self.assertEqual(wheel.count, 0)
+
+
+class TestLifecycleScheduler(TestCase):
+    def setUp(self):
+        self.users = [
+            models.SiteUser.objects.create(
+                username=f'runner{i}',
+                email=f'runner{i}@example.com',
+                status=models.SiteUser.Status.LOOKING,
+            )
+            for i in range(2)
+        ]
+        self.rundezvous = models.Rundezvous.create_for_users(self.users)
+
+    def statuses(self):
+        return set(
+            models.SiteUser.objects
+            .filter(id__in=[user.id for user in self.users])
+            .values_list('status', flat=True)
+        )
+
+    def test_undecided_users_go_back_to_none(self):
+        lifecycle = scheduler.LifecycleScheduler()
+        lifecycle.poll()
+
+        later = self.rundezvous.meet_decision_ends_at + timezone.timedelta(seconds=2)
+        self.assertEqual(lifecycle.run_pending(later), 1)
+
+        self.assertEqual(self.statuses(), {models.SiteUser.Status.NONE})
+        self.assertIsNotNone(models.Rundezvous.objects.get().ended_at)
+        self.assertFalse(
+            models.SiteUser.objects
+            .filter(active_rundezvous__isnull=False)
+            .exists()
+        )
+
+    def test_expired_runners_go_to_review(self):
+        now = timezone.now()
+        models.Rundezvous.objects \
+            .filter(id=self.rundezvous.id) \
+            .update(expires_at=now)
+        models.SiteUser.objects.update(status=models.SiteUser.Status.RUNNING)
+
+        scheduler.expire([self.rundezvous.id], now)
+
+        self.assertEqual(self.statuses(), {models.SiteUser.Status.REVIEW})
+        self.assertFalse(models.Rundezvous.objects.expired(now).exists())
+
+
+class TestActiveRundezvous(UserTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.partner = models.SiteUser.objects.create(
+            username='cellmate',
+            email='cellmate@private.prison',
+            status=models.SiteUser.Status.LOOKING,
+        )
+        models.SiteUser.objects \
+            .filter(id=self.user_instance.id) \
+            .update(status=models.SiteUser.Status.LOOKING)
+
+        models.Rundezvous.create_for_users([self.user, self.partner])
+
+    def test_create_for_users_sets_active_rundezvous(self):
+        rundezvous = self.user.active_rundezvous
+
+        self.assertIsNotNone(rundezvous)
+        self.assertEqual(rundezvous.users.count(), 2)
+
+    def test_only_one_active_rundezvous_per_user(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            models.UserToRundezvous.objects.create(
+                user=self.user_instance,
+                rundezvous=models.Rundezvous.objects.create(),
+            )
+
+    def test_leave_active_rundezvous(self):
+        user = self.user
+        rundezvous = user.active_rundezvous
+
+        user.leave_active_rundezvous()
+
+        self.assertIsNone(self.user.active_rundezvous)
+        self.assertFalse(
+            rundezvous.usertorundezvous_set.get(user=user).is_active
+        )
+
+
+class ChatTestCase(UserTestCase):
+    """A user chatting in a room with one partner"""
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+
+        cls.partner = models.SiteUser.objects.create(
+            username='cellmate',
+            email='cellmate@private.prison',
+        )
+
+        cls.room = models.Rundezvous.objects.create()
+        for user in (cls.user_instance, cls.partner):
+            models.UserToRundezvous.objects.create(user=user, rundezvous=cls.room)
+
+            user.status = models.SiteUser.Status.CHATTING
+            user.active_rundezvous = cls.room
+            user.save(update_fields=['status', 'active_rundezvous'])
+
+    def send(self, text, sent_by=None):
+        return models.ChatMessage.objects.create(
+            room=self.room,
+            sent_by=sent_by or self.partner,
+            text=text,
+        )
+
+
+class TestNewMessagesView(ChatTestCase):
+    def test_existing_messages_are_returned_without_waiting(self):
+        message = self.send("Psst")
+
+        started = time.monotonic()
+        response = self.client.get(
+            reverse('new-messages', args=[0]),
+            {'wait': 10},
+        )
+
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(response.json()['message_ids'], [message.id])
+
+    def test_batch_is_one_query(self):
+        url = reverse('new-messages', args=[0])
+
+        sent = [self.send("First")]
+        with CaptureQueriesContext(connection) as one_message:
+            self.client.get(url)
+
+        sent += [self.send(f"Message {i}") for i in range(19)]
+        with self.assertNumQueries(len(one_message)):
+            response = self.client.get(url)
+
+        records = response.json()['messages']
+        self.assertEqual([record['id'] for record in records], [m.id for m in sent])
+        self.assertEqual(records[0]['sent_by'], self.partner.username)
+        self.assertFalse(records[0]['mine'])
+
+    def test_html_format_renders_every_message(self):
+        first, second = self.send("One"), self.send("Two")
+
+        response = self.client.get(
+            reverse('new-messages', args=[first.id - 1]),
+            {'format': 'html'},
+        )
+
+        self.assertContains(response, f'id="message{first.id}"')
+        self.assertContains(response, f'id="message{second.id}"')
+
+    def test_wait_times_out_without_messages(self):
+        response = self.client.get(
+            reverse('new-messages', args=[0]),
+            {'wait': 0.1},
+        )
+
+        self.assertEqual(response.json()['message_ids'], [])
+
+    def test_publish_wakes_listener(self):
+        chat_broker = broker.InProcessBroker()
+        room_events = events.RoomEvents(chat_broker)
+
+        with room_events.listen(self.room.id) as listener:
+            threading.Timer(
+                0.1,
+                chat_broker.publish,
+                [broker.room_channel(self.room.id), {'id': 1}],
+            ).start()
+
+            self.assertTrue(listener.wait(5))
+            self.assertFalse(listener.wait(0.01))
+
+
+class TestInstrumentation(testing.QueryBudgetMixin, ChatTestCase):
+    def test_instrument_counts_queries(self):
+        with instrumentation.instrument() as outer:
+            list(models.SiteUser.objects.all())
+
+            with instrumentation.instrument() as inner:
+                list(models.Rundezvous.objects.all())
+
+        self.assertEqual(outer.queries, 2)
+        self.assertEqual(inner.queries, 1)
+        self.assertGreaterEqual(outer.total_ms, outer.sql_ms)
+
+    @override_settings(DEBUG=True)
+    def test_server_timing_header_in_debug(self):
+        response = self.client.get(reverse('rundezvous-router'))
+
+        self.assertIn('sql;dur=', response['Server-Timing'])
+
+    def test_server_timing_header_hidden_otherwise(self):
+        response = self.client.get(reverse('rundezvous-router'))
+
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_budget_failure_lists_queries(self):
+        with self.assertRaisesRegex(AssertionError, 'made 2 queries'):
+            with self.assertQueryBudget('new-messages', budget=1):
+                list(models.SiteUser.objects.all())
+                list(models.SiteUser.objects.all())
+
+    def test_new_messages_within_budget(self):
+        for i in range(10):
+            self.send(f"Message {i}")
+
+        self.request_within_budget(
+            'get',
+            'new-messages',
+            url_kwargs={'last_message_id': 0},
+        )
+
+    def test_update_location_within_budget(self):
+        location = {'lat': 46.7316913, 'long': -117.1701676}
+        self.client.post(reverse('update-location'), location)  # Warm caches
+
+        location['lat'] += 0.001
+        self.request_within_budget('post', 'update-location', location)
+
+    def test_update_location_batch_within_budget(self):
+        def samples(now):
+            return json.dumps({'samples': [
+                [now - 2, 46.7316913, -117.1701676],
+                [now - 1, 46.7326913, -117.1701676],
+            ]})
+
+        now = timezone.now().timestamp()
+        self.client.post(  # Warm caches
+            reverse('update-location-batch'),
+            samples(now - 10),
+            content_type='application/json',
+        )
+
+        response = self.request_within_budget(
+            'post',
+            'update-location-batch',
+            samples(now),
+            content_type='application/json',
+        )
+        self.assertEqual(response.json()['samples'], 2)
+
+    def test_router_within_budget(self):
+        self.request_within_budget('get', 'rundezvous-router')
+
+
+class TestProfiling(UserTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.profiles = tempfile.TemporaryDirectory()
+        self.addCleanup(self.profiles.cleanup)
+
+        settings = override_settings(PROFILING_DIR=self.profiles.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def written(self):
+        return os.listdir(self.profiles.name)
+
+    def test_sampler_sees_running_function(self):
+        def spin():
+            deadline = time.monotonic() + 0.1
+            while time.monotonic() < deadline:
+                pass
+
+        with profiling.StackSampler(interval=0.001) as sampler:
+            spin()
+
+        self.assertTrue(any(stack.endswith('.spin') for stack in sampler.stacks))
+
+    def test_staff_can_ask_for_a_profile(self):
+        models.SiteUser.objects \
+            .filter(id=self.user_instance.id) \
+            .update(is_staff=True)
+
+        self.client.get(reverse('rundezvous-router'), HTTP_X_PROFILE='1')
+
+        [name] = self.written()
+        self.assertTrue(name.startswith(f'rundezvous-router.{self.user_instance.id}.'))
+
+    def test_others_cant(self):
+        self.client.get(reverse('rundezvous-router'), HTTP_X_PROFILE='1')
+
+        self.assertEqual(self.written(), [])
+
+    def test_merge_profiles(self):
+        for i, stacks in enumerate([{'a;b': 2, 'a': 1}, {'a;b': 3}]):
+            name = f'waiting-room.{i}.0{profiling.EXTENSION}'
+            with open(os.path.join(self.profiles.name, name), 'w') as f:
+                profiling.write_collapsed(stacks, f)
+
+        out = StringIO()
+        call_command('merge_profiles', stdout=out, stderr=StringIO())
+
+        self.assertEqual(out.getvalue(), 'a 1\na;b 5\n')
+
+    def test_merge_profiles_skips_other_files(self):
+        stray = os.path.join(self.profiles.name, f'README{profiling.EXTENSION}')
+        with open(stray, 'w') as f:
+            f.write('not a profile\n')
+
+        out, err = StringIO(), StringIO()
+        call_command('merge_profiles', stdout=out, stderr=err)
+
+        self.assertEqual(out.getvalue(), '')
+        self.assertIn(f"Skipping {stray}", err.getvalue())
+
+
+class TestStateView(testing.QueryBudgetMixin, ChatTestCase):
+    def test_state_while_chatting(self):
+        first, second = self.send("One"), self.send("Two")
+
+        response = self.client.get(reverse('state'), {'last_message_id': first.id})
+        state = response.json()
+
+        self.assertEqual(state['status'], models.SiteUser.Status.CHATTING)
+        self.assertEqual(state['screen'], reverse('chatroom'))
+        self.assertEqual(state['rundezvous']['id'], self.room.id)
+        self.assertEqual(
+            [partner['username'] for partner in state['rundezvous']['partners']],
+            [self.partner.username],
+        )
+        self.assertEqual(state['rundezvous']['message_ids'], [second.id])
+        self.assertIsNotNone(state['rundezvous']['chat_ends_at'])
+        self.assertIsNone(state['rundezvous']['landmark'])
+
+    def test_state_without_rundezvous(self):
+        models.SiteUser.objects \
+            .filter(id=self.user_instance.id) \
+            .update(status=models.SiteUser.Status.NONE, active_rundezvous=None)
+
+        state = self.client.get(reverse('state')).json()
+
+        self.assertEqual(state['screen'], reverse('rundezvous-router'))
+        self.assertIsNone(state['rundezvous'])
+
+    def test_state_while_running_within_budget(self):
+        self.room.landmark = place_models.Landmark.objects.create(
+            name='Fountain',
+            location=Point(-117.17, 46.73),
+        )
+        self.room.expires_at = timezone.now()
+        self.room.save()
+
+        for i in range(10):
+            self.send(f"Message {i}")
+
+        response = self.request_within_budget('get', 'state')
+
+        landmark = response.json()['rundezvous']['landmark']
+        self.assertEqual(landmark['name'], 'Fountain')
+        self.assertEqual(landmark['longitude'], -117.17)
+
+    def test_bad_last_message_id(self):
+        response = self.client.get(reverse('state'), {'last_message_id': 'x'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class TestBroker(TestCase):
+    def test_publish_reaches_channel_subscribers(self):
+        chat_broker = broker.InProcessBroker()
+
+        with chat_broker.subscribe('room:1') as subscription, \
+                chat_broker.subscribe('room:2') as other:
+            chat_broker.publish('room:1', {'id': 1})
+
+            self.assertEqual(subscription.get(timeout=1), {'id': 1})
+            self.assertIsNone(other.get(timeout=0.01))
+
+    def test_slow_subscriber_is_closed(self):
+        chat_broker = broker.InProcessBroker()
+        subscription = chat_broker.subscribe('room:1')
+
+        for i in range(subscription._queue.maxsize + 1):
+            chat_broker.publish('room:1', {'id': i})
+
+        with self.assertRaises(broker.SubscriptionClosed):
+            subscription.get(timeout=1)
+
+    def test_relay_writes_whole_frames(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'broker.sock')
+            threading.Thread(target=broker.serve, args=[path], daemon=True).start()
+
+            def connect():
+                for _ in range(50):
+                    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    try:
+                        connection.connect(path)
+                        return connection
+                    except OSError:
+                        connection.close()
+                        time.sleep(0.01)  # Not listening yet
+
+            reader = connect()
+            writers = [connect() for _ in range(4)]
+            time.sleep(0.1)  # Let the relay register every connection
+
+            frame = json.dumps({'channel': 'room:1', 'message': 'x' * 10000})
+            sending = [
+                threading.Thread(
+                    target=writer.sendall,
+                    args=[(frame + '\n').encode() * 20],
+                )
+                for writer in writers
+            ]
+            for thread in sending:
+                thread.start()
+
+            lines = reader.makefile('rb')
+            for _ in range(80):
+                self.assertEqual(json.loads(lines.readline())['channel'], 'room:1')
+
+            for connection in [reader, *writers]:
+                connection.close()
+
+
+class TestChatStream(ChatTestCase):
+    def test_stream_catches_up_then_follows_room(self):
+        missed = self.send("Before")
+        stream = streaming.stream_room(self.room.id, last_message_id=0)
+
+        self.assertTrue(next(stream).startswith(f"id: {missed.id}\n"))
+
+        published = streaming.render_message(self.send("After"))
+        broker.get_broker().publish(broker.room_channel(self.room.id), published)
+
+        self.assertEqual(next(stream), streaming.format_event(published))
+        stream.close()
+
+    def test_event_carries_rendered_message(self):
+        message = self.send("Hello")
+        event = streaming.format_event(streaming.render_message(message))
+
+        data = json.loads(event.split('data: ', 1)[1])
+        self.assertEqual(data['sent_by'], self.partner.id)
+        self.assertIn(f'id="message{message.id}"', data['html'])
@@ -0,0 +1,91 @@
+"""
+Parsing for batched location uploads
+A trajectory is a list of (timestamp, lat, long) samples, timestamps are Unix
+seconds as reported by the phone
+"""
+
+import json
+import math
+import struct
+
+from django.utils import timezone
+
+from rundezvous import const
+
+PACKED_CONTENT_TYPE = 'application/octet-stream'
+
+# Little-endian float64 (timestamp, lat, long)
+_SAMPLE = struct.Struct('<3d')
+
+
+def _unpack(body: bytes):
+    if len(body) % _SAMPLE.size:
+        raise ValueError("Packed samples must be 3 float64s each")
+
+    return list(_SAMPLE.iter_unpack(body))
+
+
+def _load_json(body: bytes):
+    try:
+        samples = json.loads(body)['samples']
+        return [tuple(float(value) for value in sample) for sample in samples]
+    except (ValueError, KeyError, TypeError, OverflowError):
+        raise ValueError("Expected {\"samples\": [[timestamp, lat, long], ...]}")
+
+
+def parse_samples(body: bytes, content_type: str, last_updated_at=None):
+    """
+    Returns validated (time, lat, long) samples sorted oldest first, with the
+    timestamps converted to datetimes
+    Samples from before last_updated_at (the user's latest known location)
+    are dropped, so a delayed batch can't overwrite a newer position
+    Raises ValueError describing the first problem found
+    """
+    if content_type == PACKED_CONTENT_TYPE:
+        samples = _unpack(body)
+    else:
+        samples = _load_json(body)
+
+    if not samples:
+        raise ValueError("No samples")
+    if len(samples) > const.MAX_TRAJECTORY_SAMPLES:
+        raise ValueError(f"At most {const.MAX_TRAJECTORY_SAMPLES} samples")
+
+    now = timezone.now()
+    # Checked as numbers, so fromtimestamp never sees an absurd timestamp
+    earliest_allowed = (now - const.USER_ACTIVE_TIME).timestamp()
+    latest_allowed = (now + const.MAX_CLOCK_SKEW).timestamp()
+
+    for sample in samples:
+        if len(sample) != 3 or not all(map(math.isfinite, sample)):
+            raise ValueError("Samples must be three finite numbers")
+
+        timestamp, lat, long = sample
+
+        if not -90 <= lat <= 90 or not -180 <= long <= 180:
+            raise ValueError("Sample is not a valid location")
+        if timestamp > latest_allowed:
+            raise ValueError("Sample is from the future")
+        if timestamp < earliest_allowed:
+            raise ValueError("Sample is too old")
+
+    samples = [
+        (sample_time(timestamp, now), lat, long)
+        for timestamp, lat, long in sorted(samples)
+    ]
+
+    if last_updated_at is not None:
+        samples = [sample for sample in samples if sample[0] > last_updated_at]
+
+        if not samples:
+            raise ValueError("Samples are older than the last location update")
+
+    return samples
+
+
+def sample_time(timestamp: float, now=None) -> timezone.datetime:
+    """Converts a sample timestamp, never returning a time in the future"""
+    return min(
+        timezone.datetime.fromtimestamp(timestamp, tz=timezone.utc),
+        now or timezone.now(),
+    )
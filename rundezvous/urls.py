@@ -5,10 +5,12 @@ from rundezvous import views
 
 urlpatterns = [
     path('update_location', views.update_location, name='update-location'),
+    path('update_location/batch', views.update_location_batch, name='update-location-batch'),
     path('location_required', views.location_required, name='location-required'),
 
     path('start', views.start, name='start-rundezvous'),
     path('router/', views.router, name='rundezvous-router'),
+    path('state', views.state, name='state'),
 
     path('waiting_room/', views.waiting_room, name='waiting-room'),
     path('active_rundezvous/', views.active_rundezvous, name='active-rundezvous'),
@@ -17,6 +19,7 @@ urlpatterns = [
     # CHAT STUFF
     path('chatroom', views.chatroom, name='chatroom'),
     path('chatroom/new_messages/<int:last_message_id>', views.new_messages, name='new-messages'),
+    path('chatroom/stream', views.chat_stream, name='chat-stream'),
 
     path('message', views.message, name='send_message'),
     path('message/<int:message_id>', views.message, name='get-message'),
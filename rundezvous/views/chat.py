@@ -1,15 +1,20 @@
 from django.http import (
     JsonResponse,
+    StreamingHttpResponse,
     HttpResponseNotFound,
     HttpResponseBadRequest,
 )
 
+from django.db import transaction
 from django.shortcuts import render
 
 from django.contrib.auth.decorators import login_required
 
 from rundezvous import const
+from rundezvous import broker
+from rundezvous import events
 from rundezvous import models
+from rundezvous import streaming
 
 
 @login_required
@@ -35,43 +40,99 @@ def chatroom(request):
 
 
 @login_required
-def chatroom(request):
+def new_messages(request, last_message_id):
     """
-    Renders ChatRoom for the current user
-    TODO: Render title in correct location
+    Gets every message since the last one the user has, in one query
+    ?format=html answers with the rendered messages, ready to append, and
+    ?format=json (the default) with one record per message
+    With ?wait=<seconds> the request is held until a message arrives in the
+    room or the time is up (long polling), instead of answering right away
     """
-    user = request.user
-
-    room = user.active_room
+    room = request.user.active_rundezvous
 
     if room is None:
         return HttpResponseNotFound("You are not in any chatroom")
 
-    return render(
-        request,
-        'rundezvous/chatroom/chatroom.html',
-        {
-            'user': user,
-            'room': room,
-            'max_message_len': const.MAX_CHAT_MESSAGE_LENGTH,
-        },
-    )
+    try:
+        wait = float(request.GET.get('wait', 0))
+    except ValueError:
+        return HttpResponseBadRequest("wait must be a number of seconds")
+
+    wait = max(0.0, min(wait, const.MAX_LONG_POLL_WAIT))
+
+    response_format = request.GET.get('format', 'json')
+    if response_format not in ('html', 'json'):
+        return HttpResponseBadRequest("format must be html or json")
+
+    messages = room.messages \
+        .filter(id__gt=last_message_id) \
+        .select_related('sent_by')
+
+    with events.room_events.listen(room.id) as listener:
+        new = list(messages)
+
+        if not new and wait and listener.wait(wait):
+            new = list(messages.all())  # A fresh queryset, not the cache
+
+    if response_format == 'html':
+        return render(
+            request,
+            'rundezvous/chatroom/messages.html',
+            {
+                'messages': new,
+                'user': request.user,
+            },
+        )
+
+    return JsonResponse({
+        'message_ids': [message.id for message in new],
+        'messages': [
+            {
+                'id': message.id,
+                'text': message.text,
+                'sent_by': message.sent_by.username,
+                'sent_at': message.sent_at,
+                'mine': message.sent_by_id == request.user.id,
+            }
+            for message in new
+        ],
+    })
 
 
 @login_required
-def new_messages(request, last_message_id):
+def chat_stream(request):
     """
-    Bad polling function to get messages since the last one the user has
-    It's also very easily abusable
-    TODO: This MUST be replaced with RabbitMQ or Django Channels
+    Server-sent events stream of the messages sent to the user's room
+    This holds a worker thread for as long as it's open, so deployments with
+    many chatting users should serve it from rundezvous_rundux.asgi instead
     """
     room = request.user.active_rundezvous
 
-    messages = room.messages.filter(id__gt=last_message_id)
+    if room is None:
+        return HttpResponseNotFound("You are not in any chatroom")
+
+    try:
+        last_message_id = int(
+            request.META.get('HTTP_LAST_EVENT_ID') or
+            request.GET.get('last_message_id', 0)
+        )
+    except ValueError:
+        return HttpResponseBadRequest("last_message_id must be a message id")
 
-    return JsonResponse({
-        'message_ids': list(messages.values_list('id', flat=True))
-    })
+    response = StreamingHttpResponse(
+        streaming.stream_room(room.id, last_message_id),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+def _announce(message):
+    """Wakes long polls (see rundezvous.events) and streams in the room"""
+    broker.get_broker().publish(
+        broker.room_channel(message.room_id),
+        streaming.render_message(message),
+    )
 
 
 @login_required
@@ -101,6 +162,8 @@ def message(request, message_id=None):
             sent_by=user,
             room=room,
         )
+
+        transaction.on_commit(lambda: _announce(message))
     else:
         return HttpResponseBadRequest
 
@@ -1,4 +1,9 @@
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import (
+    JsonResponse,
+    HttpResponseNotAllowed,
+    HttpResponseBadRequest,
+)
 
 from django.shortcuts import render, redirect, reverse
 
@@ -11,8 +16,10 @@ from django.contrib.gis.geos import Point
 
 from rundezvous import models
 from rundezvous import forms
+from rundezvous import trajectory
 
 from places import const as place_const
+from places import models as place_models
 
 
 def home(request):
@@ -72,11 +79,60 @@ def update_location(request):
     })
 
 
+@csrf_exempt
+def update_location_batch(request):
+    """
+    Batched update_location, so phones can upload every few seconds
+    Body is JSON {"samples": [[timestamp, lat, long], ...]} or the same
+    samples packed as little-endian float64s (application/octet-stream)
+    """
+    if request.user.is_anonymous:
+        return JsonResponse({})
+
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    try:
+        samples = trajectory.parse_samples(
+            request.body,
+            request.content_type,
+            last_updated_at=request.user.location_updated_at,
+        )
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    # Longitude is x, Latitude is y
+    path = [
+        Point(long, lat, srid=place_const.DEFAULT_SRID)
+        for _, lat, long in samples
+    ]
+
+    request.user.update_location(
+        path[-1],
+        trajectory=path,
+        updated_at=samples[-1][0],
+    )
+
+    return JsonResponse({
+        'samples': len(samples),
+        'success': True,
+    })
+
+
 @login_required
 def location_required(request):
     return render(request, 'rundezvous/location_required.html')
 
 
+# The screen for each status, router redirects there
+STATUS_URL_NAMES = {
+    models.SiteUser.Status.LOOKING: 'waiting-room',
+    models.SiteUser.Status.CHATTING: 'chatroom',
+    models.SiteUser.Status.RUNNING: 'active-rundezvous',
+    models.SiteUser.Status.REVIEW: 'review',
+}
+
+
 @login_required
 def router(request):
     """Routes user to appropriate destination based on their status"""
@@ -85,25 +141,81 @@ def router(request):
     if user.status == models.SiteUser.Status.NONE:
         return render(request, 'rundezvous/start_rundezvous.html', {})
 
-    if user.status == models.SiteUser.Status.LOOKING:
-        return redirect('waiting-room')
-    elif user.status == models.SiteUser.Status.CHATTING:
-        return redirect('chatroom')
-    elif user.status == models.SiteUser.Status.RUNNING:
-        return redirect('active-rundezvous')
-    elif user.status == models.SiteUser.Status.REVIEW:
-        return redirect('review')
-    else:
+    try:
+        return redirect(STATUS_URL_NAMES[user.status])
+    except KeyError:
         raise NotImplementedError
 
 
+@login_required
+def state(request):
+    """
+    Everything a client needs to drive the Rundezvous lifecycle, in one poll
+    instead of following router's redirects and polling for messages
+    message_ids are the ones after ?last_message_id=, the client's latest
+    Costs the same few queries whatever the state, the user and their
+    active Rundezvous come in one (see SiteUserBackend)
+    """
+    user = request.user
+
+    try:
+        last_message_id = int(request.GET.get('last_message_id', 0))
+    except ValueError:
+        return HttpResponseBadRequest("last_message_id must be a message id")
+
+    status = user.status
+    screen = STATUS_URL_NAMES.get(status, 'rundezvous-router')
+
+    data = {
+        'status': status,
+        'status_display': user.get_status_display(),
+        'screen': reverse(screen),
+        'rundezvous': None,
+    }
+
+    rundezvous = user.active_rundezvous
+
+    if rundezvous is not None:
+        landmark = None
+        if rundezvous.landmark_id is not None:
+            landmark = place_models.Landmark.objects \
+                .values('id', 'name', 'location') \
+                .get(id=rundezvous.landmark_id)
+
+            location = landmark.pop('location')
+            landmark.update(latitude=location.y, longitude=location.x)
+
+        data['rundezvous'] = {
+            'id': rundezvous.id,
+            'partners': list(
+                rundezvous.users
+                .exclude(id=user.id)
+                .values('id', 'username', 'display_name')
+            ),
+            'landmark': landmark,
+            'chat_ends_at': rundezvous.chat_ends_at,
+            'meet_decision_ends_at': rundezvous.meet_decision_ends_at,
+            'expires_at': rundezvous.expires_at,
+            'message_ids': list(
+                rundezvous.messages
+                .filter(id__gt=last_message_id)
+                .values_list('id', flat=True)
+            ),
+        }
+
+    return JsonResponse(data)
+
+
 @login_required
 def start(request):
     """Starts a Rundezvous for this user"""
     user = request.user
 
+    if user.active_rundezvous_id is not None:
+        user.leave_active_rundezvous()  # Starting over, the old one is done
+
     user.status = models.SiteUser.Status.LOOKING
-    user.save()
+    user.save(update_fields=['status'])
     return redirect('rundezvous-router')
 
 
@@ -112,15 +224,28 @@ def waiting_room(request):
     """Waiting room for the user while the next Rundezvous is found"""
     user = request.user
 
+    # The matchmaker, or another user's request, moves matched users out of
+    # LOOKING
+    if user.status != models.SiteUser.Status.LOOKING:
+        return redirect('rundezvous-router')
+
+    if settings.BATCH_MATCHMAKING:
+        return render(request, 'rundezvous/waiting_room.html')
+
     # There are two cases: a match can be found instantly, or it can't
 
     try:
         partner = user.find_rundezvous_partner()
     except models.SiteUser.DoesNotExist:
         return render(request, 'rundezvous/waiting_room.html')
-    else:
+
+    try:
         models.Rundezvous.create_for_users([user, partner])
-        return redirect('active-rundezvous')
+    except models.Rundezvous.UnavailableUserError:
+        # Somebody else got to partner first, try again next refresh
+        return render(request, 'rundezvous/waiting_room.html')
+
+    return redirect('active-rundezvous')
 
 
 @login_required
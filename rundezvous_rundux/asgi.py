@@ -0,0 +1,30 @@
+"""
+ASGI config for rundezvous_rundux project.
+
+Serves the chat streams itself, so each open stream costs a coroutine rather
+than a worker thread, and hands every other request to Django.
+
+Run it with any ASGI server, e.g. `uvicorn rundezvous_rundux.asgi:application`
+"""
+
+import os
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rundezvous_rundux.settings')
+
+django.setup(set_prefix=False)
+
+from rundezvous import background  # noqa: E402
+from rundezvous.streaming import ChatStreamApplication  # noqa: E402
+
+try:
+    from django.core.asgi import get_asgi_application
+except ImportError:  # Django < 3.0 can only serve the streams over ASGI
+    django_application = None
+else:
+    django_application = get_asgi_application()
+
+application = ChatStreamApplication(django_application)
+
+background.start_threads()
@@ -51,11 +51,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'rundezvous.instrumentation.InstrumentationMiddleware',  # Keep first
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'rundezvous.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -148,6 +150,41 @@ FIXTURE_DIRS = [
 ]
 
 AUTH_USER_MODEL = 'rundezvous.SiteUser'
+AUTHENTICATION_BACKENDS = [
+    'rundezvous.backends.SiteUserBackend',
+    # Sessions started before SiteUserBackend are tied to this one, keep it
+    # so they stay logged in
+    'django.contrib.auth.backends.ModelBackend',
+]
 
 LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'home'
+
+# Rundezvous
+
+# When True, waiting_room only reads the assignment made by the batch
+# matchmaker (manage.py matchmake) instead of matching on every refresh
+BATCH_MATCHMAKING = False
+# Runs the batch matchmaker inside the web process (single-process only)
+MATCHMAKING_THREAD = False
+# Fires Rundezvous deadlines inside the web process instead of running
+# manage.py schedule (single-process only)
+SCHEDULER_THREAD = False
+
+# Buffered location updates are written every LOCATION_FLUSH_INTERVAL ms or
+# once LOCATION_FLUSH_SIZE users are waiting, whichever comes first
+LOCATION_FLUSH_INTERVAL = 0 if TESTING else 500
+LOCATION_FLUSH_SIZE = 500
+
+# Delivers chat messages to open streams. With more than one worker process
+# use 'rundezvous.broker.SocketBroker' and run `manage.py run_broker`
+CHAT_BROKER = 'rundezvous.broker.InProcessBroker'
+CHAT_BROKER_SOCKET = os.path.join(BASE_DIR, 'chat_broker.sock')
+
+# Requests are profiled by a stack sampler when a staff user sends
+# `X-Profile: 1` (or ?profile=1), and this fraction of all other requests
+# Samples are taken every PROFILING_INTERVAL ms and written to PROFILING_DIR,
+# merge them with `manage.py merge_profiles`
+PROFILING_SAMPLE_RATE = 0
+PROFILING_INTERVAL = 5
+PROFILING_DIR = os.path.join(BASE_DIR, 'profiles')
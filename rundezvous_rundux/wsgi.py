@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rundezvous_rundux.settings')
 
 application = get_wsgi_application()
+
+from rundezvous import background  # noqa: E402 (needs the app registry)
+
+background.start_threads()